@@ -1,16 +1,36 @@
+import argparse
 import sys
 import os
 import json
 import requests
+import dns.exception
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
 import dns.resolver
+from concurrent.futures import ThreadPoolExecutor
 from colorama import Fore, Style, init
 from datetime import datetime, timedelta
 import re
 
+# Shared helpers live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dns_cache import DEFAULT_CACHE_FILE, install_cache
+from label_tree import LabelTree, is_own_nxdomain
+from tcp_pool import TCPPool
+from udp_engine import UDPEngine
+
 # Initialize Colorama
 init(autoreset=True)
 
 CACHE_EXPIRY_DAYS = 1  # Cache expiry duration in days
+RECORD_TYPES = ['A', 'CNAME', 'MX', 'TXT']
+LOOKUP_WORKERS = 16  # Record type and chain target lookups in flight at once
+UNCLAIMED = 'No address records'  # Status of a chain target that exists but points nowhere
+
+# Threads are only started as lookups are submitted
+lookup_executor = ThreadPoolExecutor(max_workers=LOOKUP_WORKERS)
 
 def get_cache_filename(domain):
     """Generate a unique cache filename based on the domain."""
@@ -88,27 +108,177 @@ def get_subdomains(domain):
         print(f"{Fore.RED}Error parsing JSON response: {e}{Style.RESET_ALL}")
         return []
 
-def check_dangling_dns(subdomain):
-    record_types = ['A', 'CNAME', 'MX', 'TXT']
+def rrset_targets(rrset):
+    """The names a CNAME or MX record set points at; other record types point nowhere."""
+    if rrset is None or rrset.rdtype not in (dns.rdatatype.CNAME, dns.rdatatype.MX):
+        return []
+    names = (rdata.target if rrset.rdtype == dns.rdatatype.CNAME else rdata.exchange for rdata in rrset)
+    # A null MX (".") says the name takes no mail, so there is nothing to follow
+    return [name.to_text(omit_final_dot=True).lower() for name in names if name != dns.name.root]
+
+def lookup(subdomain, record_type):
+    """Resolve one record type; return (status or None if records were found, CNAME/MX targets)."""
+    try:
+        answers = dns.resolver.resolve(subdomain, record_type)
+        if not answers:
+            return 'No records found', []
+        return None, rrset_targets(answers.rrset)
+    except dns.resolver.NoAnswer:
+        return 'No answer', []
+    except dns.resolver.NXDOMAIN:
+        return 'NXDOMAIN', []
+    except Exception as e:
+        return str(e), []
+
+def target_status(target):
+    """Whether a CNAME or MX target resolves: None if it has addresses, else NXDOMAIN, UNCLAIMED or the error."""
+    for record_type in ('A', 'AAAA'):
+        status, _ = lookup(target, record_type)
+        if status != 'No answer':
+            return status
+    return UNCLAIMED
+
+def target_status_bulk(targets, engine, nameserver):
+    """target_status for many targets through the UDP engine; returns {target: status}."""
+    statuses = {}
+    pending = list(targets)
+    for record_type in ('A', 'AAAA'):
+        if not pending:
+            break
+        outcomes = engine.run((nameserver, target, record_type) for target in pending)
+        statuses.update(((target, lookup_status(outcome)) for (_, target, _), outcome in outcomes))
+        # Only names without IPv4 addresses are asked for IPv6 ones
+        pending = [target for target in pending if statuses[target] == 'No answer']
+    statuses.update(dict.fromkeys(pending, UNCLAIMED))
+    return statuses
+
+class ChainTargets:
+    """Statuses of the names CNAME and MX records point at, each resolved once however many subdomains use it.
+
+    Hundreds of subdomains often point at the same CDN or SaaS host; its
+    status is memoized, and a target that does not resolve is reported
+    against every subdomain that depends on it.
+    """
+
+    def __init__(self):
+        self.statuses = {}    # target -> status, None if it resolves
+        self.dependents = {}  # dangling target -> subdomains that point at it
+
+    def resolve(self, targets, engine=None, nameserver=None):
+        """Resolve, all at once, the targets not seen before."""
+        new = [target for target in dict.fromkeys(targets) if target not in self.statuses]
+        if engine is None:
+            self.statuses.update(zip(new, lookup_executor.map(target_status, new)))
+        elif new:
+            self.statuses.update(target_status_bulk(new, engine, nameserver))
+
+    def follow(self, subdomain, followed, engine=None, nameserver=None):
+        """Check the (record type, target) pairs of one subdomain; return its dangling records among them."""
+        self.resolve([target for _, target in followed], engine, nameserver)
+        dangling_records = {}
+        for record_type, target in followed:
+            status = self.statuses[target]
+            if status is not None:
+                dangling_records[f"{record_type} -> {target}"] = status
+                self.dependents.setdefault(target, []).append(subdomain)
+        return dangling_records
+
+def check_dangling_dns(subdomain, targets=None):
+    """Look up every record type of subdomain at once; with a ChainTargets, also follow its CNAME and MX targets."""
+    lookups = [lookup_executor.submit(lookup, subdomain, record_type) for record_type in RECORD_TYPES]
     dangling_records = {}
-    
-    for record_type in record_types:
-        try:
-            answers = dns.resolver.resolve(subdomain, record_type)
-            if not answers:
-                dangling_records[record_type] = 'No records found'
-        except dns.resolver.NoAnswer:
-            dangling_records[record_type] = 'No answer'
-        except dns.resolver.NXDOMAIN:
-            dangling_records[record_type] = 'NXDOMAIN'
-        except Exception as e:
-            dangling_records[record_type] = str(e)
-    
+    followed = []
+    for record_type, future in zip(RECORD_TYPES, lookups):
+        status, names = future.result()
+        if status is not None:
+            dangling_records[record_type] = status
+        followed += [(record_type, name) for name in names]
+
+    if targets is not None and followed:
+        dangling_records.update(targets.follow(subdomain, followed))
     if not dangling_records:
         return None
     return dangling_records
 
-def write_results_to_file(file_path, results):
+def lookup_status(outcome):
+    """The status check_dangling_dns reports for a UDP engine outcome, or None if the lookup found records."""
+    if isinstance(outcome, Exception):
+        return str(outcome)
+    rcode = outcome.rcode()
+    if rcode == dns.rcode.NXDOMAIN:
+        return 'NXDOMAIN'
+    if rcode != dns.rcode.NOERROR:
+        return f"The nameserver answered {dns.rcode.to_text(rcode)}"
+    try:
+        # Like the resolver, follow CNAMEs in the answer to the records of the requested type
+        return 'No answer' if outcome.resolve_chaining().answer is None else None
+    except dns.exception.DNSException as e:
+        return str(e)
+
+def outcome_targets(outcome):
+    """The CNAME or MX targets in a UDP engine outcome that answered."""
+    if isinstance(outcome, Exception) or outcome.rcode() != dns.rcode.NOERROR:
+        return []
+    try:
+        return rrset_targets(outcome.resolve_chaining().answer)
+    except dns.exception.DNSException:
+        return []
+
+def check_dangling_dns_bulk(subdomains, engine, nameserver, record_types=RECORD_TYPES, targets=None):
+    """check_dangling_dns for many names at once through the UDP engine; returns {subdomain: result}."""
+    statuses = {}
+    followed = {}
+    queries = ((nameserver, subdomain, record_type) for subdomain in subdomains for record_type in record_types)
+    for (_, subdomain, record_type), outcome in engine.run(queries):
+        statuses[(subdomain, record_type)] = lookup_status(outcome)
+        if targets is not None:
+            followed.setdefault(subdomain, []).extend((record_type, name) for name in outcome_targets(outcome))
+
+    if targets is not None:
+        # Every new target of the batch goes out in one more batch
+        targets.resolve([target for pairs in followed.values() for _, target in pairs], engine, nameserver)
+
+    results = {}
+    for subdomain in subdomains:
+        dangling_records = {record_type: statuses[(subdomain, record_type)] for record_type in record_types
+                            if statuses[(subdomain, record_type)] is not None}
+        if followed.get(subdomain):
+            dangling_records.update(targets.follow(subdomain, followed[subdomain]))
+        results[subdomain] = dangling_records or None
+    return results
+
+def is_nxdomain(name):
+    """Check whether name does not exist at all (and is not just a CNAME to a missing name)."""
+    try:
+        dns.resolver.resolve(name, 'A')
+    except dns.resolver.NXDOMAIN as e:
+        return is_own_nxdomain(name, e)
+    except Exception:
+        pass
+    return False
+
+def is_nxdomain_result(result):
+    """Whether a check_dangling_dns result says the name itself does not exist.
+
+    A CNAME to a missing name also answers A with NXDOMAIN, but its CNAME
+    lookup finds the record; only a missing name answers both with NXDOMAIN.
+    """
+    return bool(result) and result.get('A') == 'NXDOMAIN' and result.get('CNAME') == 'NXDOMAIN'
+
+def report_result(full_subdomain, result):
+    if result:
+        print(f"{Fore.YELLOW}Dangling records found for {Fore.GREEN}{full_subdomain}:{Style.RESET_ALL}")
+        for record_type, status in result.items():
+            print(f"  {Fore.CYAN}{record_type}: {Fore.RED}{status}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.GREEN}No dangling records found for {Fore.YELLOW}{full_subdomain}{Style.RESET_ALL}")
+
+def report_targets(targets):
+    for target, dependents in targets.dependents.items():
+        print(f"{Fore.YELLOW}Dangling target {Fore.GREEN}{target}{Fore.YELLOW} ({targets.statuses[target]}) "
+              f"is used by {len(dependents)} subdomains{Style.RESET_ALL}")
+
+def write_results_to_file(file_path, results, targets=None):
     with open(file_path, 'w') as file:
         for subdomain, result in results.items():
             if result:
@@ -118,8 +288,14 @@ def write_results_to_file(file_path, results):
                 file.write("\n")
             else:
                 file.write(f"No dangling records found for {subdomain}\n\n")
+        if targets is not None:
+            for target, dependents in targets.dependents.items():
+                file.write(f"** Dangling target {target} ({targets.statuses[target]}) used by {len(dependents)} subdomains **\n")
+                for subdomain in dependents:
+                    file.write(f"  {subdomain}\n")
+                file.write("\n")
 
-def main(domain):
+def main(domain, engine=None, nameserver=None):
     results = {}
     print(f"{Fore.BLUE}Checking domain: {domain}{Style.RESET_ALL}")
     subdomains = get_subdomains(domain)
@@ -127,28 +303,69 @@ def main(domain):
         print(f"{Fore.RED}No subdomains found or error occurred.{Style.RESET_ALL}")
         return
     
+    names = {}
     for subdomain in subdomains:
         full_subdomain = subdomain if subdomain.endswith(domain) else f"{subdomain}.{domain}"
-        print(f"{Fore.BLUE}Checking subdomain: {Fore.YELLOW}{full_subdomain}{Style.RESET_ALL}")
-        result = check_dangling_dns(full_subdomain)
-        if result:
-            results[full_subdomain] = result
-            print(f"{Fore.YELLOW}Dangling records found for {Fore.GREEN}{full_subdomain}:{Style.RESET_ALL}")
-            for record_type, status in result.items():
-                print(f"  {Fore.CYAN}{record_type}: {Fore.RED}{status}{Style.RESET_ALL}")
+        names[full_subdomain.rstrip('.').lower()] = full_subdomain
+
+    # Shallowest names first, so an NXDOMAIN parent answers for its whole subtree (RFC 8020)
+    tree = LabelTree(names)
+    targets = ChainTargets()
+    checked = {}
+    for level, branch_points in tree.levels():
+        if engine is None:
+            cuts = [branch_point for branch_point in branch_points if is_nxdomain(branch_point)]
         else:
-            results[full_subdomain] = None
-            print(f"{Fore.GREEN}No dangling records found for {Fore.YELLOW}{full_subdomain}{Style.RESET_ALL}")
+            # A whole level goes out in one engine batch
+            cuts = [branch_point for (_, branch_point, _), outcome in
+                    engine.run((nameserver, branch_point, 'A') for branch_point in branch_points)
+                    if lookup_status(outcome) == 'NXDOMAIN' and is_own_nxdomain(branch_point, outcome)]
+            level_results = check_dangling_dns_bulk([names[name] for name in level], engine, nameserver,
+                                                    targets=targets)
+        for branch_point in cuts:
+            tree.mark_nxdomain(branch_point)
+        for name in level:
+            full_subdomain = names[name]
+            print(f"{Fore.BLUE}Checking subdomain: {Fore.YELLOW}{full_subdomain}{Style.RESET_ALL}")
+            result = check_dangling_dns(full_subdomain, targets) if engine is None else level_results[full_subdomain]
+            if is_nxdomain_result(result):
+                tree.mark_nxdomain(name)
+            checked[name] = result
+            report_result(full_subdomain, result)
+
+    for name, full_subdomain in names.items():
+        if name in checked:
+            results[full_subdomain] = checked[name]
+        elif tree.is_pruned(name):
+            results[full_subdomain] = dict.fromkeys(RECORD_TYPES, 'NXDOMAIN')
+    if tree.pruned:
+        print(f"{Fore.BLUE}{tree.pruned} subdomains below NXDOMAIN parents were resolved without queries.{Style.RESET_ALL}")
+    print(f"{Fore.BLUE}{len(targets.statuses)} unique CNAME and MX targets were followed.{Style.RESET_ALL}")
+    report_targets(targets)
     
     # Write results to file
     file_path = f"{domain}_dangling_records.txt"
-    write_results_to_file(file_path, results)
+    write_results_to_file(file_path, results, targets)
     print(f"{Fore.BLUE}Results have been written to {file_path}{Style.RESET_ALL}")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print(f"{Fore.RED}Usage: python DanglingRecordsV2.py <domain_name>{Style.RESET_ALL}")
-        sys.exit(1)
-    
-    domain = sys.argv[1]
-    main(domain)
+    parser = argparse.ArgumentParser(description="Check a domain's crt.sh subdomains for dangling DNS records.")
+    parser.add_argument('domain', type=str, help='The domain to check.')
+    parser.add_argument('--dns-cache', type=str, default=DEFAULT_CACHE_FILE, help='Persistent DNS answer cache shared by the checkers.')
+    parser.add_argument('--no-dns-cache', action='store_true', help='Resolve everything from scratch.')
+    parser.add_argument('--engine', choices=['resolver', 'udp'], default='resolver', help='Look names up one query at a time (resolver) or in bulk from one non-blocking UDP engine (udp; bypasses the DNS cache).')
+    parser.add_argument('--nameserver', type=str, help='Recursive resolver (host or host:port) for --engine udp (default: the first system resolver).')
+    args = parser.parse_args()
+
+    dns_cache = None if args.no_dns_cache else install_cache(cache_file=args.dns_cache)
+    engine = nameserver = None
+    if args.engine == 'udp':
+        nameserver, port = args.nameserver or dns.resolver.get_default_resolver().nameservers[0], 53
+        if nameserver.count(':') == 1:
+            nameserver, port = nameserver.split(':')
+        # Truncated answers (large TXT sets) are asked again over pooled TCP connections
+        engine = UDPEngine(port=int(port), tcp_pool=TCPPool())
+    main(args.domain, engine, nameserver)
+    if dns_cache:
+        dns_cache.report()
+        dns_cache.close()
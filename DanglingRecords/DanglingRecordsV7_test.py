@@ -0,0 +1,96 @@
+import contextlib
+import os
+import sys
+import tempfile
+
+# Tests for V7's NXDOMAIN subtree cuts against the benchmark stand-in server
+# on loopback. Run with `python DanglingRecordsV7_test.py` or pytest.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import DanglingRecordsV7 as V7
+from bench_suite import ZONE, point_default_resolver, start_standin
+from udp_engine import UDPEngine
+
+HOST, LAME_HOST, PORT = '127.0.0.1', '127.0.0.2', 5363
+# aliasN is a CNAME to a missing name, so its A lookup is NXDOMAIN, but the names below it exist.
+# alias3 is checked as a name itself; alias4 is only probed as the branch point above its names.
+NAMES = [f"host1.{ZONE}", f"alias3.{ZONE}", f"api.alias3.{ZONE}", f"www.alias3.{ZONE}",
+         f"api.alias4.{ZONE}", f"www.alias4.{ZONE}",
+         f"gone.{ZONE}", f"www.gone.{ZONE}", f"a.www.gone.{ZONE}"]
+
+standin = None
+
+@contextlib.contextmanager
+def scan_dir():
+    """Run the enclosed block in a scratch directory against the stand-in, with get_subdomains returning NAMES."""
+    global standin
+    if standin is None:
+        standin = start_standin(HOST, PORT, LAME_HOST)
+    point_default_resolver(HOST, PORT)
+    previous = os.getcwd(), V7.get_subdomains
+    with tempfile.TemporaryDirectory(prefix='v7-test-') as workdir:
+        V7.get_subdomains = lambda domain: list(NAMES)
+        os.chdir(workdir)
+        try:
+            yield workdir
+        finally:
+            os.chdir(previous[0])
+            V7.get_subdomains = previous[1]
+
+def scan(engine=None):
+    """Run V7 over NAMES; return the report and the number of queries the stand-in answered."""
+    with scan_dir():
+        before = standin.answered()
+        V7.main(ZONE, engine, HOST if engine else None)
+        with open(f"{ZONE}_dangling_records.txt") as f:
+            return f.read(), standin.answered() - before
+
+def statuses(report):
+    """{subdomain: {record type: status}} from a V7 results file; names without dangling records map to {}."""
+    found = {}
+    for block in report.split('\n\n'):
+        lines = block.strip().splitlines()
+        if lines and lines[0].startswith('** Dangling records found for '):
+            found[lines[0][len('** Dangling records found for '):-len(' **')]] = dict(
+                line.strip().split(': ', 1) for line in lines[1:])
+        elif lines and lines[0].startswith('No dangling records found for '):
+            found[lines[0][len('No dangling records found for '):]] = {}
+    return found
+
+def check_report(report):
+    found = statuses(report)
+    assert found[f"alias3.{ZONE}"]['A'] == 'NXDOMAIN'
+    # The names below alias3 were checked and exist, rather than being cut with it
+    for name in (f"api.alias3.{ZONE}", f"www.alias3.{ZONE}", f"api.alias4.{ZONE}", f"www.alias4.{ZONE}",
+                 f"host1.{ZONE}"):
+        assert 'NXDOMAIN' not in found[name].values()
+    # The names below gone are still reported as NXDOMAIN
+    for name in (f"gone.{ZONE}", f"www.gone.{ZONE}", f"a.www.gone.{ZONE}"):
+        assert set(found[name].values()) == {'NXDOMAIN'}
+
+def test_cname_to_missing_name_does_not_cut_its_subtree():
+    report, queries = scan()
+    check_report(report)
+    # Only gone's subtree was cut: checking every name in full gives the same report for more queries
+    tree, V7.LabelTree = V7.LabelTree, NoCuts
+    try:
+        full_report, full_queries = scan()
+    finally:
+        V7.LabelTree = tree
+    assert full_report == report and full_queries > queries
+
+def test_cname_to_missing_name_does_not_cut_its_subtree_with_engine():
+    report, _ = scan(UDPEngine(port=PORT))
+    check_report(report)
+
+class NoCuts(V7.LabelTree):
+    """A LabelTree that never prunes anything."""
+
+    def mark_nxdomain(self, name):
+        pass
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -1,92 +1,111 @@
+import argparse
+import io
+import json
 import sys
 import os
-import json
 import requests
 import re
+import shutil
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import dns.resolver
 from colorama import Fore, Style, init
 from datetime import datetime, timedelta
 
+# Shared helpers live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from crtsh import iter_certificates
+from fingerprints import DEFAULT_SIGNATURES, load_signatures, resolve_records
+from incremental import ScanState, resolve_fingerprint
+from instrumentation import instrument, record_error, write_metrics
+from journal import Journal
+from profiling import profiled
+from sharding import parse_shard, select_shard, shard_suffix
+from subdomain_cache import SubdomainCache
+from tcp_pool import TCPPool
+from udp_engine import UDPEngine
+
 # Initialize Colorama
 init(autoreset=True)
 
 CACHE_EXPIRY_DAYS = 1  # Cache expiry duration in days
 CONTEXT_LINES = 5     # Number of lines to capture above and below
+OUTPUT_FILE = 'all_outputs.txt'      # Combined dnsReaper output
+BATCH_DIR_SUFFIX = '_dnsreaper_batch'  # Shard lists and per-container output for batch runs
+DOCKER_COMMAND = ['sudo', 'docker']  # Prefix used to launch dnsReaper containers
+FINDINGS_FORMAT = 'json'             # dnsReaper --out-format for the per-chunk findings files
+FINGERPRINT_WORKERS = 32             # Parallel DNS lookups when fingerprinting for --incremental
+BATCH_CHUNK = 1000                   # Most names per dnsReaper container; the unit of work --resume can skip
+TAKEOVER_PATTERN = re.compile(r'We found (\d+) takeovers ☠️')
 
 def get_cache_filename(domain):
     """Generate a unique cache filename based on the domain."""
-    return f"{domain.replace('.', '_')}_cache.json"
+    return f"{domain.replace('.', '_')}_cache.bin"
+
+def get_state_filename(domain, shard=None):
+    """Generate the incremental scan state filename based on the domain and shard."""
+    return f"{domain.replace('.', '_')}{shard_suffix(shard)}_scan_state.json"
+
+def get_batch_dir(domain, shard=None):
+    """Generate the batch directory name based on the domain and shard, so runs sharing a directory don't collide."""
+    return f"{domain.replace('.', '_')}{shard_suffix(shard)}{BATCH_DIR_SUFFIX}"
+
+def get_journal_filename(domain, shard=None):
+    """Generate the progress journal filename based on the domain and shard."""
+    return f"{domain.replace('.', '_')}{shard_suffix(shard)}_progress.jsonl"
 
 def is_valid_domain(domain):
     """Check if the provided domain is valid."""
     return re.match(r'^[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', domain) is not None
 
-def read_cache(cache_file):
-    """Read the cached data if it is still valid."""
-    if not os.path.exists(cache_file):
-        return None
-
-    try:
-        with open(cache_file, 'r') as f:
-            cache_data = json.load(f)
-        
-        # Check cache expiry
-        cache_time = datetime.fromisoformat(cache_data['timestamp'])
-        if datetime.now() - cache_time < timedelta(days=CACHE_EXPIRY_DAYS):
-            return cache_data['subdomains']
-        else:
-            return None
-    except (json.JSONDecodeError, KeyError, ValueError):
-        return None
-
-def write_cache(cache_file, subdomains):
-    """Write the data to cache file."""
-    cache_data = {
-        'timestamp': datetime.now().isoformat(),
-        'subdomains': subdomains
-    }
-    with open(cache_file, 'w') as f:
-        json.dump(cache_data, f)
+def cache_is_fresh(fetched_at):
+    """Check whether a cache refreshed at the given unix time is still valid."""
+    return fetched_at is not None and datetime.now() - datetime.fromtimestamp(fetched_at) < timedelta(days=CACHE_EXPIRY_DAYS)
 
+@instrument()
 def get_subdomains(domain, wordlist_file):
     if not is_valid_domain(domain):
         print(f"{Fore.RED}Invalid domain format.{Style.RESET_ALL}")
         return []
 
-    cache_file = get_cache_filename(domain)
+    cache = SubdomainCache(get_cache_filename(domain))
     
     # Attempt to read from cache
-    cached_data = read_cache(cache_file)
-    if cached_data:
+    fetched_at, max_cert_id, subdomains = cache.snapshot()
+    if subdomains and cache_is_fresh(fetched_at):
         print(f"{Fore.YELLOW}Using cached data.{Style.RESET_ALL}")
-        subdomains = set(cached_data)
     else:
-        subdomains = set()
-    
-    try:
-        # Use crt.sh to get subdomains
-        url = f'https://crt.sh/?q={domain}&output=json'
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        for entry in data:
-            if 'name_value' in entry:
-                subdomains.add(entry['name_value'])
-        
-        # Cache the new data if not using cached
-        if not cached_data:
-            write_cache(cache_file, list(subdomains))
-    except requests.RequestException as e:
-        print(f"{Fore.RED}Network error: {e}{Style.RESET_ALL}")
-        # Return cached data if available
-        if cached_data:
-            print(f"{Fore.YELLOW}Using cached data due to network error.{Style.RESET_ALL}")
-            return cached_data
-        return []
-    except ValueError as e:
-        print(f"{Fore.RED}Error parsing JSON response: {e}{Style.RESET_ALL}")
-        return []
+        try:
+            # Use crt.sh to get subdomains; only certificates newer than the cached ones need merging
+            url = f'https://crt.sh/?q={domain}&output=json'
+            new_names = {}
+            # Stream the certificates instead of materialising the whole (possibly huge) body
+            with requests.get(url, stream=True) as response:
+                response.raise_for_status()
+                for entry in iter_certificates(response):
+                    cert_id = entry.get('id', 0)
+                    if 'name_value' in entry and cert_id > max_cert_id:
+                        # name_value holds one name per line
+                        for name in entry['name_value'].split('\n'):
+                            if name.strip():
+                                new_names[name.strip()] = max(new_names.get(name.strip(), 0), cert_id)
+            
+            # Merge the new names into the cache
+            cache.merge(new_names)
+            subdomains.update(new_names)
+        except requests.RequestException as e:
+            record_error('get_subdomains', e)
+            print(f"{Fore.RED}Network error: {e}{Style.RESET_ALL}")
+            # Return cached data if available
+            if subdomains:
+                print(f"{Fore.YELLOW}Using cached data due to network error.{Style.RESET_ALL}")
+                return list(subdomains)
+            return []
+        except ValueError as e:
+            record_error('get_subdomains', e)
+            print(f"{Fore.RED}Error parsing JSON response: {e}{Style.RESET_ALL}")
+            return []
     
     # Read and add subdomains from wordlist file
     if wordlist_file and os.path.exists(wordlist_file):
@@ -111,51 +130,245 @@ def write_results_to_file(file_path, takeovers):
         else:
             file.write(f"{Fore.YELLOW}No takeovers found.{Style.RESET_ALL}\n")
 
-def run_dnsreaper(subdomain):
-    """Run the dnsreaper Docker command and capture its output."""
-    command = [
-        'sudo', 'stdbuf', '-oL', 'docker', 'run', '--rm',
-        'punksecurity/dnsreaper', 'single', '--domain', subdomain
-    ]
-    with open('all_outputs.txt', 'a') as output_file:
+@instrument()
+def run_dnsreaper(subdomain, docker_command=DOCKER_COMMAND):
+    """Run dnsReaper on one subdomain, appending its output to OUTPUT_FILE; return its takeovers, or None if it failed."""
+    command = docker_command + ['run', '--rm', 'punksecurity/dnsreaper', 'single', '--domain', subdomain]
+    offset = os.path.getsize(OUTPUT_FILE) if os.path.exists(OUTPUT_FILE) else 0
+    with open(OUTPUT_FILE, 'a') as output_file:
         try:
             subprocess.run(command, stdout=output_file, stderr=subprocess.STDOUT, check=True)
         except subprocess.CalledProcessError as e:
+            record_error('run_dnsreaper', e)
             print(f"{Fore.RED}Command failed: {e}{Style.RESET_ALL}")
+            return None
+    # Everything this container printed is about the one subdomain
+    return extract_takeovers(OUTPUT_FILE, offset)
+
+def finding_report(finding):
+    """Render a dnsReaper finding like the native engine's reports: name: service takeover (confidence): info."""
+    confidence = str(finding.get('confidence', 'potential')).lower()
+    report = f"{finding['domain']}: {finding.get('signature', 'unknown')} takeover ({confidence})"
+    return f"{report}: {finding['info']}" if finding.get('info') else report
+
+def read_findings(path):
+    """Return {name: [takeover reports]} from a findings file dnsReaper wrote with --out-format json.
+
+    In file mode the console output only counts the takeovers of the whole
+    list, so this file is the one place that says which names they are.
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    try:
+        entries = json.loads(text) if text.strip() else []
+    except ValueError:
+        # One finding per line
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    findings = {}
+    for finding in entries:
+        findings.setdefault(finding['domain'].rstrip('.').lower(), []).append(finding_report(finding))
+    return findings
+
+def write_shards(subdomains, count, batch_dir):
+    """Split the subdomains round-robin into up to `count` list files; return [(file name, names)]."""
+    subdomains = sorted(subdomains)
+    count = max(1, min(count, len(subdomains)))
+    shards = []
+    for index in range(count):
+        shard_file = f"shard_{index}.txt"
+        names = subdomains[index::count]
+        with open(os.path.join(batch_dir, shard_file), 'w') as f:
+            f.write('\n'.join(names) + '\n')
+        shards.append((shard_file, names))
+    return shards
+
+@instrument()
+def run_dnsreaper_batch(subdomains, batch_dir, workers=1, docker_command=DOCKER_COMMAND, journal=None):
+    """Run dnsReaper in file mode, `workers` containers at a time, and append the output to OUTPUT_FILE.
+
+    The names go out in chunks of at most BATCH_CHUNK, and each container
+    writes its findings to a JSON file next to its list. Each chunk that
+    finishes cleanly is recorded name by name in the journal, if one is
+    given. Return (True if every chunk succeeded, {name: takeover reports}
+    for the names of the chunks that did).
+    """
+    batch_dir = os.path.abspath(batch_dir)
+    os.makedirs(batch_dir, exist_ok=True)
+    shards = deque(write_shards(subdomains, max(workers, -(-len(subdomains) // BATCH_CHUNK)), batch_dir))
 
-def extract_takeovers(file_path):
-    """Extract lines with takeovers found and their surrounding context from the output file."""
+    def launch(shard_file, names):
+        findings = shard_file.replace('.txt', '_findings')
+        # dnsReaper adds the format as the extension; a file left by an earlier run must not be read back
+        findings_path = os.path.join(batch_dir, f"{findings}.{FINDINGS_FORMAT}")
+        if os.path.exists(findings_path):
+            os.remove(findings_path)
+        command = docker_command + [
+            'run', '--rm', '-v', f"{batch_dir}:/etc/dnsreaper",
+            'punksecurity/dnsreaper', 'file', '--filename', f"/etc/dnsreaper/{shard_file}",
+            '--out', f"/etc/dnsreaper/{findings}", '--out-format', FINDINGS_FORMAT
+        ]
+        output_path = os.path.join(batch_dir, shard_file.replace('.txt', '.out'))
+        with open(output_path, 'w') as output_file:
+            process = subprocess.Popen(command, stdout=output_file, stderr=subprocess.STDOUT)
+        return output_path, findings_path, names, process
+
+    # Keep `workers` containers busy side by side
+    all_succeeded = True
+    verdicts = {}
+    running = deque(launch(*shards.popleft()) for _ in range(min(workers, len(shards))))
+
+    # Append the shard outputs one after another so the combined log is not interleaved
+    with open(OUTPUT_FILE, 'a') as output_file:
+        while running:
+            output_path, findings_path, names, process = running.popleft()
+            findings = None
+            if process.wait() != 0:
+                print(f"{Fore.RED}Command failed: {' '.join(process.args)} returned {process.returncode}{Style.RESET_ALL}")
+            else:
+                findings = read_chunk_findings(findings_path, output_path)
+            if shards:
+                running.append(launch(*shards.popleft()))
+            with open(output_path, 'r') as shard_output:
+                shutil.copyfileobj(shard_output, output_file)
+            output_file.flush()
+
+            if findings is None:
+                # A failed chunk stays out of the journal so --resume runs it again
+                all_succeeded = False
+                continue
+            for name in names:
+                verdicts[name] = findings.get(name.rstrip('.').lower(), [])
+                if journal is not None:
+                    journal.append({'name': name, 'takeovers': verdicts[name]})
+    return all_succeeded, verdicts
+
+def read_chunk_findings(findings_path, output_path):
+    """Return a finished chunk's {name: takeover reports}, or None if they cannot be tied to names."""
+    try:
+        return read_findings(findings_path)
+    except FileNotFoundError:
+        # dnsReaper may skip the file when it found nothing, but not when its output counts takeovers
+        if not extract_takeovers(output_path):
+            return {}
+        print(f"{Fore.RED}{output_path} reports takeovers but dnsReaper wrote no {findings_path}.{Style.RESET_ALL}")
+    except (ValueError, KeyError) as e:
+        record_error('run_dnsreaper_batch', e)
+        print(f"{Fore.RED}Could not read {findings_path}: {e}{Style.RESET_ALL}")
+    return None
+
+def extract_takeovers(file_path, start_offset=0):
+    """Extract lines with takeovers found and their surrounding context from the output file.
+
+    The file is streamed from start_offset, keeping only CONTEXT_LINES lines of
+    history and the context windows still being filled, so memory stays flat
+    however large the output file grows.
+    """
     takeovers = []
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-    
-    for i, line in enumerate(lines):
-        match = re.search(r'We found (\d+) takeovers ☠️', line)
-        if match:
-            count = int(match.group(1))
-            if count > 0:
+    before = deque(maxlen=CONTEXT_LINES)
+    windows = deque()  # [context lines, lines still to collect] for each open match
+
+    with open(file_path, 'rb') as raw_file:
+        raw_file.seek(start_offset)
+        for line in io.TextIOWrapper(raw_file, encoding='utf-8', errors='replace'):
+            for window in windows:
+                window[0].append(line)
+                window[1] -= 1
+            # Windows all have the same length, so they close in match order
+            while windows and windows[0][1] <= 0:
+                takeovers.append(''.join(windows.popleft()[0]))
+
+            match = TAKEOVER_PATTERN.search(line)
+            if match and int(match.group(1)) > 0:
                 # Collect the context around the takeover line
-                context = []
-                start = max(0, i - CONTEXT_LINES)
-                end = min(len(lines), i + CONTEXT_LINES + 1)
-                context = lines[start:end]
-                takeovers.append(''.join(context))
-    
+                windows.append([list(before) + [line], CONTEXT_LINES])
+                if CONTEXT_LINES == 0:
+                    takeovers.append(''.join(windows.pop()[0]))
+            before.append(line)
+
+    # Matches near the end of the file get whatever context follows them
+    takeovers.extend(''.join(window[0]) for window in windows)
     return takeovers
 
-def main(domain, wordlist_file):
+@instrument()
+def check_takeovers_native(subdomains, signatures, engine, nameserver, journal=None):
+    """Match the subdomains' DNS answers against the takeover signatures as they arrive; return {name: reports}."""
+    verdicts = {}
+    for records in resolve_records(subdomains, engine, nameserver):
+        report = signatures.check(records)
+        verdicts[records.name] = [report] if report else []
+        if journal is not None:
+            journal.append({'name': records.name, 'takeovers': verdicts[records.name]})
+    return verdicts
+
+def fingerprint_subdomains(subdomains):
+    """Return {subdomain: DNS fingerprint}, resolving FINGERPRINT_WORKERS names at a time."""
+    with ThreadPoolExecutor(max_workers=FINGERPRINT_WORKERS) as executor:
+        return dict(zip(subdomains, executor.map(resolve_fingerprint, subdomains)))
+
+def main(domain, wordlist_file, workers=1, per_subdomain=False, docker_command=DOCKER_COMMAND, incremental=False,
+         shard=None, resume=False, signatures=None, engine=None, nameserver=None):
     print(f"{Fore.BLUE}Checking domain: {domain}{Style.RESET_ALL}")
-    subdomains = get_subdomains(domain, wordlist_file)
+    # With --shard only this host's part of the names is checked; sharding.py merges the reports
+    subdomains = select_shard(get_subdomains(domain, wordlist_file), shard)
     if not subdomains:
         print(f"{Fore.RED}No subdomains found or error occurred.{Style.RESET_ALL}")
         return
     
-    # Run the dnsreaper command for each subdomain
-    for subdomain in subdomains:
-        run_dnsreaper(subdomain)
-  
-    # Extract takeovers from the output file
-    takeovers = extract_takeovers('all_outputs.txt')
+    state, reused = None, {}
+    if incremental:
+        # Only new, changed or due names go through dnsreaper; the rest reuse their last verdict
+        state = ScanState(get_state_filename(domain, shard))
+        fingerprints = fingerprint_subdomains(subdomains)
+        subdomains, reused = state.plan(fingerprints)
+        print(f"{Fore.BLUE}Incremental scan: {len(subdomains)} names to check, {len(reused)} unchanged.{Style.RESET_ALL}")
+
+    # Every finished name goes into an append-only journal so an interrupted run can be resumed
+    journal_file = get_journal_filename(domain, shard)
+    verdicts = {}  # name -> its takeover reports, for every name this run (or the one it resumes) checked
+    if resume and os.path.exists(journal_file):
+        def replay(record):
+            verdicts[record['name']] = record['takeovers']
+        journal = Journal(journal_file, resume=True, replay=replay)
+        subdomains = [subdomain for subdomain in subdomains if subdomain not in verdicts]
+        print(f"{Fore.BLUE}Resuming: {len(verdicts)} names already checked, {len(subdomains)} to go.{Style.RESET_ALL}")
+    else:
+        journal = Journal(journal_file)
+
+    completed = True
+    with journal:
+        if signatures is not None:
+            # No containers: the names are fingerprinted in this process straight from their DNS answers
+            verdicts.update(check_takeovers_native(subdomains, signatures, engine, nameserver, journal))
+        elif per_subdomain:
+            # Run the dnsreaper command for each subdomain
+            for subdomain in subdomains:
+                found = run_dnsreaper(subdomain, docker_command)
+                if found is None:
+                    completed = False
+                    continue
+                verdicts[subdomain] = found
+                journal.append({'name': subdomain, 'takeovers': found})
+        elif subdomains:
+            # Hand the list to dnsreaper in a few large chunks instead of paying a container start per name
+            completed, found = run_dnsreaper_batch(subdomains, get_batch_dir(domain, shard), workers, docker_command,
+                                                   journal)
+            verdicts.update(found)
+
+    if completed:
+        # Every name was checked, so there is nothing left to resume
+        os.remove(journal_file)
+    else:
+        print(f"{Fore.YELLOW}Some names could not be checked; run again with --resume to retry them.{Style.RESET_ALL}")
+
+    if state is not None:
+        # Names that could not be checked get no verdict, so the next run checks them again
+        for subdomain, found in verdicts.items():
+            if subdomain in fingerprints:
+                state.record(subdomain, fingerprints[subdomain], found)
+        verdicts.update(reused)
+        state.save(fingerprints)
+    # A chunk re-run after a crash may report a takeover twice
+    takeovers = list(dict.fromkeys(takeover for found in verdicts.values() for takeover in found))
     if takeovers:
         print(f"{Fore.GREEN}Takeovers found:{Style.RESET_ALL}")
         for takeover in takeovers:
@@ -163,7 +376,7 @@ def main(domain, wordlist_file):
             print("\n" + "="*40 + "\n")  # Separator for readability
 
         # Write takeovers to file
-        file_path = f"{domain}_dangling_records.txt"
+        file_path = f"{domain}{shard_suffix(shard)}_dangling_records.txt"
         write_results_to_file(file_path, takeovers)
         print(f"{Fore.BLUE}Results have been written to {file_path}{Style.RESET_ALL}")
 
@@ -173,10 +386,35 @@ def main(domain, wordlist_file):
         return False # return False when not triggering the alert
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(f"{Fore.RED}Usage: python checker.py <domain_name> <wordlist_file>{Style.RESET_ALL}")
-        sys.exit(1)
-    
-    domain = sys.argv[1]
-    wordlist_file = sys.argv[2]
-    main(domain, wordlist_file)
+    parser = argparse.ArgumentParser(description="Check a domain's subdomains for takeovers with dnsReaper.")
+    parser.add_argument('domain', type=str, help='The domain to check.')
+    parser.add_argument('wordlist_file', type=str, help='A file containing a list of subdomains to add to the crt.sh results.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of dnsReaper containers to split the subdomain list across (default: 1).')
+    parser.add_argument('--per-subdomain', action='store_true', help='Start one dnsReaper container per subdomain (the old behaviour).')
+    parser.add_argument('--no-sudo', action='store_true', help='Run docker without sudo.')
+    parser.add_argument('--engine', choices=['dnsreaper', 'native'], default='dnsreaper', help='Detect takeovers with the dnsReaper container (dnsreaper) or by matching DNS answers against a signature file in this process (native).')
+    parser.add_argument('--signatures', type=str, default=DEFAULT_SIGNATURES, help='Signature file for --engine native (default: fingerprints.json next to this script).')
+    parser.add_argument('--nameserver', type=str, help='Recursive resolver (host or host:port) for --engine native (default: the first system resolver).')
+    parser.add_argument('--incremental', action='store_true', help='Only re-check names that are new, changed or due for re-verification.')
+    parser.add_argument('--shard', type=parse_shard, help='Only check shard K/N of the names (e.g. 2/4) so a sweep can be split across hosts.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its progress journal, skipping names already checked.')
+    parser.add_argument('--profile', nargs='?', const='dangling_records.profile', metavar='PREFIX', help='Profile the run into PREFIX.pstats and PREFIX.collapsed (flamegraph input) and print the hottest functions.')
+    parser.add_argument('--metrics-dir', type=str, help='Write per-phase timings here as dangling_records.prom (node_exporter textfile) and dangling_records.json.')
+    args = parser.parse_args()
+
+    docker_command = DOCKER_COMMAND[1:] if args.no_sudo else DOCKER_COMMAND
+    signatures = engine = nameserver = None
+    if args.engine == 'native':
+        signatures = load_signatures(args.signatures)
+        nameserver, port = args.nameserver or dns.resolver.get_default_resolver().nameservers[0], 53
+        if nameserver.count(':') == 1:
+            nameserver, port = nameserver.split(':')
+        # Truncated answers are asked again over pooled TCP connections
+        engine = UDPEngine(port=int(port), tcp_pool=TCPPool())
+    with profiled(args.profile):
+        main(args.domain, args.wordlist_file, workers=args.workers, per_subdomain=args.per_subdomain,
+             docker_command=docker_command, incremental=args.incremental, shard=args.shard, resume=args.resume,
+             signatures=signatures, engine=engine, nameserver=nameserver)
+    if args.metrics_dir:
+        textfile, summary = write_metrics(args.metrics_dir, 'dangling_records')
+        print(f"Metrics written to {textfile} and {summary}")
@@ -0,0 +1,149 @@
+import contextlib
+import json
+import os
+import sys
+import tempfile
+
+# Tests for V9's batch runner with a fake `docker` on PATH, so no container
+# is started. Run with `python V9_batch_test.py` or pytest.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import V9
+
+# Stands in for `docker run ... punksecurity/dnsreaper file --filename /etc/dnsreaper/<list> --out
+# /etc/dnsreaper/<findings> --out-format json` (and for `single --domain <name>`). Like the real file
+# mode it prints one takeover count for the whole list and names the vulnerable domains only in the
+# --out file. Names starting with "vuln" are vulnerable; a list holding a name starting with "fail"
+# exits with an error unless FAKE_DOCKER_HEALED is set.
+FAKE_DOCKER = '''#!{python}
+import json, os, sys
+args = sys.argv[1:]
+if 'single' in args:
+    names, out = [args[args.index('--domain') + 1]], None
+    print(f"Domain '{{names[0]}}' provided on commandline")
+else:
+    host_dir = args[args.index('-v') + 1].split(':')[0]
+    in_host = lambda path: os.path.join(host_dir, os.path.basename(path))
+    names = [line.strip() for line in open(in_host(args[args.index('--filename') + 1])) if line.strip()]
+    out = in_host(args[args.index('--out') + 1]) + '.' + args[args.index('--out-format') + 1]
+    print(f"Reading domains from file, found {{len(names)}}")
+with open(os.environ['FAKE_DOCKER_LOG'], 'a') as log:
+    log.write(' '.join(names) + '\\n')
+if any(name.startswith('fail') for name in names) and not os.environ.get('FAKE_DOCKER_HEALED'):
+    print('dnsReaper crashed')
+    sys.exit(1)
+print("Testing with 61 signatures")
+print()
+print()
+findings = [dict(domain=name, signature='Fake provider', info=f"CNAME {{name}}.fake.test is unclaimed",
+                 confidence='CONFIRMED', a_records=[], cname_records=[f"{{name}}.fake.test"])
+            for name in names if name.startswith('vuln')]
+if out:
+    with open(out, 'w') as f:
+        json.dump(findings, f)
+print(f"We found {{len(findings)}} takeovers \\u2620\\ufe0f")
+print()
+print("\\u23f1\\ufe0f  We completed in 2.02 seconds")
+print("...Thats all folks!")
+'''
+
+@contextlib.contextmanager
+def fake_docker(names):
+    """Run the enclosed block in a scratch directory with a fake docker on PATH and get_subdomains returning names."""
+    previous = os.getcwd(), os.environ.get('PATH'), V9.get_subdomains
+    with tempfile.TemporaryDirectory(prefix='v9-test-') as workdir:
+        bin_dir = os.path.join(workdir, 'bin')
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, 'docker'), 'w') as f:
+            f.write(FAKE_DOCKER.format(python=sys.executable))
+        os.chmod(os.path.join(bin_dir, 'docker'), 0o755)
+        os.environ['PATH'] = bin_dir + os.pathsep + previous[1]
+        os.environ['FAKE_DOCKER_LOG'] = os.path.join(workdir, 'docker_calls.log')
+        V9.get_subdomains = lambda domain, wordlist_file: list(names)
+        os.chdir(workdir)
+        try:
+            yield workdir
+        finally:
+            os.chdir(previous[0])
+            os.environ['PATH'] = previous[1]
+            os.environ.pop('FAKE_DOCKER_LOG', None)
+            os.environ.pop('FAKE_DOCKER_HEALED', None)
+            V9.get_subdomains = previous[2]
+
+def docker_calls(workdir):
+    with open(os.path.join(workdir, 'docker_calls.log')) as f:
+        return [line.split() for line in f]
+
+def report(name):
+    """The takeover report V9 writes for a name the fake docker finds vulnerable."""
+    return f"{name}: Fake provider takeover (confirmed): CNAME {name}.fake.test is unclaimed"
+
+def journal_records(domain):
+    with open(V9.get_journal_filename(domain)) as f:
+        return [json.loads(line) for line in f]
+
+def test_batch_finds_takeovers_in_chunks():
+    # www.vuln1 contains vuln1's name but is not vulnerable itself
+    names = [f"host{index}.example.com" for index in range(5)] + ['vuln1.example.com', 'www.vuln1.example.com']
+    chunk = V9.BATCH_CHUNK
+    V9.BATCH_CHUNK = 3
+    try:
+        with fake_docker(names) as workdir:
+            takeovers = V9.main('example.com', None, workers=2, docker_command=['docker'])
+            calls = docker_calls(workdir)
+            assert len(calls) == 3
+            assert sorted(name for call in calls for name in call) == sorted(names)
+            assert takeovers == [report('vuln1.example.com')]
+            with open('example.com_dangling_records.txt') as f:
+                assert report('vuln1.example.com') in f.read()
+            assert os.path.isdir(V9.get_batch_dir('example.com'))
+            # A finished run leaves nothing to resume
+            assert not os.path.exists(V9.get_journal_filename('example.com'))
+    finally:
+        V9.BATCH_CHUNK = chunk
+
+def test_failed_chunk_is_resumed():
+    names = [f"host{index}.example.com" for index in range(4)] + ['vuln1.example.com', 'www.vuln1.example.com',
+                                                                   'fail1.example.com']
+    chunk = V9.BATCH_CHUNK
+    V9.BATCH_CHUNK = 2
+    try:
+        with fake_docker(names) as workdir:
+            assert V9.main('example.com', None, workers=1, docker_command=['docker']) == [report('vuln1.example.com')]
+            # The journal holds each finished name with exactly its own takeovers
+            journaled = {record['name']: record['takeovers'] for record in journal_records('example.com')}
+            assert 'fail1.example.com' not in journaled and len(journaled) >= len(names) - 2
+            assert all(takeovers == ([report(name)] if name.startswith('vuln') else [])
+                       for name, takeovers in journaled.items())
+            first_run = docker_calls(workdir)
+
+            os.environ['FAKE_DOCKER_HEALED'] = '1'
+            takeovers = V9.main('example.com', None, workers=1, docker_command=['docker'], resume=True)
+            # Only the chunk holding the failed name runs again, and the replayed takeover is kept
+            failed = [call for call in first_run if 'fail1.example.com' in call]
+            assert docker_calls(workdir)[len(first_run):] == failed
+            assert takeovers == [report('vuln1.example.com')]
+            assert not os.path.exists(V9.get_journal_filename('example.com'))
+    finally:
+        V9.BATCH_CHUNK = chunk
+
+def test_per_subdomain_uses_docker_command():
+    names = ['host1.example.com', 'vuln1.example.com', 'www.vuln1.example.com']
+    with fake_docker(names) as workdir:
+        takeovers = V9.main('example.com', None, per_subdomain=True, docker_command=['docker'])
+        assert sorted(call[0] for call in docker_calls(workdir)) == sorted(names)
+        assert len(takeovers) == 1 and "Domain 'vuln1.example.com' provided" in takeovers[0]
+
+def test_runs_in_one_directory_do_not_collide():
+    with fake_docker([f"host{index}.example.org" for index in range(8)]):
+        V9.main('example.com', None, docker_command=['docker'])
+        V9.main('example.org', None, docker_command=['docker'], shard=(1, 2))
+        V9.main('example.org', None, docker_command=['docker'], shard=(2, 2))
+        batch_dirs = {V9.get_batch_dir('example.com'), V9.get_batch_dir('example.org', (1, 2)),
+                      V9.get_batch_dir('example.org', (2, 2))}
+        assert len(batch_dirs) == 3 and all(os.path.isdir(batch_dir) for batch_dir in batch_dirs)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
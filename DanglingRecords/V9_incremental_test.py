@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+# Tests for V9 --incremental with both takeover engines. DNS comes from the
+# benchmark stand-in server on loopback and dnsReaper from the fake docker of
+# V9_batch_test.py. Run with `python V9_incremental_test.py` or pytest.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import V9
+from V9_batch_test import fake_docker, report
+from bench_suite import ZONE, point_default_resolver, start_standin
+from fingerprints import load_signatures
+from udp_engine import UDPEngine
+
+HOST, LAME_HOST, PORT = '127.0.0.1', '127.0.0.2', 5362
+NAMES = [f"host1.{ZONE}", f"host2.{ZONE}", f"dangling17.{ZONE}", f"vuln1.{ZONE}", f"www.vuln1.{ZONE}"]
+
+standin = None
+
+def use_standin():
+    """Serve the synthetic zone (once per process) and send the blocking resolver to it."""
+    global standin
+    if standin is None:
+        standin = start_standin(HOST, PORT, LAME_HOST)
+    point_default_resolver(HOST, PORT)
+
+def run_twice(**engine_args):
+    """Run an incremental scan twice; return both runs' takeover reports."""
+    first = V9.main(ZONE, None, incremental=True, **engine_args)
+    assert os.path.exists(V9.get_state_filename(ZONE))
+    second = V9.main(ZONE, None, incremental=True, **engine_args)
+    return first, second
+
+def test_incremental_with_dnsreaper_engine():
+    use_standin()
+    with fake_docker(NAMES):
+        first, second = run_twice(docker_command=['docker'])
+        with open(V9.get_state_filename(ZONE)) as f:
+            verdicts = {name: entry['verdict'] for name, entry in json.load(f)['names'].items()}
+    assert first == [report(f"vuln1.{ZONE}")]
+    # Each name keeps exactly its own takeovers, not those of names containing it
+    assert verdicts[f"vuln1.{ZONE}"] == first and verdicts[f"www.vuln1.{ZONE}"] == []
+    # Unchanged names reuse their verdict, so the second run reports the same takeovers
+    assert sorted(second) == sorted(first)
+
+def test_incremental_with_native_engine():
+    use_standin()
+    with fake_docker(NAMES) as workdir:
+        first, second = run_twice(signatures=load_signatures(), engine=UDPEngine(port=PORT), nameserver=HOST)
+        assert not os.path.exists(os.path.join(workdir, 'docker_calls.log'))
+    assert first == [f"dangling17.{ZONE}: Dangling CNAME takeover (potential): "
+                     f"CNAME to dangling17.unclaimed.{ZONE} is NXDOMAIN"]
+    assert sorted(second) == sorted(first)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,159 @@
+import ipaddress
+import json
+import os
+import sys
+from collections import namedtuple
+import dns.exception
+import dns.rcode
+
+# Shared helpers live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from label_tree import split_labels
+
+# In-process takeover fingerprinting for V9 --engine native. Signatures are
+# loaded from a JSON file (fingerprints.json next to this module): provider
+# CNAME suffixes with the DNS conditions under which a name pointing there can
+# be claimed by someone else, and address sets known to be unclaimed. All the
+# suffixes are compiled into one trie keyed by reversed labels, so a CNAME
+# target is checked against every signature in one walk over its labels. The
+# checks run on DNS answers as they stream in; there is no container or
+# subprocess and no HTTP request, so signatures that need a response body
+# (dnsReaper's "string in body" kind) are out of reach.
+
+DEFAULT_SIGNATURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fingerprints.json')
+CONDITIONS = {
+    'nxdomain': 'NXDOMAIN',
+    'noerror_empty': 'NOERROR without addresses',
+}
+
+Signature = namedtuple('Signature', ['service', 'confidence', 'conditions'])
+# status is NXDOMAIN, NOERROR or the rcode or error that ended the lookup;
+# cnames is the CNAME chain from the name to its canonical name, in order
+Records = namedtuple('Records', ['name', 'cnames', 'status', 'addresses'])
+
+class Node:
+    __slots__ = ('children', 'signatures')
+
+    def __init__(self):
+        self.children = {}
+        self.signatures = []
+
+class SuffixTrie:
+    """Signatures keyed by the reversed labels of their CNAME suffixes.
+
+    An empty suffix matches every target; those catch-all signatures sit at
+    the root and are kept out of match() so that callers can try them last.
+    """
+
+    def __init__(self):
+        self.root = Node()
+
+    def add(self, suffix, signature):
+        node = self.root
+        for label in split_labels(suffix) if suffix.strip('.') else []:
+            node = node.children.setdefault(label, Node())
+        node.signatures.append(signature)
+
+    def match(self, name):
+        """Signatures whose suffix name ends with (on a label boundary), most specific first."""
+        matches = []
+        node = self.root
+        for label in split_labels(name):
+            node = node.children.get(label)
+            if node is None:
+                break
+            matches[:0] = node.signatures
+        return matches
+
+class FingerprintEngine:
+    """Matches resolved names against the takeover signatures."""
+
+    def __init__(self, signatures):
+        self.trie = SuffixTrie()
+        self.addresses = {}  # address -> Signature
+        self.networks = []   # (network, Signature) for the address sets given as CIDR ranges
+        for entry in signatures:
+            conditions = tuple(entry.get('conditions', ()))
+            unknown = [condition for condition in conditions if condition not in CONDITIONS]
+            if unknown:
+                raise ValueError(f"{entry['service']}: unknown conditions {', '.join(unknown)}")
+            signature = Signature(entry['service'], entry.get('confidence', 'potential'), conditions)
+            for suffix in entry.get('cname', ()):
+                self.trie.add(suffix, signature)
+            for address in entry.get('ips', ()):
+                network = ipaddress.ip_network(address, strict=False)
+                if network.num_addresses == 1:
+                    self.addresses[str(network.network_address)] = signature
+                else:
+                    self.networks.append((network, signature))
+
+    def address_signature(self, address):
+        signature = self.addresses.get(address)
+        if signature is None and self.networks:
+            ip = ipaddress.ip_address(address)
+            signature = next((signature for network, signature in self.networks if ip in network), None)
+        return signature
+
+    def check(self, records):
+        """Return the takeover report for one resolved name, or None if no signature matches."""
+        if records.status == 'NXDOMAIN':
+            condition = 'nxdomain'
+        elif records.status == 'NOERROR' and not records.addresses:
+            condition = 'noerror_empty'
+        else:
+            condition = None
+
+        if condition and records.cnames:
+            # Provider signatures may match any hop of the chain; the condition is about where it ends
+            for target in records.cnames:
+                for signature in self.trie.match(target):
+                    if condition in signature.conditions:
+                        return self.report(records, signature, f"CNAME to {target}, chain ends in {CONDITIONS[condition]}")
+            for signature in self.trie.root.signatures:
+                if condition in signature.conditions:
+                    return self.report(records, signature, f"CNAME to {records.cnames[-1]} is {CONDITIONS[condition]}")
+
+        for address in records.addresses:
+            signature = self.address_signature(address)
+            if signature is not None:
+                return self.report(records, signature, f"address {address} is in an unclaimed range")
+        return None
+
+    def report(self, records, signature, reason):
+        return f"{records.name}: {signature.service} takeover ({signature.confidence}): {reason}"
+
+def load_signatures(path=DEFAULT_SIGNATURES):
+    """Load a signature file into a FingerprintEngine."""
+    with open(path, 'r') as f:
+        return FingerprintEngine(json.load(f)['signatures'])
+
+def records_from_response(name, outcome):
+    """The Records of name from a UDP engine outcome (a response or the exception that ended the query)."""
+    if isinstance(outcome, Exception):
+        return Records(name, [], str(outcome), [])
+    rcode = outcome.rcode()
+    if rcode not in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+        return Records(name, [], dns.rcode.to_text(rcode), [])
+    try:
+        chaining = outcome.resolve_chaining()
+    except dns.exception.DNSException as e:
+        return Records(name, [], str(e), [])
+    cnames = [rrset[0].target.to_text(omit_final_dot=True).lower() for rrset in chaining.cnames]
+    addresses = [rdata.address for rdata in chaining.answer] if chaining.answer is not None else []
+    return Records(name, cnames, dns.rcode.to_text(rcode), addresses)
+
+def resolve_records(names, engine, nameserver):
+    """Yield the Records of every name as its A answer arrives from the UDP engine.
+
+    A chain that ends without IPv4 addresses is asked for AAAA before it is
+    called empty; those names follow in one batch after the rest.
+    """
+    no_ipv4 = {}
+    for (_, name, _), outcome in engine.run((nameserver, name, 'A') for name in names):
+        records = records_from_response(name, outcome)
+        if records.status == 'NOERROR' and records.cnames and not records.addresses:
+            no_ipv4[name] = records
+        else:
+            yield records
+    for (_, name, _), outcome in engine.run((nameserver, name, 'AAAA') for name in no_ipv4):
+        yield no_ipv4[name]._replace(addresses=records_from_response(name, outcome).addresses)
@@ -1,15 +1,44 @@
 import argparse
+import asyncio
 import requests
 import tldextract
+import dns.asyncresolver
 import dns.resolver
 import dns.exception
 import whois
-import subprocess
 import datetime
 import json
 import os
+import resource
+import secrets
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+# Shared helpers live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from crtsh import iter_certificates
+from dig_format import format_dig
+from dns_cache import DEFAULT_CACHE_FILE, SQLiteDNSCache
+from incremental import ScanState, answers_fingerprint
+from instrumentation import instrument, record_error, write_metrics
+from label_tree import LabelTree, is_own_nxdomain
+from profiling import profiled
+from rate_control import RateController, install_rate_control
+from results_sink import LOG_SUFFIXES, RESULTS_SUFFIX, LogFiles, ResultSink, subdomain_record
+from sharding import parse_shard, select_shard, shard_suffix
+from subdomain_cache import SubdomainCache
+from whitelist import Whitelist
+
+try:
+    from whois.exceptions import WhoisDomainNotFoundError
+except ImportError:
+    # python-whois before 0.9 raises its base error when a domain has no registration
+    from whois.parser import PywhoisError as WhoisDomainNotFoundError
+
 # Define ANSI color codes
 class Colors:
     HEADER = '\033[95m'
@@ -25,66 +54,83 @@ class Colors:
 CACHE_EXPIRY_DAYS = 1  # Cache expiry in days
 CACHE_DIR = 'cache'  # Directory where cache files will be stored
 
-def read_cache(cache_file):
-    """Read the cached data if it is still valid."""
-    if not os.path.exists(cache_file):
-        return None
+# WHOIS cache settings, shared by every run and target on this host
+WHOIS_CACHE_FILE = os.path.join(CACHE_DIR, 'whois_cache.json')
+WHOIS_CACHE_TTL_DAYS = 7
+# Errors python-whois raises when a domain has no registration (as opposed to a failed lookup)
+WHOIS_NOT_FOUND_ERRORS = (WhoisDomainNotFoundError,)
+WHOIS_RETRIES = 2            # Retries of a failed lookup (quota, timeout) before the status is unknown
+WHOIS_BACKOFF = 2.0          # Seconds before the first retry, doubled for each one after
+WHOIS_RETRY_INTERVAL = 60.0  # Seconds a domain whose lookup failed is reported unknown before it is tried again
+WHOIS_SAVE_BATCH = 100       # New entries written to the cache file at once
+WHOIS_SAVE_INTERVAL = 30.0   # Seconds after which fewer new entries are written anyway
 
-    try:
-        with open(cache_file, 'r') as f:
-            cache_data = json.load(f)
-        
-        # Check cache expiry
-        cache_time = datetime.fromisoformat(cache_data['timestamp'])
-        if datetime.now() - cache_time < timedelta(days=CACHE_EXPIRY_DAYS):
-            return set(cache_data['subdomains'])  # Convert to set
-        else:
-            return None
-    except (json.JSONDecodeError, KeyError, ValueError):
-        return None
+# Concurrency settings
+MAX_EXECUTOR_WORKERS = 64  # Upper bound on threads used for blocking WHOIS lookups
+
+# Wildcard detection
+WILDCARD_PROBES = 2  # Random labels probed under each parent zone
+
+# Batch mode
+CRTSH_WORKERS = 4  # Targets fetched from crt.sh at once
+TARGET_WINDOW = 4  # Targets whose names are expanded, pre-filtered and queued at once
 
-def write_cache(cache_file, subdomains):
-    """Write the data to cache file."""
-    cache_data = {
-        'timestamp': datetime.now().isoformat(),
-        'subdomains': list(subdomains)  # Convert to list
-    }
-    os.makedirs(os.path.dirname(cache_file), exist_ok=True)  # Ensure cache directory exists
-    with open(cache_file, 'w') as f:
-        json.dump(cache_data, f)
+def cache_is_fresh(fetched_at):
+    """Check whether a cache refreshed at the given unix time is still valid."""
+    return fetched_at is not None and datetime.now() - datetime.fromtimestamp(fetched_at) < timedelta(days=CACHE_EXPIRY_DAYS)
 
 def get_cache_filename(domain):
     """Generate a cache filename based on the domain."""
     sanitized_domain = domain.replace('.', '_')
-    return os.path.join(CACHE_DIR, f'{sanitized_domain}_cache.json')
+    return os.path.join(CACHE_DIR, f'{sanitized_domain}_cache.bin')
+
+def get_log_filename(domain, suffix, shard=None):
+    """Generate an output filename based on the domain and shard, e.g. example.com+results.jsonl."""
+    return f"{domain}{shard_suffix(shard)}{suffix}"
+
+def get_state_filename(domain, shard=None):
+    """Generate the incremental scan state filename based on the domain and shard."""
+    sanitized_domain = domain.replace('.', '_')
+    return os.path.join(CACHE_DIR, f'{sanitized_domain}{shard_suffix(shard)}_scan_state.json')
 
+@instrument()
 def fetch_subdomains_from_crtsh(domain):
     """Fetch subdomains from crt.sh with caching."""
-    cache_file = get_cache_filename(domain)
+    cache = SubdomainCache(get_cache_filename(domain))
     
     # Attempt to read from cache
-    cached_data = read_cache(cache_file)
-    if cached_data:
-        print(f"{Colors.YELLOW}Using cached data.{Colors.ENDC}")
-        return cached_data
+    fetched_at, max_cert_id, subdomains = cache.snapshot()
+    if subdomains and cache_is_fresh(fetched_at):
+        print(f"{Colors.WARNING}Using cached data.{Colors.ENDC}")
+        return subdomains
 
-    # Fetch from crt.sh
-    subdomains = set()
+    # Fetch from crt.sh; only certificates newer than the cached ones need merging
+    new_names = {}
     url = f"https://crt.sh/?q=%.{domain}&output=json"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        certificates = response.json()
-        for cert in certificates:
-            names = cert['name_value'].split('\n')
-            for name in names:
-                if name and name.endswith(f".{domain}"):
-                    subdomains.add(name.strip())
+        # Stream the certificates instead of materialising the whole (possibly huge) body
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            for cert in iter_certificates(response):
+                cert_id = cert.get('id', 0)
+                if cert_id <= max_cert_id:
+                    continue
+                names = cert['name_value'].split('\n')
+                for name in names:
+                    if name and name.endswith(f".{domain}"):
+                        name = name.strip()
+                        new_names[name] = max(new_names.get(name, 0), cert_id)
         
-        # Write fetched data to cache
-        write_cache(cache_file, subdomains)
+        # Merge the new names into the cache
+        cache.merge(new_names)
+        subdomains.update(new_names)
     except requests.exceptions.RequestException as e:
+        record_error('fetch_subdomains_from_crtsh', e)
         print(f"{Colors.FAIL}[ X ] Error fetching subdomains from crt.sh: {e}{Colors.ENDC}")
+    except ValueError as e:
+        # crt.sh answers overload with an HTML error page, which the stream parser rejects
+        record_error('fetch_subdomains_from_crtsh', e)
+        print(f"{Colors.FAIL}[ X ] Error parsing the crt.sh response: {e}{Colors.ENDC}")
     
     return subdomains
 
@@ -99,22 +145,14 @@ def read_whitelist(filename):
         return {line.strip() for line in f}
         '''
 def read_whitelist(filename):
-    """Read the nameserver whitelist from a file, handling both formats."""
+    """Read the nameserver whitelist (exact names, *.suffixes and globs) from a file into a Whitelist."""
     if not os.path.exists(filename):
         print(f"{Colors.FAIL}Whitelist file not found.{Colors.ENDC}")
-        return set()
+        return Whitelist()
     
-    whitelist = set()
     with open(filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                whitelist.add(line)
-                # Add the version with the trailing dot if it doesn't already exist
-                if not line.endswith('.'):
-                    whitelist.add(line + '.')
-    
-    return whitelist
+        # Case and trailing dots do not matter; see whitelist.py for the pattern syntax
+        return Whitelist(f)
 
 def check_website():
     print("Don't forget to enter the website link with Http/Https for the tool to work")
@@ -129,157 +167,661 @@ def check_website():
         print(f"{Colors.FAIL}[ X ] Error: Website does not exist or cannot be reached.{Colors.ENDC}")
         return None
 
-def is_domain_registered(domain):
+class WhoisCache:
+    """Registration status per registrable domain, held in memory and persisted to disk.
+
+    New entries are written out in batches (and by flush() at the end of a
+    run), not one file rewrite per lookup.
+    """
+
+    def __init__(self, cache_file=WHOIS_CACHE_FILE, ttl_days=WHOIS_CACHE_TTL_DAYS):
+        self.cache_file = cache_file
+        self.ttl = timedelta(days=ttl_days)
+        self.entries = self.load()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Serialises writers of the cache file
+        self.retry_after = {}   # domain -> monotonic time before which a failed lookup is not tried again
+        self.pending = {}       # domain -> future of the lookup in progress on the event loop
+        self.unsaved = 0
+        self.saved_at = time.monotonic()
+
+    def load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        """Merge our entries into the cache file and replace it atomically."""
+        with self.lock:
+            ours = dict(self.entries)
+            self.unsaved = 0
+            self.saved_at = time.monotonic()
+        with self.save_lock:
+            entries = self.load()
+            entries.update(ours)
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(entries, f)
+            os.replace(temp_file, self.cache_file)
+
+    def flush(self):
+        """Write out entries not saved yet."""
+        if self.unsaved:
+            self.save()
+
+    def fresh_entry(self, domain):
+        entry = self.entries.get(domain)
+        if entry and datetime.now() - datetime.fromisoformat(entry['timestamp']) < self.ttl:
+            return entry
+        return None
+
+    def cached(self, domain):
+        """The known status for domain; None (unknown) while a failed lookup waits for its retry."""
+        with self.lock:
+            entry = self.fresh_entry(domain)
+            if entry:
+                return True, entry['registered']
+            if time.monotonic() < self.retry_after.get(domain, 0):
+                return True, None
+            return False, None
+
+    def lookup(self, domain, fetch):
+        """Return True, False or None (could not check) for domain, calling fetch(domain) on a miss.
+
+        fetch returns the status or None; only definitive answers are cached.
+        """
+        hit, registered = self.cached(domain)
+        if hit:
+            return registered
+        registered = fetch(domain)
+        if registered is not None:
+            with self.lock:
+                self.retry_after.pop(domain, None)
+                self.entries[domain] = {'registered': registered, 'timestamp': datetime.now().isoformat()}
+                self.unsaved += 1
+                due = self.unsaved >= WHOIS_SAVE_BATCH or time.monotonic() - self.saved_at >= WHOIS_SAVE_INTERVAL
+            if due:
+                self.save()
+        return registered
+
+    def failed(self, domain):
+        """Report domain unknown for a while after its lookup failed every retry, then try it again."""
+        with self.lock:
+            self.retry_after[domain] = time.monotonic() + WHOIS_RETRY_INTERVAL
+
+whois_cache = WhoisCache()
+
+def get_registrable_domain(domain):
+    """Collapse a name to the domain it is registered under, e.g. a.b.example.co.uk -> example.co.uk."""
+    extracted = tldextract.extract(domain)
+    if extracted.domain and extracted.suffix:
+        return f"{extracted.domain}.{extracted.suffix}"
+    return domain
+
+def whois_lookup(domain):
+    """Return whether a registrable domain is registered, or None if this WHOIS lookup failed."""
     try:
         whois_info = whois.whois(domain)
-        if whois_info.status:
-            return True
+        return bool(whois_info.status)
+    except WHOIS_NOT_FOUND_ERRORS:
+        return False
     except Exception as e:
-        print(f"{Colors.WARNING}Domain {domain} is not registered or could not be checked.{Colors.ENDC}")
-    return False
+        record_error('is_domain_registered', e)
+        return None
+
+@instrument()
+def is_domain_registered(domain):
+    """One cached WHOIS attempt for domain's registrable domain: True, False or None if it failed."""
+    return whois_cache.lookup(get_registrable_domain(domain), whois_lookup)
+
+async def registration_status(subdomain):
+    """Whether subdomain is registered (True, False or None for unknown), retrying failed WHOIS lookups.
+
+    Registration only depends on the registrable domain, so every subdomain
+    shares one lookup, and concurrent callers wait for the one in progress.
+    """
+    domain = get_registrable_domain(subdomain)
+    hit, registered = whois_cache.cached(domain)
+    if hit:
+        return registered
+    future = whois_cache.pending.get(domain)
+    if future is None:
+        future = whois_cache.pending[domain] = asyncio.ensure_future(lookup_with_retries(domain))
+        future.add_done_callback(lambda _: whois_cache.pending.pop(domain, None))
+    # One caller giving up must not cancel the lookup the others wait for
+    return await asyncio.shield(future)
 
-def check_domain_dns(domain):
+async def lookup_with_retries(domain):
+    """Look domain up with is_domain_registered, backing off between failed attempts."""
+    # WHOIS is blocking, so it runs on the executor while other names resolve
+    loop = asyncio.get_running_loop()
+    for attempt in range(WHOIS_RETRIES + 1):
+        registered = await loop.run_in_executor(None, is_domain_registered, domain)
+        if registered is not None:
+            return registered
+        if attempt < WHOIS_RETRIES:
+            # The backoff waits on the event loop; no thread or lock is held meanwhile
+            await asyncio.sleep(WHOIS_BACKOFF * 2 ** attempt)
+    whois_cache.failed(domain)
+    print(f"{Colors.WARNING}Domain {domain} could not be checked with WHOIS after {WHOIS_RETRIES + 1} attempts.{Colors.ENDC}")
+    return None
+
+def split_nameserver(nameserver):
+    """Split a host or host:port nameserver spec into (host, port)."""
+    if nameserver.count(':') == 1:
+        host, port = nameserver.split(':')
+        return host, int(port)
+    return nameserver, 53
+
+def make_resolver(nameserver=None, dns_cache=None, rate_controller=None):
+    """Build an async resolver, optionally pinned to a single nameserver, backed by a cache and paced per server."""
+    resolver = dns.asyncresolver.Resolver(configure=not nameserver)
+    if nameserver:
+        host, port = split_nameserver(nameserver)
+        resolver.nameservers = [host]
+        resolver.port = port
+    resolver.cache = dns_cache
+    if rate_controller:
+        install_rate_control(resolver, rate_controller)
+    return resolver
+
+@instrument()
+async def check_domain_dns(domain, resolver, responses=None):
+    # The response (or the error) is kept in `responses` so the log can show it without re-querying
+    outcome = None
     try:
-        answers = dns.resolver.resolve(domain, 'A')
+        answers = await resolver.resolve(domain, 'A')
+        outcome = answers.response
         return True
-    except dns.resolver.NoAnswer:
+    except dns.resolver.NoAnswer as e:
+        outcome = e
         print(f"{Colors.WARNING}No A record found for {domain}.{Colors.ENDC}")
-    except dns.resolver.NXDOMAIN:
+    except dns.resolver.NXDOMAIN as e:
+        outcome = e
         print(f"{Colors.FAIL}Domain {domain} does not exist.{Colors.ENDC}")
     except dns.exception.DNSException as e:
+        outcome = e
         print(f"{Colors.FAIL}DNS exception for {domain}: {e}{Colors.ENDC}")
+    finally:
+        if isinstance(outcome, Exception):
+            record_error('check_domain_dns', outcome)
+        if responses is not None:
+            responses[(domain, 'A')] = outcome
     return False
 
-def check_nameservers(domain):
+@instrument()
+async def check_nameservers(domain, resolver, responses=None):
+    outcome = None
     try:
-        answers = dns.resolver.resolve(domain, 'NS')
+        answers = await resolver.resolve(domain, 'NS')
+        outcome = answers.response
         ns_records = [str(rdata) for rdata in answers]
         return ns_records
-    except dns.resolver.NoAnswer:
+    except dns.resolver.NoAnswer as e:
+        outcome = e
         print(f"{Colors.WARNING}No NS record found for {domain}.{Colors.ENDC}")
-    except dns.resolver.NXDOMAIN:
+    except dns.resolver.NXDOMAIN as e:
+        outcome = e
         print(f"{Colors.FAIL}Domain {domain} does not exist.{Colors.ENDC}")
     except dns.exception.DNSException as e:
+        outcome = e
         print(f"{Colors.FAIL}DNS exception for {domain}: {e}{Colors.ENDC}")
+    finally:
+        if isinstance(outcome, Exception):
+            record_error('check_nameservers', outcome)
+        if responses is not None:
+            responses[(domain, 'NS')] = outcome
     return []
 
-def run_dig_command(domain, record_type, log_file):
-    command = f"dig {domain} {record_type}"
+@instrument()
+async def run_dig_command(domain, record_type, resolver, outcome=None):
+    """Return dig-style output for a lookup, resolving in-process only if no outcome is at hand."""
+    if outcome is None:
+        try:
+            outcome = (await resolver.resolve(domain, record_type, raise_on_no_answer=False)).response
+        except dns.exception.DNSException as e:
+            outcome = e
+    server, port = None, resolver.port
+    if resolver.nameservers:
+        # Rate control swaps the plain addresses for Nameserver objects, whose str() is "Do53:addr@port"
+        nameserver = resolver.nameservers[0]
+        if isinstance(nameserver, str):
+            server = nameserver
+        else:
+            server, port = nameserver.answer_nameserver(), nameserver.answer_port()
+    return format_dig(domain, record_type, outcome, server=server, port=port)
+
+def record_subdomain_result(subdomain, has_dns, ns_records, whitelist, sink, dig=None, replayed=False, registered=True):
+    """Report the verdict for a registered (or not known to be unregistered) subdomain and write its record to the results sink."""
+    record = subdomain_record(subdomain, registered, has_dns, ns_records, whitelist, dig, replayed)
+    if has_dns:
+        print(f"{Colors.OKGREEN}Domain {subdomain} has DNS records.{Colors.ENDC}")
+        if record['foreign_ns']:
+            print(f"{Colors.WARNING}Domain {subdomain} has nameservers: {', '.join(record['foreign_ns'])}.{Colors.ENDC}")
+        elif ns_records:
+            print(f"{Colors.OKGREEN}Domain {subdomain} has nameservers that are all in the whitelist.{Colors.ENDC}")
+    else:
+        print(f"{Colors.FAIL}Domain {subdomain} does not have DNS records.{Colors.ENDC}")
+    sink.write(record)
+
+async def check_subdomain(subdomain, whitelist, sink, resolver, state=None):
+    """Fully check one subdomain, record the result and return its verdict.
+
+    With a ScanState the A and NS lookups come first and their answers are
+    fingerprinted; an unchanged name that is not due for re-verification
+    gets its last verdict replayed without a WHOIS lookup and None is returned.
+    """
+    print(f"{Colors.OKBLUE}Checking domain: {subdomain}{Colors.ENDC}")
+
+    responses = {}
+    if state is not None:
+        has_dns = await check_domain_dns(subdomain, resolver, responses)
+        ns_records = await check_nameservers(subdomain, resolver, responses)
+        fingerprint = answers_fingerprint(responses[(subdomain, 'A')], responses[(subdomain, 'NS')])
+        verdict = state.reusable(subdomain, fingerprint)
+        if verdict is not None:
+            replay_verdict(subdomain, verdict, whitelist, sink)
+            return None
+
+    registered = await registration_status(subdomain)
+    if registered is False:
+        print(f"{Colors.WARNING}Domain {subdomain} is not registered.{Colors.ENDC}")
+        sink.write(subdomain_record(subdomain, False))
+        verdict = {'registered': False}
+    else:
+        if registered:
+            print(f"{Colors.WARNING}Domain {subdomain} is registered.{Colors.ENDC}")
+        else:
+            # Unknown is not unregistered: the DNS checks still decide whether it alerts
+            print(f"{Colors.WARNING}Registration of {subdomain} is unknown; checking its DNS anyway.{Colors.ENDC}")
+        if state is None:
+            has_dns = await check_domain_dns(subdomain, resolver, responses)
+            ns_records = await check_nameservers(subdomain, resolver)
+        # Keep dig-style output of the A lookup with the record for detailed output
+        dig = await run_dig_command(subdomain, 'A', resolver, responses.get((subdomain, 'A')))
+        record_subdomain_result(subdomain, has_dns, ns_records, whitelist, sink, dig, registered=registered)
+        verdict = {'registered': registered, 'has_dns': has_dns, 'ns_records': ns_records}
+
+    if state is not None:
+        state.record(subdomain, fingerprint, verdict)
+    return verdict
+
+def replay_verdict(subdomain, verdict, whitelist, sink):
+    """Record a verdict carried over from an earlier run without re-checking the subdomain."""
+    print(f"{Colors.OKBLUE}Unchanged since last scan: {subdomain}{Colors.ENDC}")
+    if verdict['registered'] is not False:
+        record_subdomain_result(subdomain, verdict['has_dns'], verdict['ns_records'], whitelist, sink, replayed=True,
+                                registered=verdict['registered'])
+    else:
+        sink.write(subdomain_record(subdomain, False, replayed=True))
+
+async def run_bounded(items, check, concurrency):
+    """Await check(item) for every item with at most `concurrency` in flight."""
+    # Workers pull from one shared iterator so only `concurrency` checks exist at a time
+    pending = iter(items)
+
+    async def worker():
+        for item in pending:
+            try:
+                await check(item)
+            except Exception as e:
+                print(f"{Colors.FAIL}Error checking {item}: {e}{Colors.ENDC}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+def parent_zone(name):
+    return name.split('.', 1)[1] if '.' in name else name
+
+async def lookup_a(name, resolver):
+    """Return name's A answer as a set of rdata text plus its CNAME target, or None if it does not resolve."""
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        log_file.write(f"\nOutput for {domain} ({record_type}):\n")
-        log_file.write(result.stdout)
-    except subprocess.CalledProcessError as e:
-        log_file.write(f"Command failed with exit code {e.returncode}\n")
-        log_file.write(e.output)
-
-def detect_domain_shadowing(target_domain, subdomains_file, whitelist_file):
-    # Fetch subdomains from crt.sh with caching
-    crtsh_subdomains = fetch_subdomains_from_crtsh(target_domain)
-    
-    # Read additional subdomains from the provided file
+        answer = await resolver.resolve(name, 'A')
+    except dns.exception.DNSException:
+        return None
+    records = {rdata.to_text() for rdata in answer}
+    # A wildcard CNAME gives every name the same canonical name
+    if answer.canonical_name != answer.qname:
+        records.add(f"CNAME {answer.canonical_name}")
+    return records
+
+async def detect_wildcards(subdomains, resolver, concurrency):
+    """Probe random labels under each candidate's parent zone; return {zone: wildcard answers} for wildcard zones."""
+    wildcards = {}
+
+    async def probe(zone):
+        fingerprint = set()
+        for _ in range(WILDCARD_PROBES):
+            answers = await lookup_a(f"wildcard-probe-{secrets.token_hex(8)}.{zone}", resolver)
+            if answers is None:
+                return
+            fingerprint |= answers
+        wildcards[zone] = fingerprint
+
+    await run_bounded({parent_zone(subdomain) for subdomain in subdomains}, probe, concurrency)
+    return wildcards
+
+async def filter_wildcard_matches(subdomains, wildcards, resolver, concurrency, droppable=()):
+    """Drop names whose A answer is just their zone's wildcard; names in droppable are dropped unqueried."""
+    remaining, under_wildcard = [], []
+    dropped = 0
+    for subdomain in subdomains:
+        if parent_zone(subdomain) not in wildcards:
+            remaining.append(subdomain)
+        elif subdomain in droppable:
+            dropped += 1
+        else:
+            under_wildcard.append(subdomain)
+
+    matched = 0
+
+    async def compare(subdomain):
+        nonlocal matched
+        answers = await lookup_a(subdomain, resolver)
+        if answers is not None and answers <= wildcards[parent_zone(subdomain)]:
+            matched += 1
+        else:
+            remaining.append(subdomain)
+
+    await run_bounded(under_wildcard, compare, concurrency)
+    print(f"{Colors.HEADER}Wildcard DNS under {', '.join(sorted(wildcards))}: {matched} names matched the wildcard"
+          f" and {dropped} wordlist names were dropped without queries.{Colors.ENDC}")
+    return remaining
+
+async def prune_nxdomain_subtrees(subdomains, resolver, concurrency):
+    """Drop names below an NXDOMAIN ancestor (RFC 8020), probing the tree one depth at a time."""
+    tree = LabelTree(subdomains)
+    # Only names with something below them can cut anything; leaves are left to the full check
+    parents = {parent_zone(subdomain.lower()) for subdomain in subdomains}
+
+    async def probe(name):
+        try:
+            await resolver.resolve(name, 'A')
+        except dns.resolver.NXDOMAIN as e:
+            # A CNAME to a missing name is NXDOMAIN too, but only a missing name cuts its subtree
+            if is_own_nxdomain(name, e):
+                tree.mark_nxdomain(name)
+        except dns.exception.DNSException:
+            pass
+
+    for names, branch_points in tree.levels():
+        await run_bounded([name for name in names if name in parents] + branch_points, probe, concurrency)
+
+    if not tree.pruned:
+        return subdomains
+    print(f"{Colors.HEADER}NXDOMAIN cuts: {tree.pruned} names below nonexistent parents resolved without queries.{Colors.ENDC}")
+    return [subdomain for subdomain in subdomains if not tree.is_pruned(subdomain)]
+
+class ScanTarget:
+    """One apex domain with its results sink and, with --incremental, its scan state file.
+
+    The target's names (its crt.sh names plus the wordlist under the domain)
+    and its scan state are only built by load(), when the scan reaches the
+    target, and are dropped once its names are checked.
+    """
+
+    def __init__(self, domain, crtsh_subdomains, wordlist, sink, state_file=None, shard=None,
+                 prune_wildcard_wordlist=False):
+        self.domain = domain
+        self.crtsh_subdomains = crtsh_subdomains
+        self.wordlist = wordlist
+        self.sink = sink
+        self.state_file = state_file
+        self.shard = shard
+        self.prune_wildcard_wordlist = prune_wildcard_wordlist
+        self.state = None
+        self.checked = 0      # Names whose check has completed, after pruning and resume
+        self.reused = 0       # Names whose last verdict was replayed by an incremental scan
+        self.pending = 0      # Names of this target queued or being checked
+        self.finished = None  # Set once pending drops to zero
+
+    def load(self):
+        """Load the scan state and return this shard's names not already checked.
+
+        Returns (names to check, names droppable under a wildcard, {name:
+        verdict carried over from the scan state}).
+        """
+        self.state = ScanState(self.state_file) if self.state_file else None
+        additional_subdomains = {word + '.' + self.domain for word in self.wordlist}
+        # Wordlist guesses under a wildcard zone can optionally be dropped without querying them
+        droppable = additional_subdomains - self.crtsh_subdomains if self.prune_wildcard_wordlist else set()
+        subdomains = set(select_shard(self.crtsh_subdomains | additional_subdomains, self.shard)) - self.sink.completed
+        carried = {}
+        if self.state is not None:
+            # Names without a newer crt.sh certificate since the last run keep their verdict until they are due
+            self.state.crtsh_cert_id, renewed = SubdomainCache(get_cache_filename(self.domain)).renewed_since(
+                self.state.crtsh_cert_id)
+            now = datetime.now()
+            for subdomain in subdomains - renewed:
+                verdict = self.state.undue_verdict(subdomain, now)
+                if verdict is not None:
+                    carried[subdomain] = verdict
+            subdomains -= carried.keys()
+        return subdomains, droppable, carried
+
+    def __repr__(self):
+        return self.domain
+
+async def scan_targets(targets, whitelist, concurrency=1, nameserver=None, dns_cache=None, rate_controller=None):
+    """Check every target's subdomains through one queue with at most `concurrency` names in flight.
+
+    The targets share the resolver, caches and executor. Up to TARGET_WINDOW
+    targets are worked on at once, each on its own: names under a wildcard
+    zone that only get the wildcard's answer are filtered out first, then
+    names below an NXDOMAIN parent, and the rest are fed into a bounded queue
+    shared with the other targets. The pre-passes of the targets in the
+    window split another `concurrency` between them, and a target leaves the
+    window (and memory) once all its names are checked, so only a few
+    targets' candidate sets exist at a time. Targets with a ScanState replay
+    the verdict of names that have no newer crt.sh certificate since the last
+    run and are not due for re-verification without querying them, and reuse
+    the verdict of the other names whose DNS fingerprint, taken from the A and
+    NS answers the check needs anyway, is unchanged.
+    """
+    resolver = make_resolver(nameserver, dns_cache, rate_controller)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=min(concurrency, MAX_EXECUTOR_WORKERS)))
+
+    window = max(1, min(TARGET_WINDOW, len(targets)))
+    slots = asyncio.Semaphore(window)
+    prepass_concurrency = max(1, concurrency // window)
+    queue = asyncio.Queue(maxsize=max(1, concurrency))
+
+    async def scan(target):
+        async with slots:
+            print(f"{Colors.HEADER}Checking for domain shadowing for target domain: {target.domain}{Colors.ENDC}")
+            subdomains, droppable, carried = target.load()
+            for subdomain, verdict in carried.items():
+                replay_verdict(subdomain, verdict, whitelist, target.sink)
+            target.reused = len(carried)
+            subdomains = list(subdomains)
+            wildcards = await detect_wildcards(subdomains, resolver, prepass_concurrency)
+            if wildcards:
+                subdomains = await filter_wildcard_matches(subdomains, wildcards, resolver, prepass_concurrency, droppable)
+            remaining = await prune_nxdomain_subtrees(subdomains, resolver, prepass_concurrency)
+
+            target.pending = len(remaining)
+            target.finished = asyncio.Event()
+            for subdomain in remaining:
+                await queue.put((subdomain, target))
+            if remaining:
+                await target.finished.wait()
+            if target.state is not None:
+                print(f"{Colors.HEADER}Incremental scan of {target.domain}: "
+                      f"{len(remaining) + len(carried) - target.reused} names checked, {target.reused} unchanged.{Colors.ENDC}")
+                # Names a resumed run found in the results file keep their state entries too
+                target.state.save(set(remaining) | carried.keys() | target.sink.completed)
+                target.state = None
+
+    async def worker():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            subdomain, target = job
+            try:
+                if await check_subdomain(subdomain, whitelist, target.sink, resolver, target.state) is None:
+                    target.reused += 1
+                target.checked += 1
+            except Exception as e:
+                print(f"{Colors.FAIL}Error checking {subdomain}: {e}{Colors.ENDC}")
+            target.pending -= 1
+            if not target.pending:
+                target.finished.set()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*(scan(target) for target in targets))
+        # Every target waited for its names, so the queue is empty and has room for one stop per worker
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+
+def raise_open_file_limit(needed):
+    """Lift the soft open-file limit towards the hard one when many targets keep their results open."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed if hard == resource.RLIM_INFINITY else min(needed, hard), hard))
+
+def detect_domain_shadowing(target_domain, subdomains_file, whitelist_file, concurrency=1, nameserver=None, dns_cache=None,
+                            incremental=False, prune_wildcard_wordlist=False, shard=None, rate_controller=None,
+                            text_logs=False, resume=False):
+    alerts = detect_domain_shadowing_batch([target_domain], subdomains_file, whitelist_file, concurrency, nameserver,
+                                           dns_cache, incremental, prune_wildcard_wordlist, shard, rate_controller,
+                                           text_logs, resume)
+    return alerts[target_domain]
+
+def detect_domain_shadowing_batch(target_domains, subdomains_file, whitelist_file, concurrency=1, nameserver=None,
+                                  dns_cache=None, incremental=False, prune_wildcard_wordlist=False, shard=None,
+                                  rate_controller=None, text_logs=False, resume=False):
+    """Scan several apex domains in one process, sharing the wordlist, whitelist, resolver and caches.
+
+    Each target's results stream to <domain>+results.jsonl and its alert is
+    decided as they arrive; returns {domain: True if the alert should trigger}.
+    text_logs also renders the +.txt, +dns_and_ns.txt, +ns.txt and
+    +dns_only.txt views while scanning. With resume, names already in a
+    target's results file (from an interrupted run) are kept and not checked
+    again. With shard (K, N) only the names in shard K of N are checked and
+    the outputs and scan state get a shard tag; sharding.py merges the
+    shards' results.
+    """
+    # Read the wordlist once; it is expanded under every target
     try:
         with open(subdomains_file, 'r') as file:
-            additional_subdomains = {line.strip() + '.' + target_domain for line in file}
+            wordlist = [line.strip() for line in file]
     except FileNotFoundError:
         print(f"{Colors.FAIL}Subdomains file not found.{Colors.ENDC}")
         exit(1)
 
-    # Combine subdomains from both sources
-    all_subdomains = crtsh_subdomains.union(additional_subdomains)
-    
     # Read the whitelist
     whitelist = read_whitelist(whitelist_file)
-    
-    # Create timestamp for filenames
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # Define filenames for the logs
-    log_filename = f"{target_domain}+.txt"
-    dns_and_ns_log_filename = f"{target_domain}+dns_and_ns.txt"
-    ns_log_filename = f"{target_domain}+ns.txt"
-    dns_only_log_filename = f"{target_domain}+dns_only.txt"
 
+    # Fetch subdomains from crt.sh with caching, a few targets at a time
+    with ThreadPoolExecutor(max_workers=CRTSH_WORKERS) as executor:
+        crtsh_results = list(executor.map(fetch_subdomains_from_crtsh, target_domains))
+
+    raise_open_file_limit(len(target_domains) * (1 + (len(LOG_SUFFIXES) if text_logs else 0)) + 256)
+    sinks = {}
     try:
-        # Open the log files
-        with open(log_filename, 'w') as log_file, \
-             open(dns_and_ns_log_filename, 'w') as dns_and_ns_log_file, \
-             open(ns_log_filename, 'w') as ns_log_file, \
-             open(dns_only_log_filename, 'w') as dns_only_log_file:
-            print(f"{Colors.HEADER}Checking for domain shadowing for target domain: {target_domain}{Colors.ENDC}")
-
-            for subdomain in all_subdomains:
-                print(f"{Colors.OKBLUE}Checking domain: {subdomain}{Colors.ENDC}")
-                
-                if is_domain_registered(subdomain):
-                    print(f"{Colors.WARNING}Domain {subdomain} is registered.{Colors.ENDC}")
-                    
-                    if check_domain_dns(subdomain):
-                        print(f"{Colors.OKGREEN}Domain {subdomain} has DNS records.{Colors.ENDC}")
-                        
-                        # Check nameservers
-                        ns_records = check_nameservers(subdomain)
-                        if ns_records:
-                            # Filter out nameservers that are in the whitelist
-                            filtered_ns_records = [ns for ns in ns_records if ns not in whitelist]
-                            if filtered_ns_records:
-                                print(f"{Colors.WARNING}Domain {subdomain} has nameservers: {', '.join(filtered_ns_records)}.{Colors.ENDC}")
-                                # Log domains with both DNS records and nameservers not in whitelist
-                                dns_and_ns_log_file.write(f"{subdomain} has DNS records and nameservers: {', '.join(filtered_ns_records)}\n")
-                                # Log domains with nameservers not in whitelist
-                                ns_log_file.write(f"{subdomain} has nameservers: {', '.join(filtered_ns_records)}\n")
-                            else:
-                                print(f"{Colors.OKGREEN}Domain {subdomain} has nameservers that are all in the whitelist.{Colors.ENDC}")
-                                # Log domains with DNS records but no relevant nameservers
-                                dns_only_log_file.write(f"{subdomain} has DNS records but no relevant nameservers.\n")
-                    
-                    else:
-                        print(f"{Colors.FAIL}Domain {subdomain} does not have DNS records.{Colors.ENDC}")
-                        # Log in the main log file if it has nameservers but no DNS records
-                        ns_records = check_nameservers(subdomain)
-                        if ns_records:
-                            filtered_ns_records = [ns for ns in ns_records if ns not in whitelist]
-                            if filtered_ns_records:
-                                log_file.write(f"{subdomain} has nameservers but no DNS records.\n")
-                                # Log domains with nameservers not in whitelist
-                                ns_log_file.write(f"{subdomain} has nameservers: {', '.join(filtered_ns_records)}\n")
-                    
-                    # Run `dig` commands for detailed output
-                    run_dig_command(subdomain, 'A', log_file)
-                else:
-                    print(f"{Colors.WARNING}Domain {subdomain} is not registered.{Colors.ENDC}")
+        with ExitStack() as stack:
+            targets = []
+            for target_domain, crtsh_subdomains in zip(target_domains, crtsh_results):
+                # One JSONL stream per target; the text logs are optional views of it
+                views = None
+                if text_logs:
+                    views = LogFiles(*(stack.enter_context(open(get_log_filename(target_domain, suffix, shard), 'w'))
+                                       for suffix in LOG_SUFFIXES))
+                sink = stack.enter_context(ResultSink(get_log_filename(target_domain, RESULTS_SUFFIX, shard), views, resume))
+                sinks[target_domain] = sink
+                if sink.completed:
+                    print(f"{Colors.HEADER}Resuming {target_domain}: {len(sink.completed)} names already checked.{Colors.ENDC}")
+                state_file = get_state_filename(target_domain, shard) if incremental else None
+                targets.append(ScanTarget(target_domain, crtsh_subdomains, wordlist, sink, state_file, shard,
+                                          prune_wildcard_wordlist))
+
+            started = time.monotonic()
+            try:
+                asyncio.run(scan_targets(targets, whitelist, concurrency, nameserver, dns_cache, rate_controller))
+            finally:
+                whois_cache.flush()
+            elapsed = time.monotonic() - started
+            checked = sum(target.checked for target in targets)
+            print(f"{Colors.HEADER}Checked {checked} names in {elapsed:.1f}s "
+                  f"({checked / max(elapsed, 1e-9):.0f} names/s).{Colors.ENDC}")
 
     except Exception as e:
         print(f"{Colors.FAIL}Error: {e}{Colors.ENDC}")
 
     # Trigger the alert if a potential issue has been found
-    check_log_file(ns_log_filename)
+    return {target_domain: report_alert(target_domain, sinks.get(target_domain)) for target_domain in target_domains}
 
-def check_log_file(filename):
+def read_targets(filename):
+    """Read apex domains from a file, one per line; blank lines and # comments are skipped."""
     try:
         with open(filename, 'r') as file:
-            content = file.read().strip()
-
-        if not content:
-            print(f"{Colors.WARNING}Log file {filename} is empty which is good.{Colors.ENDC}")
-            return False
-
-        brief_info = content.split('\n')[:5]  # Adjust this to get the first few lines or any other summary
-        print(f"Attention! {Colors.OKGREEN}Log file contains the following information:{Colors.ENDC}")
-        for line in brief_info:
-            print(line)
-
-        return True  # Or json.dumps(brief_info, indent=4)
-
+            targets = [line.split('#', 1)[0].strip() for line in file]
     except FileNotFoundError:
-        print(f"{Colors.FAIL}Log file {filename} not found.{Colors.ENDC}")
+        print(f"{Colors.FAIL}Targets file not found.{Colors.ENDC}")
+        exit(1)
+    return list(dict.fromkeys(target for target in targets if target))
+
+def report_alert(target_domain, sink):
+    """Print the alert summary kept by a target's results sink; return True if the alert should trigger."""
+    if sink is None:
+        print(f"{Colors.FAIL}No results for {target_domain}.{Colors.ENDC}")
+        return False
+    if not sink.alerts:
+        print(f"{Colors.WARNING}No subdomain of {target_domain} has nameservers outside the whitelist, which is good.{Colors.ENDC}")
         return False
 
+    print(f"Attention! {Colors.OKGREEN}{sink.alerts} subdomains of {target_domain} have nameservers outside the whitelist "
+          f"({sink.path}):{Colors.ENDC}")
+    for line in sink.alert_preview:
+        print(line)
+    return True
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Detect potential domain shadowing.")
-    parser.add_argument('target_domain', type=str, help='The target domain to check for shadowing.')
+    parser.add_argument('target_domain', type=str, nargs='?', help='The target domain to check for shadowing.')
     parser.add_argument('subdomains_file', type=str, help='A file containing a list of subdomains to check.')
     parser.add_argument('whitelist_file', type=str, help='A file containing a list of nameservers to whitelist.')
+    parser.add_argument('--targets-file', type=str, help='Check every apex domain in this file (one per line) through one shared queue instead of target_domain.')
+    parser.add_argument('--concurrency', type=int, default=1, help='Maximum number of subdomains checked at once (default: 1).')
+    parser.add_argument('--nameserver', type=str, help='Resolve through this nameserver (host or host:port) instead of the system resolver.')
+    parser.add_argument('--dns-cache', type=str, default=DEFAULT_CACHE_FILE, help='Persistent DNS answer cache shared by the checkers (use a separate one with --nameserver).')
+    parser.add_argument('--no-dns-cache', action='store_true', help='Resolve everything from scratch.')
+    parser.add_argument('--no-rate-control', action='store_true', help='Query without adaptive per-server pacing and retries.')
+    parser.add_argument('--incremental', action='store_true', help='Only fully re-check names that are new, changed or due for re-verification.')
+    parser.add_argument('--shard', type=parse_shard, help='Only check shard K/N of the names (e.g. 2/4) so a sweep can be split across hosts.')
+    parser.add_argument('--prune-wildcard-wordlist', action='store_true', help='Drop wordlist names under wildcard zones without querying them.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run: names already in +results.jsonl are kept and not checked again.')
+    parser.add_argument('--text-logs', action='store_true', help='Also write the +.txt, +dns_and_ns.txt, +ns.txt and +dns_only.txt logs (results_sink.py can render them later).')
+    parser.add_argument('--profile', nargs='?', const='domain_shadowing.profile', metavar='PREFIX', help='Profile the scan into PREFIX.pstats and PREFIX.collapsed (flamegraph input) and print the hottest functions.')
+    parser.add_argument('--metrics-dir', type=str, help='Write per-phase timings here as domain_shadowing.prom (node_exporter textfile) and domain_shadowing.json.')
     args = parser.parse_args()
+    if bool(args.target_domain) == bool(args.targets_file):
+        parser.error('give either target_domain or --targets-file')
 
-    detect_domain_shadowing(args.target_domain, args.subdomains_file, args.whitelist_file)
+    target_domains = read_targets(args.targets_file) if args.targets_file else [args.target_domain]
+    dns_cache = None if args.no_dns_cache else SQLiteDNSCache(args.dns_cache)
+    rate_controller = None if args.no_rate_control else RateController()
+    with profiled(args.profile):
+        detect_domain_shadowing_batch(target_domains, args.subdomains_file, args.whitelist_file,
+                                      concurrency=args.concurrency, nameserver=args.nameserver, dns_cache=dns_cache,
+                                      incremental=args.incremental, prune_wildcard_wordlist=args.prune_wildcard_wordlist,
+                                      shard=args.shard, rate_controller=rate_controller, text_logs=args.text_logs,
+                                      resume=args.resume)
+    if dns_cache:
+        dns_cache.report()
+        dns_cache.close()
+    if rate_controller:
+        rate_controller.report()
+    if args.metrics_dir:
+        textfile, summary = write_metrics(args.metrics_dir, 'domain_shadowing',
+                                          rate_control=rate_controller.summary() if rate_controller else None)
+        print(f"Metrics written to {textfile} and {summary}")
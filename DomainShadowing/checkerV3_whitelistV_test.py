@@ -0,0 +1,219 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Tests for checkerV3_whitelistV against the benchmark stand-in server on
+# loopback. Run with `python checkerV3_whitelistV_test.py` or pytest.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import checkerV3_whitelistV as checker
+import sharding
+from bench_suite import ZONE, start_standin
+from incremental import REVERIFY_DAYS, rotation_slot
+from results_sink import RESULTS_SUFFIX, read_results
+from subdomain_cache import SubdomainCache
+
+HOST, LAME_HOST, PORT = '127.0.0.1', '127.0.0.2', 5364
+
+standin = None
+
+def standin_resolver(**resolver_args):
+    """Serve the synthetic zone (once per process); return a checker resolver pinned to it."""
+    global standin
+    if standin is None:
+        standin = start_standin(HOST, PORT, LAME_HOST)
+    return checker.make_resolver(f"{HOST}:{PORT}", **resolver_args)
+
+def test_prune_keeps_names_below_a_cname_to_a_missing_name():
+    # alias3 and alias4 are CNAMEs to missing names: NXDOMAIN answers that are not about them
+    names = [f"alias3.{ZONE}", f"api.alias3.{ZONE}", f"api.alias4.{ZONE}", f"www.alias4.{ZONE}",
+             f"gone.{ZONE}", f"www.gone.{ZONE}", f"a.www.gone.{ZONE}", f"x.dev.gone.{ZONE}", f"y.dev.gone.{ZONE}"]
+    kept = asyncio.run(checker.prune_nxdomain_subtrees(names, standin_resolver(), 4))
+    assert kept == [f"alias3.{ZONE}", f"api.alias3.{ZONE}", f"api.alias4.{ZONE}", f"www.alias4.{ZONE}",
+                    f"gone.{ZONE}"]
+
+@contextlib.contextmanager
+def scan_dir(crtsh_names):
+    """Run the enclosed block in a scratch directory whose fresh crt.sh cache holds crtsh_names ({name: cert id}).
+
+    WHOIS says every name is registered, so the stand-in gets every query.
+    Yields the paths of an empty wordlist and an empty whitelist.
+    """
+    standin_resolver()
+    previous = os.getcwd(), checker.is_domain_registered
+    with tempfile.TemporaryDirectory(prefix='checker-test-') as workdir:
+        os.chdir(workdir)
+        checker.is_domain_registered = lambda domain: True
+        try:
+            SubdomainCache(checker.get_cache_filename(ZONE)).merge(crtsh_names, fetched_at=time.time())
+            for filename in ('wordlist.txt', 'whitelist.txt'):
+                open(filename, 'w').close()
+            yield 'wordlist.txt', 'whitelist.txt'
+        finally:
+            os.chdir(previous[0])
+            checker.is_domain_registered = previous[1]
+
+def scan(wordlist, whitelist, **scan_args):
+    """Run one shadowing scan of ZONE; return its result records and the number of queries the stand-in answered."""
+    before = standin.answered()
+    checker.detect_domain_shadowing(ZONE, wordlist, whitelist, concurrency=4, nameserver=f"{HOST}:{PORT}",
+                                    **scan_args)
+    with open(checker.get_log_filename(ZONE, RESULTS_SUFFIX)) as f:
+        records = [json.loads(line) for line in f]
+    return [record for record in records if record['type'] == 'subdomain'], standin.answered() - before
+
+def verdicts(records):
+    return {record['name']: record['verdict'] for record in records}
+
+def test_incremental_scan_skips_unchanged_names_before_querying():
+    # Names that are not due for re-verification today, so only a newer certificate gets them checked
+    today = datetime.now().toordinal() % REVERIFY_DAYS
+    names = [name for name in (f"host{index}.{ZONE}" for index in range(40)) if rotation_slot(name) != today][:6]
+    with scan_dir(dict.fromkeys(names, 100)) as (wordlist, whitelist):
+        first, first_queries = scan(wordlist, whitelist, incremental=True)
+        assert sorted(record['name'] for record in first) == sorted(names) and first_queries > 0
+        assert not any(record.get('replayed') for record in first)
+
+        # Nothing changed: every verdict is replayed without a single query
+        second, second_queries = scan(wordlist, whitelist, incremental=True)
+        assert second_queries == 0
+        assert all(record['replayed'] for record in second)
+        assert verdicts(second) == verdicts(first)
+
+        # A newer certificate gets its name's A and NS looked up again; the answers are unchanged, so is the verdict
+        SubdomainCache(checker.get_cache_filename(ZONE)).merge({names[1]: 101})
+        third, third_queries = scan(wordlist, whitelist, incremental=True)
+        assert 0 < third_queries < first_queries
+        assert all(record['replayed'] for record in third) and verdicts(third) == verdicts(first)
+
+def test_checked_count_excludes_pruned_and_resumed_names():
+    names = [f"host1.{ZONE}", f"host2.{ZONE}", f"gone.{ZONE}", f"www.gone.{ZONE}", f"a.www.gone.{ZONE}"]
+    with scan_dir(dict.fromkeys(names, 100)) as (wordlist, whitelist):
+        for scan_args, checked in (({}, 3), ({'resume': True}, 0)):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                scan(wordlist, whitelist, **scan_args)
+            # The names below gone are cut by the NXDOMAIN pre-pass; a resumed run finds them all done
+            assert f"Checked {checked} names in" in output.getvalue()
+
+def crash_after(kept):
+    """Cut the results file after its first `kept` records and a torn line, as a crash mid-write leaves it."""
+    results_file = checker.get_log_filename(ZONE, RESULTS_SUFFIX)
+    with open(results_file) as f:
+        lines = f.readlines()
+    with open(results_file, 'w') as f:
+        f.writelines(lines[:kept])
+        f.write(lines[kept][:len(lines[kept]) // 2])
+    return [json.loads(line)['name'] for line in lines[:kept]]
+
+def test_resume_skips_the_names_checked_before_a_crash():
+    names = [f"host{index}.{ZONE}" for index in range(6)] + [f"dsub{index}.{ZONE}" for index in range(2)]
+    with scan_dir(dict.fromkeys(names, 100)) as (wordlist, whitelist):
+        with contextlib.redirect_stdout(io.StringIO()):
+            first, _ = scan(wordlist, whitelist)
+        done = crash_after(5)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            resumed, _ = scan(wordlist, whitelist, resume=True)
+        assert f"Resuming {ZONE}: 5 names already checked." in output.getvalue()
+        assert f"Checked {len(names) - 5} names in" in output.getvalue()
+        # The kept records stay first, the torn one is checked again, and no name is written twice
+        assert [record['name'] for record in resumed[:5]] == done
+        assert sorted(record['name'] for record in resumed) == sorted(names)
+        assert verdicts(resumed) == verdicts(first)
+        # The alert counts the records from before the crash as well
+        assert "2 subdomains of" in output.getvalue()
+
+def test_resumed_incremental_scan_keeps_the_state_of_names_checked_before_the_crash():
+    names = [f"host{index}.{ZONE}" for index in range(8)]
+    with scan_dir(dict.fromkeys(names, 100)) as (wordlist, whitelist):
+        with contextlib.redirect_stdout(io.StringIO()):
+            scan(wordlist, whitelist, incremental=True)
+            crash_after(3)
+            scan(wordlist, whitelist, incremental=True, resume=True)
+        with open(checker.get_state_filename(ZONE)) as f:
+            assert sorted(json.load(f)['names']) == sorted(names)
+
+def test_sharded_scans_merge_into_the_single_host_results():
+    names = [f"host{index}.{ZONE}" for index in range(6)] + [f"dsub{index}.{ZONE}" for index in range(4)]
+    with scan_dir(dict.fromkeys(names, 100)) as (wordlist, whitelist):
+        with contextlib.redirect_stdout(io.StringIO()):
+            single, _ = scan(wordlist, whitelist)
+            files = []
+            for index in (1, 2, 3):
+                checker.detect_domain_shadowing(ZONE, wordlist, whitelist, concurrency=4,
+                                                nameserver=f"{HOST}:{PORT}", shard=(index, 3))
+                files.append(checker.get_log_filename(ZONE, RESULTS_SUFFIX, (index, 3)))
+            assert sharding.merge_shadowing(ZONE, files, 'merged' + RESULTS_SUFFIX) is True
+        shards = [[record['name'] for record in read_results(file_path)] for file_path in files]
+        assert sorted(name for shard in shards for name in shard) == sorted(names)
+        # The records a single-host scan writes, apart from the message ids in the dig transcripts
+        merged = [dict(record, dig=None) for record in read_results('merged' + RESULTS_SUFFIX)]
+        assert merged == sorted((dict(record, dig=None) for record in single), key=lambda record: record['name'])
+        assert sum(record['alert'] for record in merged) == 4
+
+@contextlib.contextmanager
+def whois_scratch(lookup):
+    """Give the checker a fresh WHOIS cache in a scratch directory whose lookups go to lookup(domain)."""
+    previous = checker.whois_cache, checker.whois_lookup, checker.WHOIS_BACKOFF
+    with tempfile.TemporaryDirectory(prefix='whois-test-') as workdir:
+        checker.whois_cache = checker.WhoisCache(os.path.join(workdir, 'whois_cache.json'))
+        checker.whois_lookup = lookup
+        checker.WHOIS_BACKOFF = 0.05
+        try:
+            yield checker.whois_cache
+        finally:
+            checker.whois_cache, checker.whois_lookup, checker.WHOIS_BACKOFF = previous
+
+def test_whois_cache_saves_in_batches():
+    with whois_scratch(lambda domain: True) as cache:
+        for index in range(3):
+            assert checker.is_domain_registered(f"www.example{index}.com") is True
+        # Nothing is written per lookup; flush() writes what is new
+        assert not os.path.exists(cache.cache_file)
+        cache.flush()
+        with open(cache.cache_file) as f:
+            assert sorted(json.load(f)) == ['example0.com', 'example1.com', 'example2.com']
+        assert checker.WhoisCache(cache.cache_file).cached('example1.com') == (True, True)
+
+def test_whois_not_found_is_told_from_failed_lookups():
+    def fake_whois(domain):
+        if domain == 'unregistered.com':
+            raise checker.WhoisDomainNotFoundError(f"No match for {domain}")
+        raise TimeoutError('WHOIS server did not answer')
+
+    real_whois = checker.whois.whois
+    checker.whois.whois = fake_whois
+    try:
+        assert checker.whois_lookup('unregistered.com') is False
+        assert checker.whois_lookup('flaky.com') is None
+    finally:
+        checker.whois.whois = real_whois
+
+def test_whois_retries_back_off_without_blocking_other_lookups():
+    attempts = []
+
+    def lookup(domain):
+        attempts.append(domain)
+        return None if domain == 'flaky.com' and attempts.count(domain) < 3 else True
+
+    async def check(names):
+        return await asyncio.gather(*(checker.registration_status(name) for name in names))
+
+    with whois_scratch(lookup):
+        assert asyncio.run(check(['a.flaky.com', 'b.flaky.com', 'www.steady.com'])) == [True, True, True]
+    # The two flaky.com names share one lookup, retried twice; steady.com did not wait for its backoff
+    assert sorted(attempts) == ['flaky.com', 'flaky.com', 'flaky.com', 'steady.com']
+    assert attempts.index('steady.com') < 2
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,122 @@
+import re
+
+# Nameserver whitelist matching. A whitelist line is one of
+#
+#   ns1.example.com                        an exact name
+#   *.awsdns.com                           any name below awsdns.com, at any depth
+#   ns-*.awsdns-*.{com,net,org,co.uk}      a glob: * and ? match within one label,
+#                                          [...] is a character class and {a,b}
+#                                          expands to one pattern per alternative
+#
+# Case and trailing dots are ignored, and # starts a comment. Every pattern is
+# stored in a trie keyed by the reversed labels of its literal suffix (the
+# labels after the last one with a wildcard), and the globs stored at a node
+# are compiled together into one regular expression. Checking a name walks
+# its labels once and tries only the regexes on that path, so the cost does
+# not grow with the size of the whitelist.
+
+GLOB_CHARS = set('*?[')
+BRACE = re.compile(r'\{([^{}]*)\}')
+
+def normalise(name):
+    return name.strip().rstrip('.').lower()
+
+def expand_braces(pattern):
+    """Expand the first {a,b,...} group of pattern, recursively; return the list of patterns."""
+    match = BRACE.search(pattern)
+    if match is None:
+        return [pattern]
+    head, tail = pattern[:match.start()], pattern[match.end():]
+    return [expanded for alternative in match.group(1).split(',')
+            for expanded in expand_braces(head + alternative + tail)]
+
+def glob_to_regex(glob):
+    """Translate a glob over whole labels to a regular expression; wildcards never match a dot."""
+    regex = []
+    index = 0
+    while index < len(glob):
+        char = glob[index]
+        if char == '*':
+            regex.append('[^.]*')
+        elif char == '?':
+            regex.append('[^.]')
+        elif char == '[' and ']' in glob[index + 2:]:
+            end = glob.index(']', index + 2)
+            members = glob[index + 1:end].replace('\\', '\\\\')
+            if members.startswith('!'):
+                # A negated class still stays within the label
+                members = '^.' + members[1:]
+            regex.append(f"[{members}]")
+            index = end
+        else:
+            regex.append(re.escape(char))
+        index += 1
+    return ''.join(regex)
+
+class Node:
+    __slots__ = ('children', 'exact', 'suffix', 'globs', 'regex')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = False   # The name ending here is whitelisted
+        self.suffix = False  # Every name below this one is whitelisted
+        self.globs = []      # Regex sources for the labels in front of this suffix
+        self.regex = None    # The globs compiled together, built on first use
+
+class Whitelist:
+    """Compiled nameserver whitelist; `name in whitelist` tells whether a nameserver is allowed."""
+
+    def __init__(self, patterns=()):
+        self.root = Node()
+        self.patterns = 0
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, line):
+        """Add one whitelist line (exact name, *.suffix or glob, braces allowed)."""
+        for pattern in expand_braces(normalise(line.split('#', 1)[0])):
+            pattern = normalise(pattern)
+            if not pattern:
+                continue
+            labels = pattern.split('.')
+            # The literal suffix: the labels after the last one with a wildcard
+            literal = len(labels)
+            while literal and not GLOB_CHARS & set(labels[literal - 1]):
+                literal -= 1
+            suffix_all = literal == 1 and labels[0] == '*'
+            node = self.root
+            for label in reversed(labels[literal:]):
+                node = node.children.setdefault(label, Node())
+            if suffix_all:
+                node.suffix = True
+            elif literal == 0:
+                node.exact = True
+            else:
+                node.globs.append(glob_to_regex('.'.join(labels[:literal])))
+                node.regex = None
+            self.patterns += 1
+
+    def __len__(self):
+        return self.patterns
+
+    def __contains__(self, name):
+        name = normalise(name)
+        if not name:
+            return False
+        node = self.root
+        end = len(name)  # name[:end] holds the labels not walked yet
+        for label in reversed(name.split('.')):
+            if node.globs and self.node_regex(node).fullmatch(name, 0, end):
+                return True
+            node = node.children.get(label)
+            if node is None:
+                return False
+            end -= len(label) + 1
+            if node.suffix and end > 0:
+                return True
+        return node.exact
+
+    def node_regex(self, node):
+        if node.regex is None:
+            node.regex = re.compile('|'.join(f"(?:{glob})" for glob in node.globs))
+        return node.regex
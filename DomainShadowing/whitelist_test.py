@@ -0,0 +1,62 @@
+import os
+import sys
+
+# Tests for nameserver whitelist matching. Run with `python whitelist_test.py` or pytest.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from whitelist import Whitelist, expand_braces
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'whitelist_sample.txt')
+
+def test_exact_names():
+    whitelist = Whitelist(['ns1.example.com', 'NS2.Example.com.  # trailing comment', '', '# only a comment'])
+    assert len(whitelist) == 2
+    for name in ('ns1.example.com', 'ns1.example.com.', 'NS1.EXAMPLE.COM', 'ns2.example.com'):
+        assert name in whitelist
+    for name in ('ns3.example.com', 'example.com', 'a.ns1.example.com', 'ns1.example.co', '', '.'):
+        assert name not in whitelist
+
+def test_suffixes_match_at_any_depth():
+    whitelist = Whitelist(['*.awsdns.com'])
+    for name in ('ns1.awsdns.com', 'a.b.c.awsdns.com.', 'NS1.AWSDNS.COM'):
+        assert name in whitelist
+    for name in ('awsdns.com', 'ns1.awsdns.co', 'ns1.notawsdns.com', 'ns1.awsdns.com.evil.net'):
+        assert name not in whitelist
+
+def test_globs_match_within_a_label():
+    whitelist = Whitelist(['ns-*.awsdns-*.{com,net,org,co.uk}', 'ns?.example.net', 'dns[0-9].example.org',
+                           'x[!a-c].example.org'])
+    for name in ('ns-43.awsdns-05.com', 'ns-543.awsdns-03.net.', 'ns-1.awsdns-2.co.uk', 'NS-7.AWSDNS-8.ORG',
+                 'ns1.example.net', 'dns7.example.org', 'xd.example.org'):
+        assert name in whitelist
+    for name in ('ns-43.awsdns-05.io', 'ns-43.x.awsdns-05.com', 'a.ns-43.awsdns-05.com', 'ns-43.awsdns-05.uk',
+                 'ns12.example.net', 'ns.example.net', 'dnsx.example.org', 'xa.example.org', 'x..example.org'):
+        assert name not in whitelist
+
+def test_brace_expansion():
+    assert expand_braces('ns.{a,b}.{com,net}') == ['ns.a.com', 'ns.a.net', 'ns.b.com', 'ns.b.net']
+    assert expand_braces('ns1.example.com') == ['ns1.example.com']
+    assert len(Whitelist(['ns.{a,b}.{com,net}'])) == 4
+
+def test_mixed_patterns_share_suffixes():
+    whitelist = Whitelist(['ns1.example.com', '*.dns.example.com', 'edge-*.example.com'])
+    assert 'ns1.example.com' in whitelist and 'a.dns.example.com' in whitelist and 'edge-7.example.com' in whitelist
+    assert 'ns2.example.com' not in whitelist and 'dns.example.com' not in whitelist
+    assert 'edge-7.cdn.example.com' not in whitelist
+
+def test_sample_whitelist():
+    with open(SAMPLE) as f:
+        lines = f.readlines()
+    whitelist = Whitelist(lines)
+    # The exact entries only; the Route 53 glob is a commented-out example
+    assert len(whitelist) == 3
+    for name in ('ns-43.awsdns-05.com.', 'ns-543.awsdns-03.net', 'ns-471.awsdns-58.com'):
+        assert name in whitelist
+    assert 'ns-1.awsdns-2.org' not in whitelist
+    glob = Whitelist(line.lstrip('# ') for line in lines if line.startswith('# ns-'))
+    assert 'ns-1.awsdns-2.org' in glob and 'ns-43.awsdns-05.com' in glob
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
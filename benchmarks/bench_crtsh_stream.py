@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from crtsh import iter_certificates
+
+# Serves a synthetic crt.sh dump from a local HTTP stand-in and compares the
+# streaming parser against response.json(): time to first name, total time
+# and peak Python memory.
+
+def certificate(index, domain):
+    return {
+        'issuer_ca_id': 183267, 'issuer_name': 'C=US, O=Let\'s Encrypt, CN=R3',
+        'common_name': f"host{index}.{domain}",
+        'name_value': f"host{index}.{domain}\nwww.host{index}.{domain}",
+        'id': 10000000 + index, 'entry_timestamp': '2024-01-01T00:00:00.000',
+        'not_before': '2024-01-01T00:00:00', 'not_after': '2024-04-01T00:00:00', 'serial_number': f"{index:032x}",
+    }
+
+def make_handler(count, domain):
+    class CrtshHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            # Generated on the fly so the server itself holds no large buffer
+            self.wfile.write(b'[')
+            for index in range(count):
+                prefix = b',' if index else b''
+                self.wfile.write(prefix + json.dumps(certificate(index, domain)).encode())
+            self.wfile.write(b']')
+
+        def log_message(self, *args):
+            pass
+
+    return CrtshHandler
+
+def measure(url, streaming):
+    tracemalloc.start()
+    started = time.perf_counter()
+    first_name = None
+    subdomains = set()
+    with requests.get(url, stream=streaming) as response:
+        certificates = iter_certificates(response) if streaming else response.json()
+        for cert in certificates:
+            for name in cert['name_value'].split('\n'):
+                subdomains.add(name)
+            if first_name is None:
+                first_name = time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(subdomains), first_name, elapsed, peak
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark streaming crt.sh parsing against response.json().")
+    parser.add_argument('--certificates', type=int, default=500000, help='Number of synthetic certificates served.')
+    parser.add_argument('--domain', type=str, default='example.com')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.certificates, args.domain))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/?q=%.{args.domain}&output=json"
+
+    for label, streaming in (('streaming', True), ('response.json()', False)):
+        names, first_name, elapsed, peak = measure(url, streaming)
+        print(f"{label:>16}: {names} names, first after {first_name * 1000:.0f}ms, "
+              f"total {elapsed:.2f}s, peak {peak / 1e6:.1f} MB")
+    server.shutdown()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DanglingRecords'))
+
+import V9
+
+# Scales V9_test_dummy.txt up and measures time and peak Python memory of
+# V9.extract_takeovers. Peak memory should stay flat as --scale grows.
+
+DUMMY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DanglingRecords', 'V9_test_dummy.txt')
+
+def build_scaled_file(scale, directory):
+    with open(DUMMY_FILE, 'r') as f:
+        dummy = f.read()
+    path = os.path.join(directory, 'all_outputs.txt')
+    with open(path, 'w') as f:
+        for _ in range(scale):
+            f.write(dummy)
+    return path
+
+def measure(path, start_offset=0):
+    tracemalloc.start()
+    started = time.perf_counter()
+    takeovers = V9.extract_takeovers(path, start_offset)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(takeovers), elapsed, peak
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark streaming takeover extraction.")
+    parser.add_argument('--scale', type=int, default=10000, help='How many copies of the dummy output to concatenate.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = build_scaled_file(args.scale, directory)
+        size_mb = os.path.getsize(path) / 1e6
+
+        count, elapsed, peak = measure(path)
+        print(f"Full scan of {size_mb:.0f} MB: {count} takeovers in {elapsed:.2f}s, "
+              f"peak {peak / 1e6:.1f} MB (takeover text included)")
+
+        # A run that only appended one more copy scans just that segment
+        offset = os.path.getsize(path)
+        with open(DUMMY_FILE, 'r') as dummy, open(path, 'a') as f:
+            f.write(dummy.read())
+        count, elapsed, peak = measure(path, offset)
+        print(f"Latest-run segment only: {count} takeovers in {elapsed * 1000:.1f}ms, peak {peak / 1e3:.0f} kB")
@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import dns.resolver
+import dns.version
+
+# Shared helpers live at the repository root
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin_dns import start
+
+# Reproducible throughput suite: the checkers run against the synthetic
+# stand-in zone (see ScenarioProtocol in standin_dns.py) at increasing scale.
+# Every check runs in a fresh child process so its peak RSS can be read from
+# wait4(); the stand-in runs on a thread of this process and counts the
+# queries it answers. crt.sh and WHOIS are replaced with the generated names
+# and "registered" inside the child, so nothing leaves the machine.
+#
+#   python bench_suite.py --save-baseline baseline.json
+#   python bench_suite.py --compare baseline.json   # exit status 1 on a regression
+
+ZONE = 'bench.test'
+SCALES = [1000, 10000, 110000]
+CHECKS = ['lame', 'shadowing', 'dangling', 'takeover']
+LAME_WORKERS = 16        # Domains checked at once by the lame delegation run
+SHADOWING_CONCURRENCY = 64
+TOLERANCE = 0.2          # Relative slowdown (or growth in p99 and RSS) counted as a regression
+
+def scenario_labels(count):
+    """Names relative to the zone: 70% plain hosts, 10% under the wildcard, 5% delegated subzones,
+    5% dangling CNAMEs and 10% below the NXDOMAIN subtree."""
+    labels = []
+    for index in range(count):
+        kind = index % 20
+        if kind < 14:
+            labels.append(f"host{index}")
+        elif kind < 16:
+            labels.append(f"w{index}.wild")
+        elif kind == 16:
+            labels.append(f"dsub{index}")
+        elif kind == 17:
+            labels.append(f"dangling{index}")
+        else:
+            labels.append(f"g{index}.gone")
+    return labels
+
+def point_default_resolver(host, port):
+    resolver = dns.resolver.Resolver(configure=False)
+    resolver.nameservers = [host]
+    resolver.port = port
+    dns.resolver.default_resolver = resolver
+    return resolver
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run_lame(count, host, port):
+    import lame_delegation_check as lame
+    from rate_control import install_rate_control
+    lame.NAME_SERVER_PORT = port
+    install_rate_control(point_default_resolver(host, port), lame.rate_controller)
+
+    def timed(domain):
+        started = time.perf_counter()
+        lame.check_lame_delegation(domain)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=LAME_WORKERS) as executor:
+        latencies = list(executor.map(timed, (f"lame{index}.{ZONE}" for index in range(count))))
+    lame.tcp_pool.close()
+    return latencies
+
+def run_shadowing(count, host, port):
+    sys.path.insert(0, os.path.join(ROOT, 'DomainShadowing'))
+    import checkerV3_whitelistV as shadowing
+    from rate_control import RateController
+    shadowing.fetch_subdomains_from_crtsh = lambda domain: set()
+    shadowing.is_domain_registered = lambda domain: True
+
+    latencies = []
+    check_subdomain = shadowing.check_subdomain
+
+    async def timed(*args):
+        started = time.perf_counter()
+        try:
+            return await check_subdomain(*args)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    shadowing.check_subdomain = timed
+    with open('wordlist.txt', 'w') as f:
+        f.writelines(label + '\n' for label in scenario_labels(count))
+    with open('whitelist.txt', 'w') as f:
+        f.write(f"ns-good.{ZONE}\n")
+    shadowing.detect_domain_shadowing(ZONE, 'wordlist.txt', 'whitelist.txt', concurrency=SHADOWING_CONCURRENCY,
+                                      nameserver=f"{host}:{port}", rate_controller=RateController())
+    return latencies
+
+def run_dangling(count, host, port):
+    sys.path.insert(0, os.path.join(ROOT, 'DanglingRecords'))
+    import DanglingRecordsV7 as dangling
+    point_default_resolver(host, port)
+    names = [f"{label}.{ZONE}" for label in scenario_labels(count)]
+    dangling.get_subdomains = lambda domain: names
+
+    latencies = []
+    check_dangling_dns = dangling.check_dangling_dns
+
+    def timed(*args):
+        started = time.perf_counter()
+        try:
+            return check_dangling_dns(*args)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    dangling.check_dangling_dns = timed
+    dangling.main(ZONE)
+    return latencies
+
+def run_takeover(count, host, port):
+    sys.path.insert(0, os.path.join(ROOT, 'DanglingRecords'))
+    import V9
+    from fingerprints import load_signatures
+    from udp_engine import UDPEngine
+    names = [f"{label}.{ZONE}" for label in scenario_labels(count)]
+    V9.get_subdomains = lambda domain, wordlist_file: names
+    # Names are matched as their answers stream in, so there is no per-name latency to report
+    V9.main(ZONE, None, signatures=load_signatures(), engine=UDPEngine(port=port), nameserver=host)
+    return []
+
+RUNNERS = {'lame': run_lame, 'shadowing': run_shadowing, 'dangling': run_dangling, 'takeover': run_takeover}
+
+def run_child(check, count, host, port, result_file):
+    """Body of the child process: run one check and write its timings to result_file."""
+    started = time.perf_counter()
+    latencies = RUNNERS[check](count, host, port)
+    elapsed = time.perf_counter() - started
+    with open(result_file, 'w') as f:
+        json.dump({'elapsed': elapsed, 'latencies': latencies}, f)
+
+def start_standin(host, port, lame_host):
+    """Serve the synthetic zone from a background thread; return the protocol (for its query counters)."""
+    ready = threading.Event()
+    state = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            state['protocol'], _ = loop.run_until_complete(start(host, port, ZONE, synthetic=True, lame_host=lame_host))
+        except OSError as e:
+            state['error'] = e
+            ready.set()
+            return
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    if 'error' in state:
+        sys.exit(f"Could not start the stand-in on {host}:{port} / {lame_host}:{port}: {state['error']}")
+    return state['protocol']
+
+def measure(check, count, protocol, host, port):
+    """Run one check at one scale in a child process and return its metrics."""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{check}-") as workdir:
+        result_file = os.path.join(workdir, 'result.json')
+        queries_before = protocol.answered()
+        started = time.perf_counter()
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', check, str(count),
+                                  '--host', host, '--port', str(port), '--result', result_file],
+                                 cwd=workdir, stdout=subprocess.DEVNULL)
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.perf_counter() - started
+        if child.returncode != 0 or not os.path.exists(result_file):
+            raise RuntimeError(f"{check} at {count} names failed with exit status {child.returncode}")
+        with open(result_file, 'r') as f:
+            result = json.load(f)
+
+    queries = protocol.answered() - queries_before
+    latencies = result['latencies']
+    p50, p99 = percentile(latencies, 0.50), percentile(latencies, 0.99)
+    return {
+        'names': count,
+        'elapsed_s': round(result['elapsed'], 3),
+        'wall_s': round(wall, 3),
+        'queries': queries,
+        'qps': round(queries / result['elapsed'], 1),
+        'names_per_s': round(count / result['elapsed'], 1),
+        'p50_ms': None if p50 is None else round(p50 * 1000, 2),
+        'p99_ms': None if p99 is None else round(p99 * 1000, 2),
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),  # ru_maxrss is in KiB on Linux
+    }
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline; return the list of regressions."""
+    regressions = []
+    for check, scales in results.items():
+        for scale, current in scales.items():
+            previous = baseline.get(check, {}).get(scale)
+            if previous is None:
+                print(f"{check} @ {scale}: no baseline")
+                continue
+            changes = []
+            for metric, higher_is_worse in (('qps', False), ('p99_ms', True), ('peak_rss_mb', True)):
+                if not previous.get(metric) or current.get(metric) is None:
+                    continue
+                change = current[metric] / previous[metric] - 1
+                changes.append(f"{metric} {previous[metric]} -> {current[metric]} ({change:+.0%})")
+                if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                    regressions.append(f"{check} @ {scale}: {metric} {change:+.0%}")
+            print(f"{check} @ {scale}: " + ', '.join(changes))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the checkers against a local synthetic authoritative server.")
+    parser.add_argument('--checks', nargs='+', choices=CHECKS, default=CHECKS)
+    parser.add_argument('--scales', nargs='+', type=int, default=SCALES, help='Numbers of names (or domains, for lame) per run.')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--lame-host', type=str, default='127.0.0.2', help='Address of the lame name server (any loopback address other than --host).')
+    parser.add_argument('--port', type=int, default=5354)
+    parser.add_argument('--save-baseline', type=str, help='Write the results to this JSON file.')
+    parser.add_argument('--compare', type=str, help='Compare against a baseline JSON file; exit with status 1 on a regression.')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='Relative change counted as a regression (default: 0.2).')
+    parser.add_argument('--child', nargs=2, metavar=('CHECK', 'COUNT'), help=argparse.SUPPRESS)
+    parser.add_argument('--result', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]), args.host, args.port, args.result)
+        sys.exit(0)
+
+    protocol = start_standin(args.host, args.port, args.lame_host)
+    results = {}
+    for check in args.checks:
+        for scale in args.scales:
+            metrics = measure(check, scale, protocol, args.host, args.port)
+            results.setdefault(check, {})[str(scale)] = metrics
+            print(f"{check:>10} @ {scale:>6}: {metrics['qps']:>8} qps, {metrics['names_per_s']:>8} names/s, "
+                  f"p50 {metrics['p50_ms'] or '-'}ms, p99 {metrics['p99_ms'] or '-'}ms, peak RSS {metrics['peak_rss_mb']}MB")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'environment': {'python': platform.python_version(), 'dnspython': dns.version.version,
+                                'platform': platform.platform(), 'cpus': os.cpu_count()},
+                'results': results,
+            }, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print("Regressions: " + '; '.join(regressions))
+            sys.exit(1)
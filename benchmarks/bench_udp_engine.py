@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import dns.exception
+import dns.message
+import dns.query
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from udp_engine import UDPEngine
+
+# Compares the single-loop UDP engine against one blocking dns.query.udp call
+# per probe on a thread pool (how check_record_type sends its probes). Start
+# the stand-in first, e.g. `python standin_dns.py example.test --port 5353`.
+
+def threaded(server, port, names, record_type, workers):
+    def probe(name):
+        try:
+            return dns.query.udp(dns.message.make_query(name, record_type), server, port=port, timeout=2)
+        except dns.exception.DNSException as e:
+            return e
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(probe, names))
+
+def engine(server, port, names, record_type, in_flight, parse=True):
+    udp_engine = UDPEngine(max_in_flight=in_flight, port=port, parse=parse)
+    return [outcome for _, outcome in udp_engine.run((server, name, record_type) for name in names)]
+
+def measure(label, run):
+    started = time.perf_counter()
+    outcomes = run()
+    elapsed = time.perf_counter() - started
+    answered = sum(not isinstance(outcome, Exception) for outcome in outcomes)
+    print(f"{label:>24}: {answered}/{len(outcomes)} answered in {elapsed:.2f}s ({len(outcomes) / elapsed:.0f} qps)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the UDP engine against threaded dns.query.udp probes.")
+    parser.add_argument('--server', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5353)
+    parser.add_argument('--zone', type=str, default='example.test')
+    parser.add_argument('--queries', type=int, default=50000)
+    parser.add_argument('--threads', type=int, default=256, help='Thread pool size for the dns.query.udp baseline.')
+    parser.add_argument('--in-flight', type=int, default=2000, help='Queries the engine keeps in flight.')
+    args = parser.parse_args()
+
+    names = [f"host{index}.{args.zone}" for index in range(args.queries)]
+    measure(f"dns.query.udp x{args.threads}", lambda: threaded(args.server, args.port, names, 'A', args.threads))
+    measure(f"UDPEngine ({args.in_flight} in flight)", lambda: engine(args.server, args.port, names, 'A', args.in_flight))
+    measure("UDPEngine, raw wire", lambda: engine(args.server, args.port, names, 'A', args.in_flight, parse=False))
@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import socket
+import struct
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+# A small authoritative stand-in so the checkers can be pointed at something
+# local (e.g. `--nameserver 127.0.0.1:5353`) when measuring throughput.
+# By default every name in the zone has an A record; --synthetic instead
+# serves the fixed test cases of ScenarioProtocol (wildcard, lame, dangling
+# CNAME and delegated-subzone names) that bench_suite.py runs the checkers on.
+
+DEFAULT_ADDRESS = '192.0.2.1'
+DEFAULT_TTL = 300
+SOCKET_BUFFER = 8 * 1024 * 1024
+TYPE_A = 1
+UDP_LIMIT = 512  # Answers larger than this are truncated over UDP (queries carry no EDNS)
+LARGE_TXT = ['"' + 'x' * 200 + f' {index}"' for index in range(8)]  # Too big for UDP, so it exercises TCP fallback
+HEADER = struct.Struct('>HHHHHH')
+
+def parse_question(data):
+    """Return (lower-case qname labels, qtype, end of question) straight from the wire, or None."""
+    labels = []
+    offset = 12
+    while True:
+        length = data[offset]
+        if length == 0:
+            break
+        if length & 0xC0:
+            return None  # Compressed names do not occur in questions; leave them to dnspython
+        labels.append(data[offset + 1:offset + 1 + length].lower())
+        offset += 1 + length
+    qtype = int.from_bytes(data[offset + 1:offset + 3], 'big')
+    return labels, qtype, offset + 5
+
+class StandinProtocol(asyncio.DatagramProtocol):
+    def __init__(self, zone, address=DEFAULT_ADDRESS, nxdomain=()):
+        self.zone = dns.name.from_text(zone)
+        self.address = address
+        # Subtrees that do not exist, so NXDOMAIN handling can be measured too
+        self.nxdomain = [dns.name.from_text(name) for name in nxdomain]
+        # A queries in the zone are answered on the wire without building messages, for engine benchmarks
+        self.zone_labels = [label.lower() for label in self.zone.labels[:-1]]
+        self.nxdomain_labels = [[label.lower() for label in name.labels[:-1]] for name in self.nxdomain]
+        self.answer_rdata = b'\xc0\x0c' + struct.pack('>HHIH', TYPE_A, 1, DEFAULT_TTL, 4) + socket.inet_aton(address)
+        self.queries = 0
+        self.connections = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+
+    def fast_answer(self, data):
+        """Answer a plain in-zone A query directly on the wire; None means take the slow path."""
+        if len(data) < 17 or data[2] & 0xF8 or HEADER.unpack_from(data)[2] != 1:
+            return None  # Not a standard query with one question
+        try:
+            question = parse_question(data)
+        except IndexError:
+            return None
+        if question is None or question[1] != TYPE_A:
+            return None
+        labels, _, end = question
+        depth = len(self.zone_labels)
+        if labels[len(labels) - depth:] != self.zone_labels or len(labels) < depth:
+            return None
+        if any(labels[len(labels) - len(missing):] == missing for missing in self.nxdomain_labels):
+            return None
+        flags = 0x8400 | (data[2] & 0x01) << 8  # QR, AA and the query's RD bit
+        return HEADER.pack(int.from_bytes(data[:2], 'big'), flags, 1, 1, 0, 0) + data[12:end] + self.answer_rdata
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        response = self.fast_answer(data)
+        if response is not None:
+            self.transport.sendto(response, addr)
+            return
+        try:
+            query = dns.message.from_wire(data)
+        except dns.exception.DNSException:
+            return
+        response = self.answer(query)
+        try:
+            wire = response.to_wire(max_size=UDP_LIMIT)
+        except dns.exception.TooBig:
+            # Send the question back with TC set so the client retries over TCP
+            truncated = dns.message.make_response(query)
+            truncated.flags |= dns.flags.AA | dns.flags.TC
+            wire = truncated.to_wire()
+        self.transport.sendto(wire, addr)
+
+    def answer(self, query):
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        question = query.question[0]
+        if not question.name.is_subdomain(self.zone):
+            response.set_rcode(dns.rcode.REFUSED)
+        elif any(question.name.is_subdomain(missing) for missing in self.nxdomain):
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        elif question.rdtype == dns.rdatatype.A:
+            response.answer.append(dns.rrset.from_text(
+                question.name, DEFAULT_TTL, 'IN', 'A', self.address))
+        elif question.rdtype == dns.rdatatype.NS and question.name == self.zone:
+            response.answer.append(dns.rrset.from_text(
+                question.name, DEFAULT_TTL, 'IN', 'NS', f'ns1.{self.zone}'))
+        elif question.rdtype == dns.rdatatype.TXT:
+            response.answer.append(dns.rrset.from_text_list(
+                question.name, DEFAULT_TTL, 'IN', 'TXT', LARGE_TXT))
+        return response
+
+    async def serve_tcp(self, reader, writer):
+        """Answer length-prefixed queries on one TCP connection, several at a time (RFC 7766 pipelining)."""
+        self.connections += 1
+        try:
+            while True:
+                length = int.from_bytes(await reader.readexactly(2), 'big')
+                query = dns.message.from_wire(await reader.readexactly(length))
+                self.queries += 1
+                wire = self.answer(query).to_wire()
+                writer.write(len(wire).to_bytes(2, 'big') + wire)
+        except (asyncio.IncompleteReadError, ConnectionError, dns.exception.DNSException):
+            pass
+        finally:
+            writer.close()
+
+class ScenarioProtocol(StandinProtocol):
+    """The stand-in with explicit test cases under the zone; everything else is NXDOMAIN.
+
+    Relative to the zone:
+      hostN             A (and a TXT set too large for UDP)
+      wild, *.wild      wildcard A
+      dsubN             delegated subzone: NS at a nameserver outside any whitelist
+      danglingN         CNAME to danglingN.unclaimed, which does not exist
+      aliasN, *.aliasN  aliasN is a CNAME to a missing name like danglingN, with A hosts below it
+      lameN             NS at ns-good (this server) and ns-lame (lame_address, which answers SERVFAIL)
+      gone, *.gone      NXDOMAIN subtree
+    """
+
+    SHADOW_NAMESERVER = 'ns1.shadow-provider.invalid.'
+
+    def __init__(self, zone, address, lame_address):
+        super().__init__(zone, address)
+        self.lame_address = lame_address
+        self.lame = None  # The LameProtocol serving lame_address, if this process serves it
+
+    def answered(self):
+        return self.queries + (self.lame.queries if self.lame else 0)
+
+    def fast_answer(self, data):
+        return None
+
+    def add(self, response, name, rdtype, *rdatas):
+        response.answer.append(dns.rrset.from_text_list(name, DEFAULT_TTL, 'IN', rdtype, list(rdatas)))
+
+    def answer(self, query):
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        question = query.question[0]
+        name, rdtype = question.name, question.rdtype
+        if not name.is_subdomain(self.zone):
+            response.set_rcode(dns.rcode.REFUSED)
+            return response
+        relative = [label.decode().lower() for label in name.relativize(self.zone).labels]
+        case = relative[-1] if relative else ''
+        depth = len(relative) if case else 0
+
+        if case == '':
+            if rdtype == dns.rdatatype.NS:
+                self.add(response, name, 'NS', f'ns-good.{self.zone}')
+            elif rdtype == dns.rdatatype.A:
+                self.add(response, name, 'A', self.address)
+        elif depth == 1 and case in ('ns-good', 'ns-lame'):
+            if rdtype == dns.rdatatype.A:
+                self.add(response, name, 'A', self.address if case == 'ns-good' else self.lame_address)
+        elif case == 'wild':
+            if rdtype == dns.rdatatype.A:
+                self.add(response, name, 'A', self.address)
+        elif depth == 1 and case.startswith('host'):
+            if rdtype == dns.rdatatype.A:
+                self.add(response, name, 'A', self.address)
+            elif rdtype == dns.rdatatype.TXT:
+                self.add(response, name, 'TXT', *LARGE_TXT)
+        elif depth == 1 and case.startswith('dsub'):
+            if rdtype == dns.rdatatype.NS:
+                self.add(response, name, 'NS', self.SHADOW_NAMESERVER)
+            elif rdtype == dns.rdatatype.A:
+                self.add(response, name, 'A', self.address)
+        elif depth == 1 and case.startswith('dangling'):
+            # The target is in this zone and missing, so the answer is the CNAME plus NXDOMAIN
+            self.add(response, name, 'CNAME', f'{case}.unclaimed.{self.zone}')
+            if rdtype != dns.rdatatype.CNAME:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+        elif case.startswith('alias'):
+            if depth == 1:
+                # NXDOMAIN comes from the missing target; the names below aliasN exist
+                self.add(response, name, 'CNAME', f'{case}.unclaimed.{self.zone}')
+                if rdtype != dns.rdatatype.CNAME:
+                    response.set_rcode(dns.rcode.NXDOMAIN)
+            elif rdtype == dns.rdatatype.A:
+                self.add(response, name, 'A', self.address)
+        elif depth == 1 and case.startswith('lame'):
+            if rdtype == dns.rdatatype.NS:
+                self.add(response, name, 'NS', f'ns-good.{self.zone}', f'ns-lame.{self.zone}')
+            elif rdtype == dns.rdatatype.A:
+                self.add(response, name, 'A', self.address)
+        else:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        return response
+
+class LameProtocol(asyncio.DatagramProtocol):
+    """A lame name server: answers every query with SERVFAIL.
+
+    SERVFAIL rather than REFUSED, which rate control would take for throttling
+    and back off from, so a benchmark measures the checker and not the backoff.
+    """
+
+    def __init__(self):
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        try:
+            query = dns.message.from_wire(data)
+        except dns.exception.DNSException:
+            return
+        response = dns.message.make_response(query)
+        response.set_rcode(dns.rcode.SERVFAIL)
+        self.transport.sendto(response.to_wire(), addr)
+
+async def start(host, port, zone, nxdomain=(), synthetic=False, lame_host=None):
+    """Start serving on the running loop; return (protocol, close callable)."""
+    loop = asyncio.get_running_loop()
+    if synthetic:
+        protocol = ScenarioProtocol(zone, host, lame_host or host)
+    else:
+        protocol = StandinProtocol(zone, nxdomain=nxdomain)
+    transports = []
+    transport, _ = await loop.create_datagram_endpoint(lambda: protocol, local_addr=(host, port))
+    transports.append(transport)
+    if synthetic and lame_host:
+        protocol.lame = LameProtocol()
+        lame_transport, _ = await loop.create_datagram_endpoint(lambda: protocol.lame, local_addr=(lame_host, port))
+        transports.append(lame_transport)
+    tcp_server = await asyncio.start_server(protocol.serve_tcp, host, port)
+
+    def close():
+        for transport in transports:
+            transport.close()
+        tcp_server.close()
+    return protocol, close
+
+async def serve(host, port, zone, nxdomain=(), synthetic=False, lame_host=None):
+    protocol, close = await start(host, port, zone, nxdomain, synthetic, lame_host)
+    print(f"Serving {zone} on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        close()
+        print(f"Answered {protocol.queries} queries ({protocol.connections} TCP connections)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local authoritative DNS stand-in for throughput measurements.")
+    parser.add_argument('zone', type=str, help='The zone to answer for, e.g. example.test')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5353)
+    parser.add_argument('--nxdomain', type=str, nargs='*', default=[], help='Names answered NXDOMAIN with everything below them.')
+    parser.add_argument('--synthetic', action='store_true', help='Serve the wildcard, lame, dangling-CNAME and delegated-subzone test cases instead of A for every name.')
+    parser.add_argument('--lame-host', type=str, help='With --synthetic, the address ns-lame resolves to; a SERVFAIL-only server listens there (e.g. 127.0.0.2).')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.zone, args.nxdomain, args.synthetic, args.lame_host))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,53 @@
+import codecs
+import json
+
+# Streaming parse of crt.sh's JSON output. Large organisations get responses
+# of hundreds of MB; instead of response.json() materialising all of it, the
+# certificates are decoded one at a time as the body arrives, so memory stays
+# bounded by the chunk size and the first names are available immediately.
+
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = ' \t\r\n,'
+
+def iter_json_array(chunks):
+    """Yield the items of a JSON array that arrives as a sequence of text chunks."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+
+    for chunk in chunks:
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in SEPARATORS:
+                position += 1
+            if position >= len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("crt.sh response is not a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The item continues in the next chunk
+                break
+            yield item
+
+    raise ValueError("crt.sh response ended before the JSON array was closed")
+
+def iter_text(response, chunk_size=CHUNK_SIZE):
+    """Yield a streamed requests response body as text chunks."""
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+def iter_certificates(response, chunk_size=CHUNK_SIZE):
+    """Yield each certificate entry of a crt.sh response opened with `stream=True`."""
+    return iter_json_array(iter_text(response, chunk_size))
@@ -0,0 +1,78 @@
+import time
+import dns.exception
+import dns.flags
+import dns.message
+import dns.opcode
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+# Renders dns.message responses the way `dig` prints them, so the checkers can
+# log the answers they already hold instead of forking `dig` to ask again.
+
+def response_from_outcome(outcome):
+    """Return the dns.message behind a query outcome (a response or a DNS exception), if any."""
+    if isinstance(outcome, dns.message.Message):
+        return outcome
+    if isinstance(outcome, dns.resolver.NXDOMAIN):
+        responses = outcome.responses()
+        return next(iter(responses.values()), None)
+    if isinstance(outcome, dns.resolver.NoAnswer):
+        return outcome.kwargs.get('response')
+    return None
+
+def count_records(section):
+    return sum(len(rrset) for rrset in section)
+
+def format_section(title, section):
+    lines = [f";; {title} SECTION:"]
+    for rrset in section:
+        lines.extend(line.replace(' ', '\t', 4) for line in rrset.to_text().split('\n'))
+    return lines
+
+def format_dig(qname, record_type, outcome, server=None, port=53, elapsed=None):
+    """Render outcome (a response, a DNS exception or None) as dig-style text."""
+    target = f"@{server} " if server else ""
+    lines = [f"; <<>> DNS-Checker <<>> {target}{qname} {record_type}"]
+
+    response = response_from_outcome(outcome)
+    if response is None:
+        if isinstance(outcome, dns.exception.Timeout) or outcome is None:
+            lines.append(";; connection timed out; no servers could be reached")
+        else:
+            lines.append(f";; communications error: {outcome}")
+        return '\n'.join(lines) + '\n\n'
+
+    additional = count_records(response.additional) + (1 if response.edns >= 0 else 0)
+    lines.append(";; Got answer:")
+    lines.append(f";; ->>HEADER<<- opcode: {dns.opcode.to_text(response.opcode())}, "
+                 f"status: {dns.rcode.to_text(response.rcode())}, id: {response.id}")
+    lines.append(f";; flags: {dns.flags.to_text(response.flags).lower()}; QUERY: {len(response.question)}, "
+                 f"ANSWER: {count_records(response.answer)}, AUTHORITY: {count_records(response.authority)}, "
+                 f"ADDITIONAL: {additional}")
+
+    if response.edns >= 0:
+        lines.append("")
+        lines.append(";; OPT PSEUDOSECTION:")
+        lines.append(f"; EDNS: version: {response.edns}, flags:{' do' if response.ednsflags & dns.flags.DO else ''}; "
+                     f"udp: {response.payload}")
+
+    lines.append("")
+    lines.append(";; QUESTION SECTION:")
+    for rrset in response.question:
+        lines.append(f";{rrset.name}\t\t\t{dns.rdataclass.to_text(rrset.rdclass)}\t{dns.rdatatype.to_text(rrset.rdtype)}")
+    for title, section in (('ANSWER', response.answer), ('AUTHORITY', response.authority),
+                           ('ADDITIONAL', response.additional)):
+        if section:
+            lines.append("")
+            lines.extend(format_section(title, section))
+
+    lines.append("")
+    if elapsed is not None:
+        lines.append(f";; Query time: {elapsed * 1000:.0f} msec")
+    if server:
+        lines.append(f";; SERVER: {server}#{port}({server}) (UDP)")
+    lines.append(f";; WHEN: {time.strftime('%a %b %d %H:%M:%S %Z %Y')}")
+    lines.append(f";; MSG SIZE  rcvd: {len(response.to_wire())}")
+    return '\n'.join(lines) + '\n\n'
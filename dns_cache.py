@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import threading
+import time
+import dns.message
+import dns.rdatatype
+import dns.resolver
+
+# Persistent answer cache shared by every checker in the project.
+#
+# It implements dnspython's resolver cache interface (get/put/flush), so any
+# dns.resolver.Resolver or dns.asyncresolver.Resolver can use it with
+# `resolver.cache = cache`. dnspython computes each Answer's expiration from
+# the RRset TTLs, or from the SOA minimum for NODATA/NXDOMAIN answers, and
+# caches NXDOMAIN under (qname, ANY); we store that expiration as-is.
+
+DEFAULT_CACHE_FILE = os.environ.get(
+    'DNS_CHECKER_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'dns-checker', 'dns_cache.sqlite')
+)
+DEFAULT_MAX_ENTRIES = 500000  # LRU cap on cached answers
+COMMIT_EVERY = 500            # Writes batched per transaction
+
+class SQLiteDNSCache:
+    """SQLite-backed dnspython resolver cache with TTL expiry and an LRU size cap."""
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending_writes = 0
+
+        self.connection = sqlite3.connect(cache_file, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS answers ('
+            ' qname TEXT, rdtype INTEGER, rdclass INTEGER,'
+            ' expiration REAL, last_used REAL, nameserver TEXT, port INTEGER, wire BLOB,'
+            ' PRIMARY KEY (qname, rdtype, rdclass))'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)')
+        self.connection.commit()
+
+    def __bool__(self):
+        # dnspython checks `if resolver.cache:` before using it
+        return True
+
+    def get(self, key):
+        """Return the cached dns.resolver.Answer for (qname, rdtype, rdclass), or None."""
+        qname, rdtype, rdclass = key
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT expiration, nameserver, port, wire FROM answers WHERE qname = ? AND rdtype = ? AND rdclass = ?',
+                (qname.to_text(), int(rdtype), int(rdclass))
+            ).fetchone()
+            if row is None or row[0] <= now:
+                # dnspython follows every miss on the typed key with a (qname, ANY) probe
+                # for a cached NXDOMAIN, so a lookup has missed only once that misses too
+                if rdtype == dns.rdatatype.ANY:
+                    self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute(
+                'UPDATE answers SET last_used = ? WHERE qname = ? AND rdtype = ? AND rdclass = ?',
+                (now, qname.to_text(), int(rdtype), int(rdclass))
+            )
+            self.note_write()
+
+        expiration, nameserver, port, wire = row
+        answer = dns.resolver.Answer(qname, rdtype, rdclass, dns.message.from_wire(wire), nameserver, port)
+        answer.expiration = expiration
+        return answer
+
+    def put(self, key, value):
+        """Store an answer until its expiration."""
+        qname, rdtype, rdclass = key
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (qname.to_text(), int(rdtype), int(rdclass), value.expiration, time.time(),
+                 value.nameserver, value.port, value.response.to_wire())
+            )
+            self.note_write()
+
+    def flush(self, key=None):
+        """Drop one key, or the whole cache when key is None."""
+        with self.lock:
+            if key is None:
+                self.connection.execute('DELETE FROM answers')
+            else:
+                qname, rdtype, rdclass = key
+                self.connection.execute(
+                    'DELETE FROM answers WHERE qname = ? AND rdtype = ? AND rdclass = ?',
+                    (qname.to_text(), int(rdtype), int(rdclass))
+                )
+            self.connection.commit()
+
+    def note_write(self):
+        # Called with the lock held
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        """Evict expired and least recently used answers over the cap, then commit. Needs the lock."""
+        self.connection.execute('DELETE FROM answers WHERE expiration <= ?', (time.time(),))
+        excess = self.connection.execute('SELECT COUNT(*) FROM answers').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.connection.execute(
+                'DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used LIMIT ?)',
+                (excess,)
+            )
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        print(f"DNS cache: {self.hits} hits, {self.misses} misses ({self.hit_rate():.1%} hit rate)")
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.connection.close()
+
+def install_cache(resolver=None, cache_file=DEFAULT_CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES):
+    """Attach a persistent cache to resolver (the default resolver if None) and return it."""
+    cache = SQLiteDNSCache(cache_file, max_entries)
+    (resolver or dns.resolver.get_default_resolver()).cache = cache
+    return cache
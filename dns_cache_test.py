@@ -0,0 +1,111 @@
+import os
+import tempfile
+import time
+import dns.message
+import dns.rcode
+import dns.resolver
+import dns.rrset
+
+# Tests for the persistent resolver cache, with a resolver pointed at a stub
+# server on loopback. Run with `python dns_cache_test.py` or pytest.
+import dns_cache
+from dns_cache import SQLiteDNSCache
+from udp_engine_test import StubServer
+
+SOA = 'ns1.example.test. hostmaster.example.test. 1 3600 600 86400 300'
+
+def respond(query, attempt):
+    """host* names have an A record whose TTL is the number after "ttl" in the name, if any; the rest are NXDOMAIN."""
+    response = dns.message.make_response(query)
+    name = query.question[0].name
+    label = name.labels[0].decode()
+    if label.startswith('host'):
+        ttl = int(label.split('ttl')[1]) if 'ttl' in label else 300
+        response.answer.append(dns.rrset.from_text(name, ttl, 'IN', 'A', '192.0.2.1'))
+    else:
+        response.set_rcode(dns.rcode.NXDOMAIN)
+        response.authority.append(dns.rrset.from_text('example.test.', 300, 'IN', 'SOA', SOA))
+    return [response]
+
+class Scratch:
+    """A stub server and a resolver using a fresh SQLiteDNSCache in a scratch directory."""
+
+    def __init__(self, max_entries=dns_cache.DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+
+    def __enter__(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='dns-cache-test-')
+        self.server = StubServer(respond)
+        self.cache = SQLiteDNSCache(os.path.join(self.directory.name, 'dns_cache.sqlite'), self.max_entries)
+        self.resolver = dns.resolver.Resolver(configure=False)
+        self.resolver.nameservers, self.resolver.port = ['127.0.0.1'], self.server.port
+        self.resolver.cache = self.cache
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cache.close()
+        self.server.close()
+        self.directory.cleanup()
+
+    def resolve(self, name):
+        try:
+            return [rdata.address for rdata in self.resolver.resolve(name, 'A')]
+        except dns.resolver.NXDOMAIN:
+            return 'NXDOMAIN'
+
+    def queries(self):
+        return sum(self.server.attempts.values())
+
+def test_hits_and_misses_are_counted_per_lookup():
+    with Scratch() as scratch:
+        assert scratch.resolve('host1.example.test') == ['192.0.2.1']
+        assert (scratch.cache.hits, scratch.cache.misses) == (0, 1)
+        assert scratch.resolve('host1.example.test') == ['192.0.2.1']
+        assert (scratch.cache.hits, scratch.cache.misses) == (1, 1) and scratch.queries() == 1
+
+def test_cached_nxdomain_counts_as_a_single_hit():
+    with Scratch() as scratch:
+        assert scratch.resolve('missing.example.test') == 'NXDOMAIN'
+        assert (scratch.cache.hits, scratch.cache.misses) == (0, 1)
+        # The typed key misses and the (qname, ANY) key holding the NXDOMAIN hits: one lookup, one hit
+        assert scratch.resolve('missing.example.test') == 'NXDOMAIN'
+        assert (scratch.cache.hits, scratch.cache.misses) == (1, 1) and scratch.queries() == 1
+
+def test_answers_expire_with_their_ttl():
+    with Scratch() as scratch:
+        scratch.resolve('host-ttl1.example.test')
+        scratch.resolve('host-ttl1.example.test')
+        assert scratch.queries() == 1
+        time.sleep(1.1)
+        scratch.resolve('host-ttl1.example.test')
+        assert scratch.queries() == 2 and (scratch.cache.hits, scratch.cache.misses) == (1, 2)
+
+def test_least_recently_used_answers_are_evicted_over_the_cap():
+    commit_every = dns_cache.COMMIT_EVERY
+    dns_cache.COMMIT_EVERY = 1
+    try:
+        with Scratch(max_entries=2) as scratch:
+            scratch.resolve('host1.example.test')
+            scratch.resolve('host2.example.test')
+            scratch.resolve('host1.example.test')  # host1 is now more recently used than host2
+            scratch.resolve('host3.example.test')
+            rows = scratch.cache.connection.execute('SELECT qname FROM answers ORDER BY qname').fetchall()
+            assert [row[0] for row in rows] == ['host1.example.test.', 'host3.example.test.']
+            scratch.resolve('host1.example.test')
+            assert scratch.queries() == 3
+    finally:
+        dns_cache.COMMIT_EVERY = commit_every
+
+def test_answers_outlive_the_process():
+    with Scratch() as scratch:
+        scratch.resolve('host1.example.test')
+        scratch.cache.close()
+        scratch.cache = SQLiteDNSCache(scratch.cache.cache_file)
+        scratch.resolver.cache = scratch.cache
+        assert scratch.resolve('host1.example.test') == ['192.0.2.1'] and scratch.queries() == 1
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
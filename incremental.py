@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+import dns.exception
+import dns.resolver
+
+# Incremental rescans: a target's previous snapshot of names is kept together
+# with each name's DNS fingerprint (a hash of its CNAME/NS/A answers) and the
+# verdict of its last full check. A new run fully re-checks names that are new
+# or whose fingerprint changed; unchanged names reuse their verdict and are
+# re-verified on a rotating schedule, 1/REVERIFY_DAYS of them each day. The
+# state also keeps the highest crt.sh certificate id of the last run, so a
+# checker can carry over names without a newer certificate before it spends
+# any query on them.
+
+REVERIFY_DAYS = 7
+FINGERPRINT_TYPES = ('CNAME', 'NS', 'A')
+
+def fingerprint(records, statuses):
+    """Hash {record type: [rdata text]} and the per-type lookup statuses into a short stable fingerprint."""
+    canonical = json.dumps({
+        'statuses': statuses,
+        'records': {record_type: sorted(records.get(record_type, [])) for record_type in FINGERPRINT_TYPES},
+    }, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+def lookup_status(error):
+    if isinstance(error, dns.resolver.NXDOMAIN):
+        return 'NXDOMAIN'
+    if isinstance(error, dns.resolver.NoAnswer):
+        return 'NOERROR'
+    return type(error).__name__
+
+def resolve_fingerprint(name, resolver=None):
+    """Fingerprint name's CNAME/NS/A answers with a blocking resolver."""
+    resolver = resolver or dns.resolver.get_default_resolver()
+    records, statuses = {}, []
+    for record_type in FINGERPRINT_TYPES:
+        try:
+            records[record_type] = [rdata.to_text() for rdata in resolver.resolve(name, record_type)]
+            statuses.append('NOERROR')
+        except (dns.exception.DNSException, ValueError) as e:
+            statuses.append(lookup_status(e))
+    return fingerprint(records, statuses)
+
+def answers_fingerprint(a_outcome, ns_outcome):
+    """Fingerprint a name from the A and NS lookups a check has already made.
+
+    Each outcome is the lookup's response or the exception that ended it; the
+    CNAME chain of the A response stands in for a separate CNAME lookup.
+    """
+    records, statuses = {}, []
+    for record_type, outcome in (('A', a_outcome), ('NS', ns_outcome)):
+        try:
+            if isinstance(outcome, Exception):
+                raise outcome
+            chaining = outcome.resolve_chaining()
+        except dns.exception.DNSException as e:
+            statuses.append(lookup_status(e))
+            continue
+        if record_type == 'A':
+            records['CNAME'] = [rrset[0].target.to_text() for rrset in chaining.cnames]
+        records[record_type] = [rdata.to_text() for rdata in chaining.answer] if chaining.answer is not None else []
+        statuses.append('NOERROR')
+    return fingerprint(records, statuses)
+
+def rotation_slot(name):
+    """The day (mod REVERIFY_DAYS) on which an unchanged name is due for a full re-check."""
+    return zlib.crc32(name.encode()) % REVERIFY_DAYS
+
+class ScanState:
+    """The previous snapshot of a target's names with their fingerprints and verdicts."""
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        try:
+            with open(state_file, 'r') as f:
+                saved = json.load(f)
+            self.names = saved['names']
+            self.crtsh_cert_id = saved.get('crtsh_cert_id', 0)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            self.names = {}
+            self.crtsh_cert_id = 0
+
+    def plan(self, fingerprints, now=None):
+        """Split {name: fingerprint} into (names to check, {name: reused verdict})."""
+        now = now or datetime.now()
+        to_check, reused = [], {}
+        for name, current in fingerprints.items():
+            verdict = self.reusable(name, current, now)
+            if verdict is None:
+                to_check.append(name)
+            else:
+                reused[name] = verdict
+        return to_check, reused
+
+    def reusable(self, name, current, now=None):
+        """Return name's last verdict if its fingerprint is unchanged and it is not due for re-verification, else None."""
+        entry = self.names.get(name)
+        if current is None or entry is None or entry['fingerprint'] != current:
+            return None
+        return self.undue_verdict(name, now)
+
+    def undue_verdict(self, name, now=None):
+        """Return name's last verdict, or None if it has none or is due for re-verification."""
+        now = now or datetime.now()
+        entry = self.names.get(name)
+        if entry is None:
+            return None
+
+        # Re-verify on the name's rotation day, or if a missed run left it overdue
+        age = now - datetime.fromisoformat(entry['checked'])
+        if rotation_slot(name) == now.toordinal() % REVERIFY_DAYS or age >= timedelta(days=REVERIFY_DAYS):
+            return None
+        return entry['verdict']
+
+    def record(self, name, fingerprint, verdict):
+        self.names[name] = {'fingerprint': fingerprint, 'verdict': verdict, 'checked': datetime.now().isoformat()}
+
+    def save(self, snapshot):
+        """Keep only the names in the current snapshot and replace the state file atomically."""
+        self.names = {name: entry for name, entry in self.names.items() if name in snapshot}
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+        temp_file = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({'updated': datetime.now().isoformat(), 'crtsh_cert_id': self.crtsh_cert_id, 'names': self.names}, f)
+        os.replace(temp_file, self.state_file)
@@ -0,0 +1,197 @@
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+# Lightweight per-phase instrumentation. Wrapping a function with
+# @instrument() counts its calls, the class of every exception it raises,
+# its True/False results and a latency histogram, in one process-wide
+# registry. Functions that handle their own errors report them with
+# record_error(). At the end of a run write_metrics() emits the registry as a
+# node_exporter textfile (for the textfile collector) and a JSON summary.
+
+METRIC_PREFIX = 'dnscheck'
+# Upper bounds in seconds, from a cached DNS answer up to a dnsReaper container run
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+class Operation:
+    """Counters and latency histogram for one instrumented function."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_seconds = 0.0
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # The last one is +Inf
+        self.errors = {}   # exception class name -> count
+        self.results = {}  # 'true' / 'false' -> count, for functions returning a bool
+
+    def observe(self, seconds, error=None, result=None):
+        self.count += 1
+        self.total_seconds += seconds
+        self.bucket_counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        if error is not None:
+            self.add_error(error)
+        if isinstance(result, bool):
+            label = 'true' if result else 'false'
+            self.results[label] = self.results.get(label, 0) + 1
+
+    def add_error(self, error):
+        self.errors[error] = self.errors.get(error, 0) + 1
+
+    def quantile(self, fraction):
+        """Estimate a latency quantile from the histogram: the upper bound of its bucket, None if above them all."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+class Metrics:
+    """Thread-safe registry of Operations, shared by everything instrumented in the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.started = time.time()
+
+    def operation(self, name):
+        # Called with the lock held
+        if name not in self.operations:
+            self.operations[name] = Operation(name)
+        return self.operations[name]
+
+    def observe(self, name, seconds, error=None, result=None):
+        with self.lock:
+            self.operation(name).observe(seconds, error, result)
+
+    def record_error(self, name, error):
+        with self.lock:
+            self.operation(name).add_error(error)
+
+    def snapshot(self):
+        with self.lock:
+            return [self.operations[name] for name in sorted(self.operations)]
+
+    def to_textfile(self, job):
+        """Render the registry in the Prometheus text exposition format."""
+        duration = f"{METRIC_PREFIX}_operation_duration_seconds"
+        errors = f"{METRIC_PREFIX}_operation_errors_total"
+        results = f"{METRIC_PREFIX}_operation_results_total"
+        lines = [f"# HELP {duration} Time spent per call of an instrumented operation.",
+                 f"# TYPE {duration} histogram"]
+        operations = self.snapshot()
+        for operation in operations:
+            labels = f'job="{job}",operation="{operation.name}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), operation.bucket_counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{duration}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{duration}_sum{{{labels}}} {operation.total_seconds:.6f}")
+            lines.append(f"{duration}_count{{{labels}}} {operation.count}")
+        lines += [f"# HELP {errors} Errors an instrumented operation raised or handled, by exception class.",
+                  f"# TYPE {errors} counter"]
+        for operation in operations:
+            for error, count in sorted(operation.errors.items()):
+                lines.append(f'{errors}{{job="{job}",operation="{operation.name}",error="{error}"}} {count}')
+        lines += [f"# HELP {results} Boolean results of an instrumented operation.",
+                  f"# TYPE {results} counter"]
+        for operation in operations:
+            for result, count in sorted(operation.results.items()):
+                lines.append(f'{results}{{job="{job}",operation="{operation.name}",result="{result}"}} {count}')
+        lines += [f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds When the run finished.",
+                  f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge",
+                  f'{METRIC_PREFIX}_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}',
+                  f"# HELP {METRIC_PREFIX}_run_duration_seconds How long the run took.",
+                  f"# TYPE {METRIC_PREFIX}_run_duration_seconds gauge",
+                  f'{METRIC_PREFIX}_run_duration_seconds{{job="{job}"}} {time.time() - self.started:.3f}']
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, job):
+        """The registry as a JSON-serialisable dict."""
+        return {
+            'job': job,
+            'started': self.started,
+            'duration_seconds': round(time.time() - self.started, 3),
+            'operations': {operation.name: {
+                'count': operation.count,
+                'total_seconds': round(operation.total_seconds, 6),
+                'mean_seconds': round(operation.total_seconds / operation.count, 6) if operation.count else None,
+                'p50_seconds_le': operation.quantile(0.5),
+                'p99_seconds_le': operation.quantile(0.99),
+                'errors': operation.errors,
+                'results': operation.results,
+            } for operation in self.snapshot()},
+        }
+
+    def report(self):
+        for operation in self.snapshot():
+            errors = sum(operation.errors.values())
+            print(f"Timing: {operation.name} {operation.count} calls, {operation.total_seconds:.2f}s total, "
+                  f"{errors} errors")
+
+metrics = Metrics()
+
+def instrument(name=None):
+    """Decorator recording every call of a function (sync or async) under `name` (default: its name)."""
+    def decorate(function):
+        operation = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await function(*args, **kwargs)
+                except BaseException as e:
+                    metrics.observe(operation, time.perf_counter() - started, error=type(e).__name__)
+                    raise
+                metrics.observe(operation, time.perf_counter() - started, result=result)
+                return result
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                metrics.observe(operation, time.perf_counter() - started, error=type(e).__name__)
+                raise
+            metrics.observe(operation, time.perf_counter() - started, result=result)
+            return result
+        return wrapper
+    return decorate
+
+def record_error(operation, error):
+    """Count an exception an instrumented function caught and handled itself."""
+    metrics.record_error(operation, type(error).__name__)
+
+def write_atomically(path, content):
+    # The textfile collector may read at any moment; never let it see a half-written file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+def write_metrics(metrics_dir, job, **sections):
+    """Write <job>.prom (node_exporter textfile) and <job>.json into metrics_dir; return both paths.
+
+    Keyword arguments that are not None are added to the JSON summary as
+    extra top-level sections, e.g. rate_control=controller.summary().
+    """
+    os.makedirs(metrics_dir, exist_ok=True)
+    textfile = os.path.join(metrics_dir, f"{job}.prom")
+    summary = os.path.join(metrics_dir, f"{job}.json")
+    write_atomically(textfile, metrics.to_textfile(job))
+    content = metrics.summary(job)
+    content.update((name, section) for name, section in sections.items() if section is not None)
+    write_atomically(summary, json.dumps(content, indent=2) + '\n')
+    return textfile, summary
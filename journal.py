@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+# Append-only JSONL progress journal for long sweeps. Each completed unit of
+# work is one line, written through a large buffer that is flushed at most
+# once per FLUSH_INTERVAL, so a record costs a json.dumps and a buffered
+# write. After a crash, --resume replays the complete lines (a line torn by
+# the crash is cut off), skips the work they cover and appends from there;
+# at most the last FLUSH_INTERVAL of work is done twice.
+
+BUFFER_SIZE = 1 << 20
+FLUSH_INTERVAL = 1.0  # Seconds of finished work a crash may lose
+
+def replay_journal(path, replay=None):
+    """Call replay(record) for every complete record in path, truncate a torn tail and return the count."""
+    count = 0
+    with open(path, 'rb+') as f:
+        good = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if replay is not None:
+                replay(record)
+            good += len(line)
+            count += 1
+        f.truncate(good)
+    return count
+
+class Journal:
+    """Buffered append-only JSONL file; with resume=True the existing records are replayed and kept."""
+
+    def __init__(self, path, resume=False, replay=None):
+        self.path = path
+        self.resumed = 0
+        resume = resume and os.path.exists(path)
+        if resume:
+            self.resumed = replay_journal(path, replay)
+        self.file = open(path, 'a' if resume else 'w', buffering=BUFFER_SIZE)
+        self.last_flush = time.monotonic()
+
+    def append(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.file.closed:
+            self.close()
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+
+# Tests for the append-only progress journal. Run with `python journal_test.py` or pytest.
+from journal import Journal, replay_journal
+
+def write_journal(path, names):
+    with Journal(path) as journal:
+        for name in names:
+            journal.append({'name': name})
+
+def test_replay_cuts_a_torn_last_line():
+    with tempfile.TemporaryDirectory(prefix='journal-test-') as workdir:
+        path = os.path.join(workdir, 'progress.jsonl')
+        write_journal(path, ['a', 'b', 'c'])
+        with open(path, 'ab') as f:
+            f.write(b'{"name":"d","tak')
+        replayed = []
+        assert replay_journal(path, replayed.append) == 3
+        assert replayed == [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]
+        with open(path, 'rb') as f:
+            assert f.read().endswith(b'{"name":"c"}\n')
+
+def test_replay_stops_at_a_complete_but_garbled_line():
+    with tempfile.TemporaryDirectory(prefix='journal-test-') as workdir:
+        path = os.path.join(workdir, 'progress.jsonl')
+        write_journal(path, ['a'])
+        with open(path, 'ab') as f:
+            f.write(b'\x00\x00\x00\n{"name":"b"}\n')
+        assert replay_journal(path) == 1
+        assert os.path.getsize(path) == len(b'{"name":"a"}\n')
+
+def test_resume_appends_after_the_kept_records():
+    with tempfile.TemporaryDirectory(prefix='journal-test-') as workdir:
+        path = os.path.join(workdir, 'progress.jsonl')
+        write_journal(path, ['a', 'b'])
+        with open(path, 'ab') as f:
+            f.write(b'{"na')
+        replayed = []
+        with Journal(path, resume=True, replay=replayed.append) as journal:
+            assert journal.resumed == 2 and [record['name'] for record in replayed] == ['a', 'b']
+            journal.append({'name': 'c'})
+        with open(path) as f:
+            assert [json.loads(line)['name'] for line in f] == ['a', 'b', 'c']
+
+        # Without resume the journal starts over
+        with Journal(path) as journal:
+            assert journal.resumed == 0
+        assert os.path.getsize(path) == 0
+
+def test_resume_without_a_journal_starts_a_new_one():
+    with tempfile.TemporaryDirectory(prefix='journal-test-') as workdir:
+        path = os.path.join(workdir, 'progress.jsonl')
+        with Journal(path, resume=True, replay=lambda record: None) as journal:
+            journal.append({'name': 'a'})
+            assert journal.resumed == 0
+        with open(path) as f:
+            assert f.read() == '{"name":"a"}\n'
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
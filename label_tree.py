@@ -0,0 +1,104 @@
+import dns.exception
+import dns.name
+
+# Subdomain sets organised as a tree of labels (com -> example -> dev -> ...).
+#
+# RFC 8020: an NXDOMAIN answer means nothing exists at or below that name, so
+# once a name is known to be NXDOMAIN its whole subtree can be treated as
+# nonexistent without sending queries. Walking the tree shallowest level first
+# lets each level's NXDOMAIN answers prune the levels below it. Names that are
+# not candidates themselves but sit above several candidates ("branch points",
+# e.g. dev.example.com above many *.dev.example.com) are worth one query too.
+#
+# Only an NXDOMAIN about the name itself cuts. When the name is a CNAME whose
+# target is missing, the answer is NXDOMAIN too, but the name exists and may
+# well have names below it.
+
+class Node:
+    __slots__ = ('children', 'is_name', 'nxdomain')
+
+    def __init__(self):
+        self.children = {}
+        self.is_name = False
+        self.nxdomain = False
+
+def split_labels(name):
+    """Return name's labels from the top down, e.g. a.example.com -> ['com', 'example', 'a']."""
+    return name.rstrip('.').lower().split('.')[::-1]
+
+def is_own_nxdomain(name, outcome):
+    """True if an NXDOMAIN outcome is about name itself rather than the end of a CNAME chain starting there.
+
+    outcome is dnspython's NXDOMAIN exception or an NXDOMAIN response message.
+    """
+    try:
+        canonical = outcome.canonical_name if isinstance(outcome, Exception) else outcome.canonical_name()
+    except (TypeError, KeyError, dns.exception.DNSException):
+        return False
+    return canonical == dns.name.from_text(name)
+
+class LabelTree:
+    """A set of names keyed by reversed labels that remembers NXDOMAIN cuts."""
+
+    def __init__(self, names=()):
+        self.root = Node()
+        self.pruned = 0
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        node = self.root
+        for label in split_labels(name):
+            node = node.children.setdefault(label, Node())
+        node.is_name = True
+
+    def mark_nxdomain(self, name):
+        node = self.root
+        for label in split_labels(name):
+            node = node.children.setdefault(label, Node())
+        node.nxdomain = True
+
+    def is_pruned(self, name):
+        """True if a strict ancestor of name is known to be NXDOMAIN."""
+        node = self.root
+        for label in split_labels(name)[:-1]:
+            node = node.children.get(label)
+            if node is None:
+                return False
+            if node.nxdomain:
+                return True
+        return False
+
+    def levels(self, min_descendants=2):
+        """Yield (names, branch points) one depth at a time, shallowest first.
+
+        Subtrees cut by mark_nxdomain() between iterations are skipped, and the
+        names inside them are counted in self.pruned.
+        """
+        frontier = list(self.root.children.items())
+        while frontier:
+            names, branch_points = [], []
+            for name, node in frontier:
+                if node.is_name:
+                    names.append(name)
+                elif '.' in name and self.count_names(node) >= min_descendants:
+                    branch_points.append(name)
+            yield names, branch_points
+
+            # Cuts the caller made for this level apply when the next one is built
+            next_frontier = []
+            for name, node in frontier:
+                if node.nxdomain:
+                    self.pruned += self.count_names(node) - node.is_name
+                else:
+                    next_frontier.extend((f"{label}.{name}", child) for label, child in node.children.items())
+            frontier = next_frontier
+
+    def count_names(self, node):
+        count = int(node.is_name)
+        stack = list(node.children.values())
+        while stack:
+            child = stack.pop()
+            count += child.is_name
+            stack.extend(child.children.values())
+        return count
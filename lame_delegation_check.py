@@ -3,9 +3,27 @@ import dns.resolver
 import dns.query
 import dns.message
 import dns.exception
-import subprocess
+import dns.flags
 import datetime
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dig_format import format_dig
+from dns_cache import DEFAULT_CACHE_FILE, install_cache
+from instrumentation import instrument, record_error, write_metrics
+from profiling import profiled
+from rate_control import RateController, install_rate_control, server_key
+from tcp_pool import TCPPool
+from udp_engine import UDPEngine
+
+# Upper bound on probes in flight; a domain's whole NS x IP x record type matrix normally fits
+MAX_WORKERS = 256
+QUERY_TIMEOUT = 5  # Seconds a probe may take, retries included
+NAME_SERVER_PORT = 53  # Where probes are sent; a local stand-in (benchmarks/) may listen elsewhere
+
+# Paces probes per name server so throttling is not mistaken for lame delegation; None sends them unpaced
+rate_controller = RateController()
+# Truncated answers are asked again over pooled, pipelined TCP connections
+tcp_pool = TCPPool(timeout=QUERY_TIMEOUT)
 
 # Define ANSI color codes
 class Colors:
@@ -18,52 +36,85 @@ class Colors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
-def get_ip_addresses(name_server):
+def report(line, messages=None):
+    """Print a line, or keep it in messages so the main thread prints it in order instead of a worker."""
+    if messages is None:
+        print(line)
+    else:
+        messages.append(line)
+
+def get_ip_addresses(name_server, messages=None):
     try:
         answers = dns.resolver.resolve(name_server, 'A')
         return [rdata.address for rdata in answers]
     except dns.resolver.NoAnswer:
-        print(f"{Colors.WARNING}No A record found for {name_server}{Colors.ENDC}")
+        report(f"{Colors.WARNING}No A record found for {name_server}{Colors.ENDC}", messages)
         return []
     except dns.resolver.NXDOMAIN:
-        print(f"{Colors.FAIL}Domain {name_server} does not exist{Colors.ENDC}")
+        report(f"{Colors.FAIL}Domain {name_server} does not exist{Colors.ENDC}", messages)
         return []
     except dns.exception.DNSException as e:
-        print(f"{Colors.FAIL}DNS exception for {name_server}: {e}{Colors.ENDC}")
+        report(f"{Colors.FAIL}DNS exception for {name_server}: {e}{Colors.ENDC}", messages)
         return []
 
-def check_record_type(name_server_ip, domain, record_type):
+def query_name_server(name_server_ip, query_message):
+    """Send one UDP probe, paced and retried by the rate controller when it is enabled, falling back to TCP if truncated."""
+    send = lambda timeout: dns.query.udp(query_message, name_server_ip, timeout=timeout, port=NAME_SERVER_PORT)
+    if rate_controller is None:
+        response = send(QUERY_TIMEOUT)
+    else:
+        response = rate_controller.query(server_key(name_server_ip, NAME_SERVER_PORT), send, QUERY_TIMEOUT)
+    if response.flags & dns.flags.TC:
+        response = tcp_pool.query(query_message, name_server_ip, NAME_SERVER_PORT)
+    return response
+
+@instrument()
+def check_record_type(name_server_ip, domain, record_type, responses=None, outcome=None, messages=None):
+    # The response (or the error) is kept in `responses` so the log can show it without re-querying;
+    # a probe the UDP engine already sent passes its outcome in. Run on a worker, it reports into `messages`
     try:
-        query_message = dns.message.make_query(domain, record_type)
-        response = dns.query.udp(query_message, name_server_ip, timeout=5)
+        if outcome is None:
+            query_message = dns.message.make_query(domain, record_type)
+            outcome = query_name_server(name_server_ip, query_message)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = outcome
 
         if response.rcode() == dns.rcode.NOERROR:
             if response.answer:
-                print(f"{Colors.OKGREEN}{name_server_ip} responds with valid {record_type} records.{Colors.ENDC}")
+                report(f"{Colors.OKGREEN}{name_server_ip} responds with valid {record_type} records.{Colors.ENDC}", messages)
                 return True
             else:
-                print(f"{Colors.WARNING}{name_server_ip} responded with NOERROR but no {record_type} records found.{Colors.ENDC}")
+                report(f"{Colors.WARNING}{name_server_ip} responded with NOERROR but no {record_type} records found.{Colors.ENDC}", messages)
                 return True
         else:
-            print(f"{Colors.FAIL}{name_server_ip} returned error code {response.rcode()} for {record_type} records.{Colors.ENDC}")
+            report(f"{Colors.FAIL}{name_server_ip} returned error code {response.rcode()} for {record_type} records.{Colors.ENDC}", messages)
             return False # status: REFUSED, SERVFAIL or flag 'rd ra' will be count as fail
-    except dns.exception.Timeout:
-        print(f"{Colors.FAIL}Timeout querying {name_server_ip} for {record_type} records.{Colors.ENDC}")
+    except dns.exception.Timeout as e:
+        outcome = e
+        report(f"{Colors.FAIL}Timeout querying {name_server_ip} for {record_type} records.{Colors.ENDC}", messages)
     except dns.exception.DNSException as e:
-        print(f"{Colors.FAIL}DNS exception querying {name_server_ip} for {record_type} records: {e}{Colors.ENDC}")
+        outcome = e
+        report(f"{Colors.FAIL}DNS exception querying {name_server_ip} for {record_type} records: {e}{Colors.ENDC}", messages)
+    finally:
+        if isinstance(outcome, Exception):
+            record_error('check_record_type', outcome)
+        if responses is not None:
+            responses[(name_server_ip, record_type)] = outcome
     return False # Potential vulnerable when return false
 
-def run_dig_command(name_server_ip, domain, record_type, log_file):
-    command = f"dig @{name_server_ip} {domain} {record_type}"
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        log_file.write(f"\nOutput for {name_server_ip} ({record_type}):\n")
-        log_file.write(result.stdout)
-    except subprocess.CalledProcessError as e:
-        log_file.write(f"Command failed with exit code {e.returncode}\n")
-        log_file.write(e.output)
-
-def check_lame_delegation(domain):
+@instrument()
+def run_dig_command(name_server_ip, domain, record_type, log_file, outcome=None):
+    """Log dig-style output for a probe, querying in-process only if no outcome is at hand."""
+    if outcome is None:
+        try:
+            outcome = query_name_server(name_server_ip, dns.message.make_query(domain, record_type))
+        except dns.exception.DNSException as e:
+            outcome = e
+    log_file.write(f"\nOutput for {name_server_ip} ({record_type}):\n")
+    log_file.write(format_dig(domain, record_type, outcome, server=name_server_ip, port=NAME_SERVER_PORT))
+
+def check_lame_delegation(domain, engine=None):
     record_types = ['A', 'AAAA', 'MX', 'NS', 'TXT']  # List of record types to check
 
     # Create a timestamped filename for logging
@@ -78,19 +129,50 @@ def check_lame_delegation(domain):
 
         print(f"{Colors.HEADER}Name servers for {domain}: {name_servers}{Colors.ENDC}")
 
-        with open(log_filename, 'w') as log_file:
+        with open(log_filename, 'w') as log_file, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            # Resolve every name server's addresses at once. The workers keep what they have to say
+            # and the main thread prints it below, in the order a one-by-one check would print it
+            ns_messages = {ns: [] for ns in name_servers}
+            ns_ip_addresses = dict(zip(name_servers, executor.map(get_ip_addresses, name_servers, ns_messages.values())))
+
+            # Send the whole NS x IP x record type probe matrix at once, so a domain costs
+            # roughly one timeout rather than the sum of them
+            probes = {}
+            responses = {}
+            outcomes = {}
+            probe_messages = {}
+            if engine is not None:
+                # Send the matrix from the engine's socket loop; the answers are judged below as usual
+                ns_ips = {ns_ip for ns in name_servers for ns_ip in ns_ip_addresses[ns]}
+                for (ns_ip, _, record_type), outcome in engine.run(
+                        (ns_ip, domain, record_type) for ns_ip in ns_ips for record_type in record_types):
+                    outcomes[(ns_ip, record_type)] = outcome
+            for ns in name_servers:
+                for ns_ip in ns_ip_addresses[ns]:
+                    for record_type in record_types:
+                        if (ns_ip, record_type) not in probes:
+                            messages = probe_messages[(ns_ip, record_type)] = []
+                            probes[(ns_ip, record_type)] = executor.submit(check_record_type, ns_ip, domain, record_type,
+                                                                           responses, outcomes.get((ns_ip, record_type)),
+                                                                           messages)
+
+            # Group the probe results back into per-NS verdicts
             for ns in name_servers:
-                ns_ip_addresses = get_ip_addresses(ns)
-                if not ns_ip_addresses:
+                for line in ns_messages[ns]:
+                    print(line)
+                if not ns_ip_addresses[ns]:
                     print(f"{Colors.WARNING}Name server {ns} has no IP addresses or could not be resolved.{Colors.ENDC}")
                     continue
 
                 failed_record_types = []
-                for ns_ip in ns_ip_addresses:
+                for ns_ip in ns_ip_addresses[ns]:
                     print(f"{Colors.OKBLUE}Checking {ns_ip} for {domain}...{Colors.ENDC}")
                     # Check if the name server responds to queries for multiple record types
                     for record_type in record_types:
-                        if not check_record_type(ns_ip, domain, record_type):
+                        passed = probes[(ns_ip, record_type)].result()
+                        for line in probe_messages[(ns_ip, record_type)]:
+                            print(line)
+                        if not passed:
                             failed_record_types.append(record_type)
 
                     if not failed_record_types:
@@ -100,9 +182,9 @@ def check_lame_delegation(domain):
                         for record_type in failed_record_types:
                             print(f"{Colors.WARNING} - {record_type}{Colors.ENDC}")
 
-                        # Run `dig` commands for manual verification and log the output
+                        # Log dig-style output of the probe responses for manual verification
                         for record_type in record_types:
-                            run_dig_command(ns_ip, domain, record_type, log_file)
+                            run_dig_command(ns_ip, domain, record_type, log_file, responses.get((ns_ip, record_type)))
 
                 if failed_record_types:
                     print(f"{Colors.FAIL}{ns} is likely vulnerable to lame delegation due to failure for the following record types: {', '.join(failed_record_types)}.{Colors.ENDC}")
@@ -138,6 +220,29 @@ def check_log_file(filename):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Check for lame delegation of a domain.")
     parser.add_argument('domain', type=str, help='The domain to check for lame delegation.')
+    parser.add_argument('--dns-cache', type=str, default=DEFAULT_CACHE_FILE, help='Persistent DNS answer cache shared by the checkers.')
+    parser.add_argument('--no-dns-cache', action='store_true', help='Resolve everything from scratch.')
+    parser.add_argument('--no-rate-control', action='store_true', help='Send probes without adaptive per-server pacing and retries.')
+    parser.add_argument('--metrics-dir', type=str, help='Write per-phase timings here as lame_delegation.prom (node_exporter textfile) and lame_delegation.json.')
+    parser.add_argument('--profile', nargs='?', const='lame_delegation.profile', metavar='PREFIX', help='Profile the check into PREFIX.pstats and PREFIX.collapsed (flamegraph input) and print the hottest functions.')
+    parser.add_argument('--engine', choices=['threads', 'udp'], default='threads', help='Send probes one blocking socket per probe (threads) or all from one non-blocking UDP engine (udp).')
     args = parser.parse_args()
 
-    check_lame_delegation(args.domain)
+    dns_cache = None if args.no_dns_cache else install_cache(cache_file=args.dns_cache)
+    if args.no_rate_control:
+        rate_controller = None
+    else:
+        install_rate_control(dns.resolver.get_default_resolver(), rate_controller)
+    with profiled(args.profile):
+        check_lame_delegation(args.domain, engine=UDPEngine(port=NAME_SERVER_PORT, tcp_pool=tcp_pool) if args.engine == 'udp' else None)
+    if dns_cache:
+        dns_cache.report()
+        dns_cache.close()
+    if rate_controller:
+        rate_controller.report()
+    tcp_pool.report()
+    tcp_pool.close()
+    if args.metrics_dir:
+        textfile, summary = write_metrics(args.metrics_dir, 'lame_delegation',
+                                          rate_control=rate_controller.summary() if rate_controller else None)
+        print(f"Metrics written to {textfile} and {summary}")
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import threading
+import dns.resolver
+
+# Tests for lame_delegation_check against the benchmark stand-in server on
+# loopback. Run with `python lame_delegation_check_test.py` or pytest.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+import lame_delegation_check as lame
+from bench_suite import ZONE, point_default_resolver, start_standin
+
+HOST, LAME_HOST, PORT = '127.0.0.1', '127.0.0.2', 5365
+RECORD_TYPES = ['A', 'AAAA', 'MX', 'NS', 'TXT']
+
+def test_output_comes_from_the_main_thread_in_check_order():
+    start_standin(HOST, PORT, LAME_HOST)
+    printed = []  # (thread, line) for every line the check prints
+
+    def record_print(*args):
+        printed.append((threading.current_thread(), ' '.join(map(str, args))))
+
+    previous = os.getcwd(), dns.resolver.default_resolver, lame.NAME_SERVER_PORT
+    with tempfile.TemporaryDirectory(prefix='lame-test-') as workdir:
+        os.chdir(workdir)
+        point_default_resolver(HOST, PORT)
+        lame.NAME_SERVER_PORT = PORT
+        lame.print = record_print
+        try:
+            assert lame.check_lame_delegation(f"lame1.{ZONE}") is True
+        finally:
+            del lame.print
+            os.chdir(previous[0])
+            dns.resolver.default_resolver, lame.NAME_SERVER_PORT = previous[1:]
+
+    assert {thread for thread, _ in printed} == {threading.main_thread()}
+    lines = [line for _, line in printed]
+    # Each name server's probe lines follow its "Checking" line, in record type order, before its verdict
+    good = lines.index(f"{lame.Colors.OKBLUE}Checking {HOST} for lame1.{ZONE}...{lame.Colors.ENDC}")
+    assert lines[good + 1:good + 7] == [
+        *(f"{lame.Colors.OKGREEN}{HOST} responds with valid {record_type} records.{lame.Colors.ENDC}"
+          if record_type in ('A', 'NS') else
+          f"{lame.Colors.WARNING}{HOST} responded with NOERROR but no {record_type} records found.{lame.Colors.ENDC}"
+          for record_type in RECORD_TYPES),
+        f"{lame.Colors.OKGREEN}ns-good.{ZONE}. ({HOST}) is responsive and returning valid answers for all checked record types.{lame.Colors.ENDC}",
+    ]
+    bad = lines.index(f"{lame.Colors.OKBLUE}Checking {LAME_HOST} for lame1.{ZONE}...{lame.Colors.ENDC}")
+    assert lines[bad + 1:bad + 7] == [
+        *(f"{lame.Colors.FAIL}{LAME_HOST} returned error code 2 for {record_type} records.{lame.Colors.ENDC}"
+          for record_type in RECORD_TYPES),
+        f"{lame.Colors.FAIL}ns-lame.{ZONE}. ({LAME_HOST}) is not responding correctly for the following record types:{lame.Colors.ENDC}",
+    ]
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
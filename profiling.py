@@ -0,0 +1,118 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+# --profile support shared by the entry points. A run is profiled two ways:
+# cProfile traces every call in the main thread (where the asyncio loop and
+# the scan driver run) and is written as a .pstats file, and a sampler
+# thread snapshots the stacks of every thread at a fixed interval, so time in
+# worker threads and time blocked on sockets, subprocesses or locks shows up
+# too. The samples are written as collapsed stacks ("frame;frame;frame count")
+# for flamegraph.pl, inferno or speedscope.
+
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+TOP_FUNCTIONS = 25
+IDLE_WORKER = '_worker (thread.py:'  # Leaf frame of a ThreadPoolExecutor thread blocked on its work queue
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def thread_label(thread):
+    # Pool workers differ only by their index; fold them into one root
+    name = thread.name if thread else 'unknown'
+    return name.rsplit('_', 1)[0] if name.startswith('ThreadPoolExecutor') else name
+
+class StackSampler:
+    """Samples every other thread's Python stack at a fixed interval."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}  # tuple of frame labels, root first -> samples
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            threads = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                if stack[0].startswith(IDLE_WORKER):
+                    continue  # A pool worker waiting for work is not time spent on anything
+                stack.append(thread_label(threads.get(ident)))
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{';'.join(stack)} {count}\n")
+
+    def top_self(self, limit=TOP_FUNCTIONS):
+        """Functions by the samples they were the innermost Python frame in, across all threads."""
+        leaves = {}
+        for stack, count in self.stacks.items():
+            leaves[stack[-1]] = leaves.get(stack[-1], 0) + count
+        return sorted(leaves.items(), key=lambda item: -item[1])[:limit]
+
+@contextlib.contextmanager
+def profiled(prefix):
+    """Profile the enclosed block into <prefix>.pstats and <prefix>.collapsed; a None prefix does nothing."""
+    if not prefix:
+        yield
+        return
+    profile = cProfile.Profile()
+    sampler = StackSampler()
+    started = time.perf_counter()
+    sampler.start()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        stats_file, collapsed_file = f"{prefix}.pstats", f"{prefix}.collapsed"
+        profile.dump_stats(stats_file)
+        sampler.write_collapsed(collapsed_file)
+        report(profile, sampler, elapsed)
+        print(f"Profile written to {stats_file} (pstats) and {collapsed_file} (collapsed stacks)")
+
+def report(profile, sampler, elapsed):
+    output = io.StringIO()
+    stats = pstats.Stats(profile, stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    print(f"Top {TOP_FUNCTIONS} functions by cumulative time (main thread, {elapsed:.1f}s):")
+    # Skip pstats' preamble up to the column header
+    lines = output.getvalue().splitlines()
+    header = next((index for index, line in enumerate(lines) if line.lstrip().startswith('ncalls')), 0)
+    print('\n'.join(line for line in lines[header:] if line.strip()))
+
+    if sampler.samples:
+        # Samples come less often than asked for when threads hold the GIL, so scale by the real rate.
+        # Thread-seconds: several threads in the same function add up, so the total can exceed the run time.
+        per_sample = elapsed / sampler.samples
+        print(f"Top {TOP_FUNCTIONS} functions by sampled self time (all threads, {sampler.samples} samples; "
+              f"C calls such as print or socket waits count towards their Python caller):")
+        for label, count in sampler.top_self():
+            print(f"{count * per_sample:8.2f}s  {label}")
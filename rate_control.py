@@ -0,0 +1,247 @@
+import asyncio
+import threading
+import time
+from collections import deque
+import dns.exception
+import dns.inet
+import dns.nameserver
+import dns.rcode
+
+# Adaptive per-server rate control for bulk queries.
+#
+# Every destination server gets its own concurrency window, managed like TCP
+# congestion control: the window doubles per round trip until the first sign
+# of congestion (slow start), then grows by one query per round trip
+# (additive increase) and halves on a timeout or REFUSED (multiplicative
+# decrease), at most once per round trip. Round-trip times are tracked as in
+# RFC 6298 and give each attempt an adaptive timeout, so a throttled server is
+# retried and slowed down instead of its timeouts passing for lame delegation.
+
+INITIAL_WINDOW = 4      # Queries in flight to a server before anything is known about it
+MIN_WINDOW = 1
+MAX_WINDOW = 512
+DECREASE_FACTOR = 0.5   # Multiplicative decrease on timeout or REFUSED
+RETRIES = 2             # Extra attempts after a timeout or REFUSED
+RETRY_BACKOFF = 0.2     # Seconds before the first retry of a REFUSED query, doubled per retry
+MIN_TIMEOUT = 1.0       # Floor for the RTT-derived per-attempt timeout
+UNKNOWN_RTT_SHARE = 0.5 # Share of the time left a first attempt gets before any RTT is known, so a retry still fits
+
+def server_key(address, port):
+    """The key a server's window is kept under: its address and port, e.g. 192.0.2.1:53 or [2001:db8::1]:53."""
+    return f"[{address}]:{port}" if ':' in address else f"{address}:{port}"
+
+class ServerRate:
+    """AIMD concurrency window and RTT estimate for one destination server."""
+
+    def __init__(self, server, initial_window=INITIAL_WINDOW, max_window=MAX_WINDOW):
+        self.server = server
+        self.window = float(initial_window)
+        self.max_window = max_window
+        self.slow_start_threshold = float(max_window)
+        self.in_flight = 0
+        self.srtt = None
+        self.rttvar = 0.0
+        self.last_decrease = 0.0
+        self.queries = 0
+        self.timeouts = 0
+        self.refused = 0
+        self.condition = threading.Condition()
+        self.async_waiters = deque()
+
+    def has_room(self):
+        return self.in_flight < int(self.window)
+
+    def acquire(self, deadline):
+        """Take a slot in the window, waiting at most until deadline (monotonic time); raise Timeout otherwise."""
+        with self.condition:
+            while not self.has_room():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise dns.exception.Timeout()
+                self.condition.wait(remaining)
+            self.in_flight += 1
+
+    async def acquire_async(self, deadline):
+        """Async counterpart of acquire()."""
+        while True:
+            with self.condition:
+                if self.has_room():
+                    self.in_flight += 1
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise dns.exception.Timeout()
+                waiter = asyncio.get_running_loop().create_future()
+                self.async_waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                with self.condition:
+                    # A wake-up that raced with the timeout goes to the next waiter instead
+                    self.wake()
+                raise dns.exception.Timeout()
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.wake()
+
+    def wake(self):
+        # Called with the condition held
+        self.condition.notify()
+        while self.async_waiters:
+            waiter = self.async_waiters.popleft()
+            if not waiter.done():
+                waiter.get_loop().call_soon_threadsafe(lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+                break
+
+    def attempt_timeout(self, remaining):
+        """The RTO for the next attempt (srtt + 4 * rttvar), capped by the time left."""
+        if self.srtt is None:
+            return min(remaining, max(MIN_TIMEOUT, remaining * UNKNOWN_RTT_SHARE))
+        return min(remaining, max(MIN_TIMEOUT, self.srtt + 4 * self.rttvar))
+
+    def on_response(self, rtt):
+        with self.condition:
+            self.queries += 1
+            if self.srtt is None:
+                self.srtt, self.rttvar = rtt, rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+            # Per response: +1 in slow start doubles the window per round trip, +1/window adds one
+            increase = 1.0 if self.window < self.slow_start_threshold else 1.0 / self.window
+            self.window = min(self.max_window, self.window + increase)
+            self.wake()
+
+    def on_congestion(self, kind):
+        with self.condition:
+            self.queries += 1
+            if kind == 'timeout':
+                self.timeouts += 1
+            else:
+                self.refused += 1
+            # Queries already in flight see the same congestion; react to it once per round trip
+            now = time.monotonic()
+            if now - self.last_decrease >= (self.srtt or 0.0):
+                self.window = max(MIN_WINDOW, self.window * DECREASE_FACTOR)
+                self.slow_start_threshold = max(MIN_WINDOW, self.window)
+                self.last_decrease = now
+
+class RateController:
+    """Per-server AIMD windows shared by every query of a run."""
+
+    def __init__(self, initial_window=INITIAL_WINDOW, max_window=MAX_WINDOW, retries=RETRIES):
+        self.initial_window = initial_window
+        self.max_window = max_window
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.servers = {}
+
+    def rate(self, server):
+        with self.lock:
+            if server not in self.servers:
+                self.servers[server] = ServerRate(server, self.initial_window, self.max_window)
+            return self.servers[server]
+
+    def query(self, server, send, timeout):
+        """Call send(attempt timeout) -> dns.message.Message within the server's window, retrying within `timeout` seconds."""
+        rate = self.rate(server)
+        deadline = time.monotonic() + timeout
+        for attempt in range(self.retries + 1):
+            # Waiting for room in the window counts against the same deadline as the query itself
+            rate.acquire(deadline)
+            started = time.monotonic()
+            try:
+                response = send(self.attempt_timeout(rate, attempt, deadline - started))
+            except dns.exception.Timeout:
+                rate.on_congestion('timeout')
+                if attempt == self.retries or deadline - time.monotonic() <= 0:
+                    raise
+                continue
+            finally:
+                rate.release()
+
+            if response.rcode() != dns.rcode.REFUSED:
+                rate.on_response(time.monotonic() - started)
+                return response
+            rate.on_congestion('refused')
+            if attempt == self.retries or deadline - time.monotonic() <= RETRY_BACKOFF * 2 ** attempt:
+                return response
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    async def query_async(self, server, send, timeout):
+        """Async counterpart of query(): await send(attempt timeout) within the server's window."""
+        rate = self.rate(server)
+        deadline = time.monotonic() + timeout
+        for attempt in range(self.retries + 1):
+            await rate.acquire_async(deadline)
+            started = time.monotonic()
+            try:
+                response = await send(self.attempt_timeout(rate, attempt, deadline - started))
+            except dns.exception.Timeout:
+                rate.on_congestion('timeout')
+                if attempt == self.retries or deadline - time.monotonic() <= 0:
+                    raise
+                continue
+            finally:
+                rate.release()
+
+            if response.rcode() != dns.rcode.REFUSED:
+                rate.on_response(time.monotonic() - started)
+                return response
+            rate.on_congestion('refused')
+            if attempt == self.retries or deadline - time.monotonic() <= RETRY_BACKOFF * 2 ** attempt:
+                return response
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    def attempt_timeout(self, rate, attempt, remaining):
+        # The last attempt gets all the time that is left, so a slow server is not written off early
+        remaining = max(remaining, 0.001)
+        return remaining if attempt == self.retries else rate.attempt_timeout(remaining)
+
+    def summary(self):
+        """Return one dict per server with its final window, smoothed RTT and query counts."""
+        with self.lock:
+            rates = list(self.servers.values())
+        return [{
+            'server': rate.server,
+            'window': round(rate.window, 1),
+            'srtt_ms': None if rate.srtt is None else round(rate.srtt * 1000, 1),
+            'queries': rate.queries,
+            'timeouts': rate.timeouts,
+            'refused': rate.refused,
+        } for rate in sorted(rates, key=lambda rate: rate.server)]
+
+    def report(self):
+        for entry in self.summary():
+            srtt = 'n/a' if entry['srtt_ms'] is None else f"{entry['srtt_ms']}ms"
+            print(f"Rate control: {entry['server']} window {entry['window']}, srtt {srtt}, "
+                  f"{entry['queries']} queries, {entry['timeouts']} timeouts, {entry['refused']} refused")
+
+class RateLimitedNameserver(dns.nameserver.Do53Nameserver):
+    """A dnspython Do53 nameserver whose queries go through a RateController."""
+
+    def __init__(self, address, port, controller):
+        super().__init__(address, port)
+        self.controller = controller
+        self.server = server_key(address, port)
+
+    def query(self, request, timeout, *args, **kwargs):
+        send = lambda attempt_timeout: super(RateLimitedNameserver, self).query(request, attempt_timeout, *args, **kwargs)
+        return self.controller.query(self.server, send, timeout)
+
+    async def async_query(self, request, timeout, *args, **kwargs):
+        send = lambda attempt_timeout: super(RateLimitedNameserver, self).async_query(request, attempt_timeout, *args, **kwargs)
+        return await self.controller.query_async(self.server, send, timeout)
+
+def install_rate_control(resolver, controller):
+    """Route resolver's plain-DNS nameservers through controller; other nameservers are left alone."""
+    nameservers = []
+    for nameserver in resolver.nameservers:
+        if isinstance(nameserver, str) and dns.inet.is_address(nameserver):
+            port = resolver.nameserver_ports.get(nameserver, resolver.port)
+            nameserver = RateLimitedNameserver(nameserver, port, controller)
+        nameservers.append(nameserver)
+    resolver.nameservers = nameservers
+    return controller
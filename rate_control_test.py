@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import dns.exception
+import dns.message
+import dns.rcode
+import dns.resolver
+
+# Tests for the per-server AIMD rate control. The "server" is a send()
+# callable, or a stub server on loopback where the checkers' own query paths
+# are exercised. Run with `python rate_control_test.py` or pytest.
+import instrumentation
+import lame_delegation_check as lame
+import rate_control
+from rate_control import RateController, ServerRate, install_rate_control, server_key
+from udp_engine_test import StubServer, answer
+
+def response(rcode=dns.rcode.NOERROR):
+    message = dns.message.make_response(dns.message.make_query('example.com', 'A'))
+    message.set_rcode(rcode)
+    return message
+
+def test_slow_start_doubles_the_window_per_round_trip():
+    rate = ServerRate('192.0.2.1:53', initial_window=4, max_window=64)
+    for expected in (8, 16, 32, 64, 64):
+        # One round trip: every query of the window is answered
+        for _ in range(int(rate.window)):
+            rate.on_response(0.01)
+        assert rate.window == expected
+
+def test_additive_increase_after_congestion():
+    rate = ServerRate('192.0.2.1:53', initial_window=16, max_window=64)
+    rate.on_congestion('timeout')
+    assert rate.window == 8 and rate.slow_start_threshold == 8
+    # Out of slow start a whole window of answers adds about one query
+    for _ in range(8):
+        rate.on_response(0.01)
+    assert 8.9 < rate.window < 9.0
+
+def test_multiplicative_decrease_once_per_round_trip():
+    rate = ServerRate('192.0.2.1:53', initial_window=32)
+    rate.on_response(0.05)
+    window = rate.window
+    rate.on_congestion('timeout')
+    # The rest of the round trip's losses are the same congestion event
+    rate.on_congestion('timeout')
+    rate.on_congestion('refused')
+    assert rate.window == window * rate_control.DECREASE_FACTOR
+    assert rate.timeouts == 2 and rate.refused == 1
+    time.sleep(0.06)
+    rate.on_congestion('refused')
+    assert rate.window == window * rate_control.DECREASE_FACTOR ** 2
+    for _ in range(20):
+        rate.last_decrease = 0.0
+        rate.on_congestion('timeout')
+    assert rate.window == rate_control.MIN_WINDOW
+
+def test_acquire_waits_for_room_until_the_deadline():
+    rate = ServerRate('192.0.2.1:53', initial_window=1)
+    rate.acquire(time.monotonic() + 1)
+    started = time.monotonic()
+    try:
+        rate.acquire(started + 0.1)
+    except dns.exception.Timeout:
+        pass
+    else:
+        raise AssertionError('acquire went past a full window')
+    assert 0.09 <= time.monotonic() - started < 0.5
+
+    # A release hands the slot to a waiter well before its deadline
+    threading.Timer(0.05, rate.release).start()
+    started = time.monotonic()
+    rate.acquire(started + 5)
+    assert time.monotonic() - started < 1 and rate.in_flight == 1
+
+def test_acquire_async_waits_for_room_until_the_deadline():
+    async def run():
+        rate = ServerRate('192.0.2.1:53', initial_window=1)
+        await rate.acquire_async(time.monotonic() + 1)
+        try:
+            await rate.acquire_async(time.monotonic() + 0.1)
+        except dns.exception.Timeout:
+            pass
+        else:
+            raise AssertionError('acquire_async went past a full window')
+        asyncio.get_running_loop().call_later(0.05, rate.release)
+        started = time.monotonic()
+        await rate.acquire_async(started + 5)
+        return time.monotonic() - started, rate.in_flight
+
+    waited, in_flight = asyncio.run(run())
+    assert waited < 1 and in_flight == 1
+
+def test_refused_is_retried_and_slows_the_server_down():
+    controller = RateController(initial_window=8, retries=2)
+    answers = [response(dns.rcode.REFUSED), response()]
+    backoff = rate_control.RETRY_BACKOFF
+    rate_control.RETRY_BACKOFF = 0.01
+    try:
+        assert controller.query('192.0.2.1:53', lambda timeout: answers.pop(0), 5).rcode() == dns.rcode.NOERROR
+    finally:
+        rate_control.RETRY_BACKOFF = backoff
+    rate = controller.rate('192.0.2.1:53')
+    assert rate.refused == 1 and rate.window < 8 and rate.in_flight == 0
+
+def test_server_keys_carry_the_port():
+    assert server_key('127.0.0.1', 5399) == '127.0.0.1:5399'
+    assert server_key('192.0.2.1', 53) == '192.0.2.1:53'
+    assert server_key('2001:db8::1', 53) == '[2001:db8::1]:53'
+    nameserver = rate_control.RateLimitedNameserver('127.0.0.1', 5399, RateController())
+    assert nameserver.server == server_key('127.0.0.1', 5399)
+
+def test_probes_and_resolver_lookups_share_a_server_window():
+    server = StubServer(lambda query, attempt: [answer(query)])
+    previous = lame.rate_controller, lame.NAME_SERVER_PORT
+    lame.rate_controller, lame.NAME_SERVER_PORT = RateController(), server.port
+    try:
+        lame.query_name_server('127.0.0.1', dns.message.make_query('host1.example.test', 'A'))
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers, resolver.port = ['127.0.0.1'], server.port
+        install_rate_control(resolver, lame.rate_controller)
+        resolver.resolve('host2.example.test', 'A')
+        assert [entry['server'] for entry in lame.rate_controller.summary()] == [f"127.0.0.1:{server.port}"]
+        assert lame.rate_controller.summary()[0]['queries'] == 2
+    finally:
+        lame.rate_controller, lame.NAME_SERVER_PORT = previous
+        server.close()
+
+def test_summary_goes_into_the_metrics_json():
+    controller = RateController()
+    controller.query('192.0.2.1:53', lambda timeout: response(), 5)
+    with tempfile.TemporaryDirectory(prefix='rate-control-test-') as metrics_dir:
+        _, summary = instrumentation.write_metrics(metrics_dir, 'rate_control_test', rate_control=controller.summary())
+        with open(summary) as f:
+            written = json.load(f)
+        assert os.path.exists(os.path.join(metrics_dir, 'rate_control_test.prom'))
+    assert written['rate_control'] == controller.summary()
+    assert written['rate_control'][0]['server'] == '192.0.2.1:53' and written['rate_control'][0]['queries'] == 1
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+from collections import namedtuple
+from journal import Journal
+
+# Streaming results for the domain shadowing checker. Every checked subdomain
+# becomes one typed JSON line in <domain>+results.jsonl, written through a
+# large buffer as results arrive, and the alert decision (any subdomain with
+# nameservers outside the whitelist) is kept in memory on the way. The file
+# is a journal (see journal.py), so --resume picks up where a run stopped.
+# The four historical text logs are views rendered from the same records,
+# either live (--text-logs) or afterwards with `python results_sink.py`.
+
+RESULTS_SUFFIX = '+results.jsonl'
+ALERT_PREVIEW = 5  # Alert lines kept in memory for the end-of-run summary
+
+LogFiles = namedtuple('LogFiles', ['main', 'dns_and_ns', 'ns', 'dns_only'])
+LOG_SUFFIXES = LogFiles('+.txt', '+dns_and_ns.txt', '+ns.txt', '+dns_only.txt')
+
+def subdomain_record(subdomain, registered, has_dns=False, ns_records=(), whitelist=(), dig=None, replayed=False):
+    """The typed result record for one subdomain.
+
+    verdict is one of unregistered, dns_and_ns, dns_only, ns_only, dns_no_ns
+    or no_dns; alert is set when any nameserver is outside the whitelist.
+    registered is None when WHOIS could not tell; such names get a DNS verdict.
+    """
+    foreign_ns = [ns for ns in ns_records if ns not in whitelist]
+    if registered is False:
+        verdict = 'unregistered'
+    elif has_dns:
+        verdict = 'dns_and_ns' if foreign_ns else 'dns_only' if ns_records else 'dns_no_ns'
+    else:
+        verdict = 'ns_only' if foreign_ns else 'no_dns'
+    record = {'type': 'subdomain', 'name': subdomain, 'verdict': verdict, 'registered': registered,
+              'has_dns': has_dns, 'ns': list(ns_records), 'foreign_ns': foreign_ns, 'alert': bool(foreign_ns)}
+    if replayed:
+        record['replayed'] = True
+    if dig is not None:
+        record['dig'] = dig
+    return record
+
+def ns_line(record):
+    return f"{record['name']} has nameservers: {', '.join(record['foreign_ns'])}\n"
+
+def render(record, views):
+    """Write a record's lines to the text logs, exactly as the checker used to write them."""
+    verdict = record['verdict']
+    if verdict == 'dns_and_ns':
+        views.dns_and_ns.write(f"{record['name']} has DNS records and nameservers: {', '.join(record['foreign_ns'])}\n")
+        views.ns.write(ns_line(record))
+    elif verdict == 'dns_only':
+        views.dns_only.write(f"{record['name']} has DNS records but no relevant nameservers.\n")
+    elif verdict == 'ns_only':
+        views.main.write(f"{record['name']} has nameservers but no DNS records.\n")
+        views.ns.write(ns_line(record))
+    if 'dig' in record:
+        views.main.write(f"\nOutput for {record['name']} (A):\n")
+        views.main.write(record['dig'])
+
+class ResultSink(Journal):
+    """JSONL journal of one target's results that decides the alert as records arrive.
+
+    With resume=True the records of an interrupted run are kept, counted and
+    rendered to the views again, and their names are listed in `completed`.
+    """
+
+    def __init__(self, path, views=None, resume=False):
+        self.views = views  # LogFiles of open text logs, or None
+        self.records = 0
+        self.alerts = 0
+        self.alert_preview = []
+        self.completed = set()
+        super().__init__(path, resume, self.replay)
+
+    def replay(self, record):
+        self.completed.add(record['name'])
+        self.count(record)
+
+    def write(self, record):
+        self.append(record)
+        self.count(record)
+
+    def count(self, record):
+        self.records += 1
+        if record.get('alert'):
+            self.alerts += 1
+            if len(self.alert_preview) < ALERT_PREVIEW:
+                self.alert_preview.append(ns_line(record).rstrip('\n'))
+        if self.views is not None:
+            render(record, self.views)
+
+def read_results(path):
+    """Yield the records of a results file."""
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def log_filename(results_path, suffix):
+    """The text log that goes with a results file, e.g. example.com+ns.txt for example.com+results.jsonl."""
+    base = results_path[:-len(RESULTS_SUFFIX)] if results_path.endswith(RESULTS_SUFFIX) else os.path.splitext(results_path)[0]
+    return base + suffix
+
+def render_views(results_path):
+    """Render the four text logs from a results file; return their filenames."""
+    filenames = LogFiles(*(log_filename(results_path, suffix) for suffix in LOG_SUFFIXES))
+    files = [open(filename, 'w') for filename in filenames]
+    try:
+        views = LogFiles(*files)
+        for record in read_results(results_path):
+            if record.get('type') == 'subdomain':
+                render(record, views)
+    finally:
+        for f in files:
+            f.close()
+    return filenames
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the text logs (+.txt, +dns_and_ns.txt, +ns.txt, +dns_only.txt) from a +results.jsonl file.")
+    parser.add_argument('results_files', nargs='+', help='The +results.jsonl files to render.')
+    args = parser.parse_args()
+
+    for results_file in args.results_files:
+        print(f"{results_file}: wrote {', '.join(render_views(results_file))}")
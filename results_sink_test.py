@@ -0,0 +1,82 @@
+import io
+import os
+import tempfile
+
+# Tests for the streaming results sink and the text logs rendered from it.
+# Run with `python results_sink_test.py` or pytest.
+from results_sink import LOG_SUFFIXES, RESULTS_SUFFIX, LogFiles, ResultSink, render_views, subdomain_record
+
+WHITELIST = ['ns1.example.com']
+RECORDS = [
+    subdomain_record('both.example.com', True, True, ['ns.shadow.net', 'ns1.example.com'], WHITELIST,
+                     dig='; <<>> DNS-Checker <<>> both.example.com A\n'),
+    subdomain_record('dns.example.com', True, True, ['ns1.example.com'], WHITELIST),
+    subdomain_record('ns.example.com', True, False, ['ns.shadow.net'], WHITELIST),
+    subdomain_record('none.example.com', True, False, [], WHITELIST),
+    subdomain_record('free.example.com', False),
+]
+
+# What the checker wrote to each text log before the JSONL stream replaced them
+EXPECTED = LogFiles(
+    main=('\nOutput for both.example.com (A):\n'
+          '; <<>> DNS-Checker <<>> both.example.com A\n'
+          'ns.example.com has nameservers but no DNS records.\n'),
+    dns_and_ns='both.example.com has DNS records and nameservers: ns.shadow.net\n',
+    ns='both.example.com has nameservers: ns.shadow.net\nns.example.com has nameservers: ns.shadow.net\n',
+    dns_only='dns.example.com has DNS records but no relevant nameservers.\n',
+)
+
+def test_verdicts():
+    assert [record['verdict'] for record in RECORDS] == ['dns_and_ns', 'dns_only', 'ns_only', 'no_dns', 'unregistered']
+    assert [record['alert'] for record in RECORDS] == [True, False, True, False, False]
+    assert subdomain_record('odd.example.com', None, True, [], WHITELIST)['verdict'] == 'dns_no_ns'
+
+def test_text_logs_are_rendered_from_the_stream():
+    with tempfile.TemporaryDirectory(prefix='results-sink-test-') as workdir:
+        results_file = os.path.join(workdir, f"example.com{RESULTS_SUFFIX}")
+        with ResultSink(results_file) as sink:
+            for record in RECORDS:
+                sink.write(record)
+        assert (sink.records, sink.alerts) == (5, 2)
+        assert sink.alert_preview == ['both.example.com has nameservers: ns.shadow.net',
+                                      'ns.example.com has nameservers: ns.shadow.net']
+
+        filenames = render_views(results_file)
+        assert filenames == LogFiles(*(os.path.join(workdir, 'example.com' + suffix) for suffix in LOG_SUFFIXES))
+        for filename, expected in zip(filenames, EXPECTED):
+            with open(filename) as f:
+                assert f.read() == expected
+
+def test_live_views_match_the_rendered_ones():
+    with tempfile.TemporaryDirectory(prefix='results-sink-test-') as workdir:
+        views = LogFiles(*(io.StringIO() for _ in LOG_SUFFIXES))
+        with ResultSink(os.path.join(workdir, f"example.com{RESULTS_SUFFIX}"), views) as sink:
+            for record in RECORDS:
+                sink.write(record)
+        assert LogFiles(*(view.getvalue() for view in views)) == EXPECTED
+
+def test_resume_counts_and_renders_the_kept_records():
+    with tempfile.TemporaryDirectory(prefix='results-sink-test-') as workdir:
+        results_file = os.path.join(workdir, f"example.com{RESULTS_SUFFIX}")
+        with ResultSink(results_file) as sink:
+            for record in RECORDS[:3]:
+                sink.write(record)
+        with open(results_file, 'a') as f:
+            f.write('{"type":"subdomain","name":"none.exa')
+
+        views = LogFiles(*(io.StringIO() for _ in LOG_SUFFIXES))
+        with ResultSink(results_file, views, resume=True) as sink:
+            assert sink.completed == {'both.example.com', 'dns.example.com', 'ns.example.com'}
+            assert (sink.records, sink.alerts) == (3, 2)
+            for record in RECORDS[3:]:
+                sink.write(record)
+        assert LogFiles(*(view.getvalue() for view in views)) == EXPECTED
+        render_views(results_file)
+        with open(os.path.join(workdir, 'example.com+ns.txt')) as f:
+            assert f.read() == EXPECTED.ns
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
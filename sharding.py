@@ -0,0 +1,134 @@
+import argparse
+import os
+import sys
+import zlib
+from results_sink import RESULTS_SUFFIX, ALERT_PREVIEW, ResultSink, read_results
+
+# Static sharding of a sweep across hosts. `--shard K/N` keeps the names whose
+# CRC32 falls in bucket K of N, so every host computes the same partition
+# without coordinating. Each shard writes its outputs under its own name
+# (example.com.shard2of4+results.jsonl) and `python sharding.py` merges them back
+# into the report and alert decision a single-host run would have produced.
+
+TAKEOVER_SEPARATOR = "\n" + "=" * 40 + "\n"  # Between takeovers in V9's _dangling_records.txt
+TAKEOVERS_HEADER = '\033[32mTakeovers found:\033[0m\n'  # colorama Fore.GREEN / Style.RESET_ALL, as V9 writes it
+
+# Define ANSI color codes
+class Colors:
+    HEADER = '\033[95m'
+    OKGREEN = '\033[92m'
+    WARNING = '\033[93m'
+    FAIL = '\033[91m'
+    ENDC = '\033[0m'
+
+def parse_shard(spec):
+    """Parse a K/N shard spec (1 <= K <= N) into (K, N); usable as an argparse type."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like K/N, got {spec!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard K/N needs 1 <= K <= N, got {spec!r}")
+    return index, count
+
+def shard_of(name, count):
+    """The 1-based shard a name belongs to; stable across hosts and Python versions."""
+    return zlib.crc32(name.rstrip('.').lower().encode()) % count + 1
+
+def select_shard(names, shard):
+    """Keep the names that belong to shard (K, N); shard None keeps everything."""
+    if shard is None:
+        return list(names)
+    index, count = shard
+    return [name for name in names if shard_of(name, count) == index]
+
+def shard_suffix(shard):
+    """The tag a shard adds to its output filenames, e.g. '.shard2of4'."""
+    return '' if shard is None else f".shard{shard[0]}of{shard[1]}"
+
+def merge_lines(files):
+    """Union the lines of the given files, deduplicated and sorted."""
+    lines = set()
+    for file_path in files:
+        with open(file_path, 'r') as f:
+            lines.update(line.rstrip('\n') for line in f if line.strip())
+    return sorted(lines)
+
+def merge_takeovers(files):
+    """Union the takeover reports in V9 _dangling_records.txt files, keeping first-seen order."""
+    takeovers = {}
+    for file_path in files:
+        with open(file_path, 'r') as f:
+            _, _, body = f.read().partition('\n')
+        for takeover in body.split(TAKEOVER_SEPARATOR):
+            if takeover.strip():
+                takeovers.setdefault(takeover, None)
+    return list(takeovers)
+
+def merge_results(files):
+    """Union the records of +results.jsonl files, one per subdomain, sorted by name."""
+    records = {}
+    for file_path in files:
+        for record in read_results(file_path):
+            records.setdefault(record['name'], record)
+    return [records[name] for name in sorted(records)]
+
+def merge_shadowing_results(domain, files, output=None):
+    """Merge per-shard +results.jsonl files; return True if the merged results should trigger the alert."""
+    output = output or f"{domain}{RESULTS_SUFFIX}"
+    with ResultSink(output) as sink:
+        for record in merge_results(files):
+            sink.write(record)
+
+    if not sink.alerts:
+        print(f"{Colors.WARNING}No subdomain in {output} has nameservers outside the whitelist, which is good.{Colors.ENDC}")
+        return False
+    print(f"Attention! {Colors.OKGREEN}{sink.alerts} subdomains have nameservers outside the whitelist ({output}):{Colors.ENDC}")
+    for line in sink.alert_preview[:ALERT_PREVIEW]:
+        print(line)
+    return True
+
+def merge_shadowing(domain, files, output=None):
+    """Merge per-shard +results.jsonl files (or +ns.txt logs); return True if the merge should trigger the alert."""
+    if all(file_path.endswith('.jsonl') for file_path in files):
+        return merge_shadowing_results(domain, files, output)
+    output = output or f"{domain}+ns.txt"
+    lines = merge_lines(files)
+    with open(output, 'w') as f:
+        f.writelines(line + '\n' for line in lines)
+
+    if not lines:
+        print(f"{Colors.WARNING}Log file {output} is empty which is good.{Colors.ENDC}")
+        return False
+    print(f"Attention! {Colors.OKGREEN}Log file contains the following information:{Colors.ENDC}")
+    for line in lines[:5]:
+        print(line)
+    return True
+
+def merge_dangling(domain, files, output=None):
+    """Merge per-shard V9 _dangling_records.txt reports; return True if any takeover was found."""
+    output = output or f"{domain}_dangling_records.txt"
+    # V9 only writes the report when it found takeovers, so missing shards found none
+    takeovers = merge_takeovers([file_path for file_path in files if os.path.exists(file_path)])
+    if not takeovers:
+        print(f"{Colors.WARNING}No takeovers found.{Colors.ENDC}")
+        return False
+
+    with open(output, 'w') as f:
+        f.write(TAKEOVERS_HEADER)
+        for takeover in takeovers:
+            f.write(takeover + TAKEOVER_SEPARATOR)
+    print(f"{Colors.OKGREEN}{len(takeovers)} takeovers found; merged report written to {output}{Colors.ENDC}")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the outputs of a sharded sweep and make the alert decision.")
+    parser.add_argument('kind', choices=['shadowing', 'dangling'], help='shadowing merges +results.jsonl files (or +ns.txt logs), dangling merges V9 _dangling_records.txt reports.')
+    parser.add_argument('domain', type=str, help='The target domain the shards were run for.')
+    parser.add_argument('files', nargs='+', help='The per-shard output files.')
+    parser.add_argument('--output', type=str, help='Where to write the merged report (default: the single-host filename).')
+    args = parser.parse_args()
+
+    merge = merge_shadowing if args.kind == 'shadowing' else merge_dangling
+    # Exit status 1 signals that the alert should be triggered
+    sys.exit(1 if merge(args.domain, args.files, args.output) else 0)
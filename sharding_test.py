@@ -0,0 +1,117 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+# Tests for splitting a sweep with --shard and merging the shards' outputs.
+# Run with `python sharding_test.py` or pytest.
+import sharding
+from results_sink import RESULTS_SUFFIX, ResultSink, read_results, subdomain_record
+from sharding import TAKEOVER_SEPARATOR, TAKEOVERS_HEADER, parse_shard, select_shard, shard_of, shard_suffix
+
+NAMES = [f"host{index}.example.com" for index in range(1000)]
+
+def test_shards_are_disjoint_and_cover_every_name():
+    for count in (1, 2, 3, 7):
+        shards = [select_shard(NAMES, (index, count)) for index in range(1, count + 1)]
+        assert sum(len(shard) for shard in shards) == len(NAMES)
+        assert sorted(name for shard in shards for name in shard) == sorted(NAMES)
+        # No shard is left (nearly) empty
+        assert all(len(shard) > len(NAMES) / count / 2 for shard in shards)
+    assert select_shard(NAMES, None) == NAMES
+
+def test_shard_of_ignores_case_and_the_trailing_dot():
+    for name in NAMES[:50]:
+        assert shard_of(name.upper() + '.', 4) == shard_of(name, 4)
+        assert 1 <= shard_of(name, 4) <= 4
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4) and parse_shard('1/1') == (1, 1)
+    for spec in ('0/4', '5/4', '2', '2/x', 'a/b', '1/2/3'):
+        try:
+            parse_shard(spec)
+        except argparse.ArgumentTypeError:
+            pass
+        else:
+            raise AssertionError(f"{spec!r} was accepted")
+    assert shard_suffix((2, 4)) == '.shard2of4' and shard_suffix(None) == ''
+
+def write_shard_results(workdir, records, count):
+    """Split records over count shards as the checker would; return the shards' results files."""
+    files = []
+    for index in range(1, count + 1):
+        path = os.path.join(workdir, f"example.com{shard_suffix((index, count))}{RESULTS_SUFFIX}")
+        with ResultSink(path) as sink:
+            for record in records:
+                if shard_of(record['name'], count) == index:
+                    sink.write(record)
+        files.append(path)
+    return files
+
+def test_results_merge_across_shards():
+    whitelist = ['ns1.example.com']
+    records = [subdomain_record(f"host{index}.example.com", True, True,
+                                ['ns1.example.com'] if index % 3 else ['ns.shadow.net'], whitelist)
+               for index in range(30)]
+    with tempfile.TemporaryDirectory(prefix='sharding-test-') as workdir:
+        files = write_shard_results(workdir, records, 3)
+        # A shard run twice (or resumed) repeats its records; the merge keeps one per name
+        files.append(files[0])
+        output = os.path.join(workdir, f"example.com{RESULTS_SUFFIX}")
+        with contextlib.redirect_stdout(io.StringIO()) as printed:
+            assert sharding.merge_shadowing('example.com', files, output) is True
+        merged = list(read_results(output))
+    assert merged == sorted(records, key=lambda record: record['name'])
+    assert "10 subdomains have nameservers outside the whitelist" in printed.getvalue()
+
+def test_merge_without_alerts_does_not_trigger():
+    records = [subdomain_record(f"host{index}.example.com", True, True, ['ns1.example.com'], ['ns1.example.com'])
+               for index in range(10)]
+    with tempfile.TemporaryDirectory(prefix='sharding-test-') as workdir:
+        files = write_shard_results(workdir, records, 2)
+        output = os.path.join(workdir, f"example.com{RESULTS_SUFFIX}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert sharding.merge_shadowing('example.com', files, output) is False
+        with open(output) as f:
+            assert [json.loads(line)['name'] for line in f] == sorted(record['name'] for record in records)
+
+def test_ns_logs_merge_across_shards():
+    with tempfile.TemporaryDirectory(prefix='sharding-test-') as workdir:
+        files = []
+        for index, lines in enumerate((['b.example.com has nameservers: ns.shadow.net'],
+                                       ['a.example.com has nameservers: ns.shadow.net',
+                                        'b.example.com has nameservers: ns.shadow.net'])):
+            files.append(os.path.join(workdir, f"shard{index}+ns.txt"))
+            with open(files[-1], 'w') as f:
+                f.writelines(line + '\n' for line in lines)
+        output = os.path.join(workdir, 'example.com+ns.txt')
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert sharding.merge_shadowing('example.com', files, output) is True
+        with open(output) as f:
+            assert f.read() == ('a.example.com has nameservers: ns.shadow.net\n'
+                                'b.example.com has nameservers: ns.shadow.net\n')
+
+def test_takeover_reports_merge_across_shards():
+    with tempfile.TemporaryDirectory(prefix='sharding-test-') as workdir:
+        files = []
+        for index, takeovers in enumerate((['a.example.com -> unclaimed.s3'],
+                                           ['b.example.com -> unclaimed.azure', 'a.example.com -> unclaimed.s3'])):
+            files.append(os.path.join(workdir, f"example_com.shard{index + 1}of3_dangling_records.txt"))
+            with open(files[-1], 'w') as f:
+                f.write(TAKEOVERS_HEADER + ''.join(takeover + TAKEOVER_SEPARATOR for takeover in takeovers))
+        # The third shard found nothing, so it wrote no report
+        files.append(os.path.join(workdir, 'example_com.shard3of3_dangling_records.txt'))
+        output = os.path.join(workdir, 'example.com_dangling_records.txt')
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert sharding.merge_dangling('example.com', files, output) is True
+        assert sharding.merge_takeovers([output]) == ['a.example.com -> unclaimed.s3', 'b.example.com -> unclaimed.azure']
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert sharding.merge_dangling('example.com', files[2:], output) is False
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
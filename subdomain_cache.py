@@ -0,0 +1,170 @@
+import fcntl
+import os
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+
+# Compact crt.sh subdomain cache.
+#
+# The file is a sequence of frames, each a 5-byte header (kind, length)
+# followed by its payload. Every refresh appends three frames holding only the
+# names seen in certificates newer than the highest crt.sh certificate id
+# already cached:
+#
+#   H  "<fetched at>\t<highest cert id>"
+#   N  zlib("name\nname\n...")
+#   M  zlib("first seen\tlast seen\tcert id\n...")   (one line per name above)
+#
+# Names and their metadata are compressed separately so loading just the names
+# never touches the metadata. The format is several times smaller than the
+# JSON cache it replaced and a refresh only appends, but it is not faster to
+# load: snapshot() builds a Python set of every name, which takes about as long
+# as loading the same names from JSON did. Readers take a shared lock and
+# writers an exclusive one; every write goes to a temporary file that replaces
+# the cache atomically, and after MAX_REFRESHES refreshes they are compacted
+# into one.
+
+FRAME_HEADER = struct.Struct('>cI')
+MAX_REFRESHES = 16
+COMPRESS_LEVEL = 1  # About 5% larger than zlib's default level, in a fifth of the time
+
+class SubdomainCache:
+    """crt.sh names for one domain with first/last seen times and highest certificate id."""
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+
+    @contextmanager
+    def locked(self, exclusive=False):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        with open(self.cache_file + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read_raw(self):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return b''
+
+    def parse_members(self, raw):
+        """Return [fetched at, highest cert id, names frame, meta frame] for each refresh; frames stay compressed."""
+        members = []
+        offset = 0
+        while offset < len(raw):
+            kind, length = FRAME_HEADER.unpack_from(raw, offset)
+            offset += FRAME_HEADER.size
+            payload = raw[offset:offset + length]
+            offset += length
+            if kind == b'H':
+                fetched_at, cert_id = payload.decode().split('\t')
+                members.append([int(fetched_at), int(cert_id), b'', b''])
+            elif kind == b'N':
+                members[-1][2] = payload
+            elif kind == b'M':
+                members[-1][3] = payload
+        return members
+
+    def decode_block(self, frame):
+        return zlib.decompress(frame).decode().split('\n') if frame else []
+
+    def read_members(self):
+        with self.locked():
+            try:
+                return self.parse_members(self.read_raw())
+            except (struct.error, zlib.error, IndexError, ValueError):
+                print(f"Ignoring unreadable subdomain cache {self.cache_file}")
+                return []
+
+    def snapshot(self):
+        """Return (last fetch time or None, highest cert id, set of names)."""
+        members = self.read_members()
+        names = set()
+        for _, _, names_frame, _ in members:
+            names.update(self.decode_block(names_frame))
+        fetched_at = max((member[0] for member in members), default=None)
+        cert_id = max((member[1] for member in members), default=0)
+        return fetched_at, cert_id, names
+
+    def renewed_since(self, cert_id):
+        """Return (highest cached cert id, names seen in certificates newer than cert_id).
+
+        Refreshes that hold nothing newer than cert_id are skipped undecompressed.
+        """
+        members = self.read_members()
+        names = set()
+        for _, member_cert_id, names_frame, meta_frame in members:
+            if member_cert_id <= cert_id:
+                continue  # A refresh's header holds the highest cert id of the cache at that time
+            for name, meta in zip(self.decode_block(names_frame), self.decode_block(meta_frame)):
+                if int(meta.rsplit('\t', 1)[1]) > cert_id:
+                    names.add(name)
+        return max((member[1] for member in members), default=0), names
+
+    def merged_entries(self, members):
+        """Fold members into {name: [first seen, last seen, cert id]}."""
+        entries = {}
+        for _, _, names_frame, meta_frame in members:
+            for name, meta in zip(self.decode_block(names_frame), self.decode_block(meta_frame)):
+                first_seen, last_seen, cert_id = map(int, meta.split('\t'))
+                entry = entries.get(name)
+                if entry is None:
+                    entries[name] = [first_seen, last_seen, cert_id]
+                else:
+                    entry[0] = min(entry[0], first_seen)
+                    entry[1] = max(entry[1], last_seen)
+                    entry[2] = max(entry[2], cert_id)
+        return entries
+
+    def load(self):
+        """Return {name: (first seen, last seen, highest cert id)}."""
+        return {name: tuple(entry) for name, entry in self.merged_entries(self.read_members()).items()}
+
+    def encode_member(self, fetched_at, cert_id, names, meta):
+        """Frames for one refresh of the sorted names, with meta holding each name's metadata line."""
+        frames = [(b'H', f"{fetched_at}\t{cert_id}".encode())]
+        if names:
+            frames.append((b'N', zlib.compress('\n'.join(names).encode(), COMPRESS_LEVEL)))
+            frames.append((b'M', zlib.compress('\n'.join(meta).encode(), COMPRESS_LEVEL)))
+        return b''.join(FRAME_HEADER.pack(kind, len(payload)) + payload for kind, payload in frames)
+
+    def merge(self, new_names, fetched_at=None):
+        """Record a refresh: new_names maps each name seen in newer certificates to its highest cert id."""
+        fetched_at = int(fetched_at or time.time())
+        # Tabs and newlines separate the fields and names on disk
+        new_names = {name: cert_id for name, cert_id in new_names.items()
+                     if name and '\t' not in name and '\n' not in name}
+
+        with self.locked(exclusive=True):
+            raw = self.read_raw()
+            try:
+                members = self.parse_members(raw)
+                # Compact everything into one member
+                entries = self.merged_entries(members) if len(members) + 1 > MAX_REFRESHES else None
+            except (struct.error, zlib.error, IndexError, ValueError):
+                raw, members, entries = b'', [], None
+            cert_id = max([member[1] for member in members] + list(new_names.values()) + [0])
+
+            if entries is None:
+                names = sorted(new_names)
+                seen = f"{fetched_at}\t{fetched_at}\t"
+                data = raw + self.encode_member(fetched_at, cert_id, names,
+                                                [seen + str(new_names[name]) for name in names])
+            else:
+                for name, name_cert_id in new_names.items():
+                    entry = entries.setdefault(name, [fetched_at, fetched_at, name_cert_id])
+                    entry[1] = max(entry[1], fetched_at)
+                    entry[2] = max(entry[2], name_cert_id)
+                names = sorted(entries)
+                data = self.encode_member(fetched_at, cert_id, names, [
+                    f"{entries[name][0]}\t{entries[name][1]}\t{entries[name][2]}" for name in names])
+
+            temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, self.cache_file)
@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+# Tests for the crt.sh subdomain cache. Run with `python subdomain_cache_test.py` or pytest.
+import subdomain_cache
+from subdomain_cache import FRAME_HEADER, SubdomainCache
+
+def test_refreshes_append_and_compact():
+    with tempfile.TemporaryDirectory(prefix='subdomain-cache-test-') as workdir:
+        cache = SubdomainCache(os.path.join(workdir, 'example_com.bin'))
+        cache.merge({'a.example.com': 10, 'b.example.com': 11}, fetched_at=100)
+        cache.merge({'b.example.com': 12, 'c.example.com': 13, 'bad\tname.example.com': 14}, fetched_at=200)
+        assert cache.snapshot() == (200, 13, {'a.example.com', 'b.example.com', 'c.example.com'})
+        refreshes = subdomain_cache.MAX_REFRESHES
+        subdomain_cache.MAX_REFRESHES = 2
+        try:
+            cache.merge({'a.example.com': 15}, fetched_at=300)
+        finally:
+            subdomain_cache.MAX_REFRESHES = refreshes
+        assert len(cache.read_members()) == 1
+        assert cache.load() == {'a.example.com': (100, 300, 15), 'b.example.com': (100, 200, 12),
+                                'c.example.com': (200, 200, 13)}
+
+def test_merge_replaces_a_cache_with_a_corrupt_names_block():
+    with tempfile.TemporaryDirectory(prefix='subdomain-cache-test-') as workdir:
+        cache = SubdomainCache(os.path.join(workdir, 'example_com.bin'))
+        cache.merge({'a.example.com': 10}, fetched_at=100)
+        # Keep the frame lengths but garble the compressed names
+        with open(cache.cache_file, 'rb') as f:
+            raw = bytearray(f.read())
+        names_frame = raw.index(b'N', FRAME_HEADER.size)
+        raw[names_frame + FRAME_HEADER.size:names_frame + FRAME_HEADER.size + 4] = b'\xff' * 4
+        with open(cache.cache_file, 'wb') as f:
+            f.write(raw)
+        refreshes = subdomain_cache.MAX_REFRESHES
+        subdomain_cache.MAX_REFRESHES = 1
+        try:
+            cache.merge({'b.example.com': 11}, fetched_at=200)
+        finally:
+            subdomain_cache.MAX_REFRESHES = refreshes
+        assert cache.snapshot() == (200, 11, {'b.example.com'})
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
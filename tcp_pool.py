@@ -0,0 +1,187 @@
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+import dns.exception
+import dns.message
+
+# TCP fallback for answers that come back truncated over UDP. Connections are
+# pooled per server and pipelined as RFC 7766 allows: several queries are
+# written to one connection without waiting, each under its own message id,
+# and a reader thread hands every response (in whatever order the server
+# sends them) to the query waiting for that id. A large-answer domain then
+# costs one handshake per server rather than one per record type.
+
+MAX_CONNECTIONS_PER_SERVER = 2
+MAX_PIPELINE = 16        # Outstanding queries per connection before another one is opened
+IDLE_TIMEOUT = 10.0      # Seconds an idle connection is kept open
+DEFAULT_TIMEOUT = 5.0
+SUBMIT_WORKERS = 32      # Threads behind submit() for callers that cannot block
+LENGTH = struct.Struct('>H')
+
+class TCPConnectionError(dns.exception.DNSException):
+    """The pooled TCP connection failed or was closed by the server."""
+
+class PipelinedConnection:
+    """One TCP connection to a server carrying several queries at once."""
+
+    def __init__(self, server, port, timeout):
+        self.sock = socket.create_connection((server, port), timeout=timeout)
+        self.sock.settimeout(IDLE_TIMEOUT)
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.pending = {}  # message id -> Future of the response wire
+        self.closed = False
+        self.next_id = 0
+        self.reader = threading.Thread(target=self.read_loop, daemon=True)
+        self.reader.start()
+
+    def has_room(self):
+        return not self.closed and len(self.pending) < MAX_PIPELINE
+
+    def submit(self, wire):
+        """Write a query and return (Future of the response wire, message id used on this connection)."""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise TCPConnectionError("connection already closed")
+            while self.next_id in self.pending:
+                self.next_id = (self.next_id + 1) & 0xFFFF
+            query_id = self.next_id
+            self.next_id = (self.next_id + 1) & 0xFFFF
+            self.pending[query_id] = future
+        try:
+            with self.send_lock:
+                self.sock.sendall(LENGTH.pack(len(wire)) + query_id.to_bytes(2, 'big') + wire[2:])
+        except OSError as e:
+            self.fail(TCPConnectionError(str(e)))
+        return future, query_id
+
+    def abandon(self, query_id):
+        with self.lock:
+            self.pending.pop(query_id, None)
+
+    def read_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            try:
+                chunk = self.sock.recv(size - len(data))
+            except socket.timeout:
+                with self.lock:
+                    idle = not self.pending and not data
+                if idle:
+                    raise TCPConnectionError("idle connection closed")
+                continue
+            if not chunk:
+                raise TCPConnectionError("connection closed by the server")
+            data += chunk
+        return data
+
+    def read_loop(self):
+        try:
+            while True:
+                length, = LENGTH.unpack(self.read_exactly(LENGTH.size))
+                wire = self.read_exactly(length)
+                with self.lock:
+                    future = self.pending.pop(int.from_bytes(wire[:2], 'big'), None)
+                if future is not None and not future.done():
+                    future.set_result(wire)
+        except (OSError, TCPConnectionError) as e:
+            self.fail(e if isinstance(e, TCPConnectionError) else TCPConnectionError(str(e)))
+
+    def fail(self, error):
+        with self.lock:
+            self.closed = True
+            futures = list(self.pending.values())
+            self.pending.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+class TCPPool:
+    """Per-server pools of pipelined TCP connections for DNS queries."""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS_PER_SERVER, timeout=DEFAULT_TIMEOUT):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.connections = {}  # (server, port) -> [PipelinedConnection]
+        self.server_locks = {}
+        self.executor = None
+        self.queries = 0
+        self.opened = 0
+
+    def connection(self, server, port):
+        """Return (connection, whether it was already open), opening one if all are busy and the cap allows."""
+        with self.lock:
+            server_lock = self.server_locks.setdefault((server, port), threading.Lock())
+        # Queries racing to the same server wait for one connect and then pipeline over it
+        with server_lock:
+            connections = [connection for connection in self.connections.get((server, port), []) if not connection.closed]
+            self.connections[(server, port)] = connections
+            with_room = [connection for connection in connections if connection.has_room()]
+            if with_room:
+                return min(with_room, key=lambda connection: len(connection.pending)), True
+            if len(connections) >= self.max_connections:
+                # Everything is busy: pipeline deeper rather than open more connections than allowed
+                return min(connections, key=lambda connection: len(connection.pending)), True
+            try:
+                connection = PipelinedConnection(server, port, self.timeout)
+            except OSError as e:
+                raise TCPConnectionError(f"could not connect to {server}:{port}: {e}")
+            connections.append(connection)
+            with self.lock:
+                self.opened += 1
+            return connection, False
+
+    def query_wire(self, wire, server, port=53, timeout=None):
+        """Send a wire-format query over a pooled connection and return the response wire."""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            self.queries += 1
+        for attempt in range(2):
+            connection, reused = self.connection(server, port)
+            try:
+                future, query_id = connection.submit(wire)
+                response = future.result(max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                connection.abandon(query_id)
+                raise dns.exception.Timeout(timeout=timeout)
+            except TCPConnectionError:
+                # A pooled connection may have been closed by the server while idle; retry once on a new one
+                if reused and attempt == 0 and time.monotonic() < deadline:
+                    continue
+                raise
+            # The connection used its own message id; give the caller back the one it sent
+            return wire[:2] + response[2:]
+
+    def query(self, message, server, port=53, timeout=None):
+        """Send a dns.message query over a pooled connection and return the parsed response."""
+        return dns.message.from_wire(self.query_wire(message.to_wire(), server, port, timeout))
+
+    def submit(self, wire, server, port=53, timeout=None):
+        """Run query_wire() in the background and return a Future of the response wire."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=SUBMIT_WORKERS)
+        return self.executor.submit(self.query_wire, wire, server, port, timeout)
+
+    def close(self):
+        with self.lock:
+            connections = [connection for pool in self.connections.values() for connection in pool]
+            self.connections.clear()
+        for connection in connections:
+            connection.fail(TCPConnectionError("pool closed"))
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def report(self):
+        if self.queries:
+            print(f"TCP fallback: {self.queries} queries over {self.opened} connections")
@@ -0,0 +1,135 @@
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import dns.message
+import dns.rrset
+
+# Tests for the pipelined TCP pool against a stub DNS-over-TCP server on
+# loopback. Run with `python tcp_pool_test.py` or pytest.
+from tcp_pool import LENGTH, TCPConnectionError, TCPPool
+
+class StubTCPServer:
+    """Accepts connections on loopback and hands each to serve(connection number, Connection) in its own thread."""
+
+    def __init__(self, serve):
+        self.serve = serve
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self.connections = 0
+        self.query_ids = []  # Message ids of every query received, in order
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return  # Closed
+            self.connections += 1
+            threading.Thread(target=self.run, args=(self.connections, sock), daemon=True).start()
+
+    def run(self, number, sock):
+        with sock:
+            try:
+                self.serve(number, Connection(self, sock))
+            except (OSError, EOFError):
+                pass
+
+    def close(self):
+        self.listener.close()
+
+class Connection:
+    """One accepted connection: reads length-prefixed queries and writes responses."""
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def read_query(self):
+        header = self.file.read(LENGTH.size)
+        if len(header) < LENGTH.size:
+            raise EOFError()
+        query = dns.message.from_wire(self.file.read(LENGTH.unpack(header)[0]))
+        self.server.query_ids.append(query.id)
+        return query
+
+    def send(self, response):
+        wire = response.to_wire()
+        self.sock.sendall(LENGTH.pack(len(wire)) + wire)
+
+def answer(query):
+    """A response naming the qname's first label in a TXT record, so answers can be told apart."""
+    response = dns.message.make_response(query)
+    question = query.question[0]
+    response.answer.append(dns.rrset.from_text(question.name, 300, 'IN', 'TXT', f'"{question.name.labels[0].decode()}"'))
+    return response
+
+def txt(wire):
+    message = dns.message.from_wire(wire)
+    return message.id, message.answer[0][0].strings[0].decode()
+
+def query_wire(name, query_id=0x1234):
+    query = dns.message.make_query(name, 'TXT')
+    query.id = query_id
+    return query.to_wire()
+
+def test_queries_are_pipelined_on_one_connection_with_their_own_ids():
+    count = 10
+
+    def serve(number, connection):
+        # Read every query before answering any, then answer them in reverse order
+        queries = [connection.read_query() for _ in range(count)]
+        for query in reversed(queries):
+            connection.send(answer(query))
+        connection.read_query()
+
+    server = StubTCPServer(serve)
+    pool = TCPPool(max_connections=1, timeout=5)
+    try:
+        # Every caller uses the same message id; the pool gives each one its own on the wire
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            answers = list(executor.map(lambda index: txt(pool.query_wire(query_wire(f"q{index}.example.test"),
+                                                                          '127.0.0.1', server.port)), range(count)))
+        assert answers == [(0x1234, f"q{index}") for index in range(count)]
+        assert len(set(server.query_ids)) == count
+        assert server.connections == 1 and pool.opened == 1
+    finally:
+        pool.close()
+        server.close()
+
+def test_reused_connection_closed_by_the_server_is_retried_once():
+    def serve(number, connection):
+        # Answer one query per connection, then drop the connection on the next one without answering
+        connection.send(answer(connection.read_query()))
+        connection.read_query()
+
+    server = StubTCPServer(serve)
+    pool = TCPPool(timeout=5)
+    try:
+        assert txt(pool.query_wire(query_wire('first.example.test'), '127.0.0.1', server.port)) == (0x1234, 'first')
+        assert txt(pool.query_wire(query_wire('second.example.test'), '127.0.0.1', server.port)) == (0x1234, 'second')
+        assert server.connections == 2 and pool.opened == 2
+    finally:
+        pool.close()
+        server.close()
+
+def test_new_connection_closed_by_the_server_is_not_retried():
+    server = StubTCPServer(lambda number, connection: connection.read_query())
+    pool = TCPPool(timeout=5)
+    try:
+        pool.query_wire(query_wire('dropped.example.test'), '127.0.0.1', server.port)
+    except TCPConnectionError:
+        pass
+    else:
+        raise AssertionError('a dropped query was answered')
+    finally:
+        pool.close()
+        server.close()
+    assert server.connections == 1 and pool.opened == 1
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,253 @@
+import heapq
+import random
+import selectors
+import socket
+import struct
+import time
+import dns.exception
+import dns.message
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
+
+# massdns-style bulk query engine: thousands of queries in flight over a few
+# non-blocking UDP sockets, driven by one selector loop in the calling thread.
+# Queries are encoded straight to wire format and responses are matched to
+# their query by (server, message id, question) from the raw bytes; only
+# matched responses are parsed into dns.message objects. Queries that get no
+# answer are retransmitted from a timer heap until their retries run out, at
+# which point their outcome is a Timeout. With a TCPPool, truncated answers
+# are asked again over pooled, pipelined TCP connections in the background.
+
+DEFAULT_SOCKETS = 4
+DEFAULT_IN_FLIGHT = 10000
+DEFAULT_TIMEOUT = 2.0   # Seconds before a query is retransmitted
+DEFAULT_RETRIES = 2     # Retransmissions before giving up
+RECEIVE_SIZE = 65535
+SOCKET_BUFFER = 4 * 1024 * 1024  # Room for bursts of answers between selector passes
+HEADER = struct.Struct('>HHHHHH')
+RECURSION_DESIRED = 0x0100  # Set like dns.message.make_query does
+TRUNCATED = 0x02            # TC bit in the first flags byte
+
+def encode_question(qname, rdtype):
+    """Wire-format question (lower-cased qname, qtype, class IN) for a query."""
+    if isinstance(qname, str) and qname.isascii() and '\\' not in qname and qname not in ('', '.'):
+        # Plain host names: skip dnspython's name parsing, which costs more than the rest of a query
+        labels = qname.rstrip('.').lower().encode().split(b'.')
+        if all(0 < len(label) < 64 for label in labels):
+            return b''.join(bytes((len(label),)) + label for label in labels) + b'\0' + struct.pack('>HH', rdtype, dns.rdataclass.IN)
+    name = qname if isinstance(qname, dns.name.Name) else dns.name.from_text(qname)
+    return name.canonicalize().to_wire() + struct.pack('>HH', rdtype, dns.rdataclass.IN)
+
+def question_of(wire):
+    """Return a response's question section as wire bytes, with the qname lower-cased."""
+    offset = 12
+    while wire[offset]:
+        offset += 1 + wire[offset]
+    # Length bytes are below 64 and unaffected by lower(); qtype and qclass bytes are not (HTTPS is 0x0041)
+    return wire[12:offset + 1].lower() + wire[offset + 1:offset + 5]
+
+def server_address(server):
+    """Return (address family, address) for a nameserver IP address or host name.
+
+    The address is spelled the way recvfrom() reports the replies, so that
+    e.g. 0:0:0:0:0:0:0:1 matches answers from ::1. Host names are resolved.
+    """
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return family, socket.inet_ntop(family, socket.inet_pton(family, server))
+        except OSError:
+            pass
+    try:
+        family, _, _, _, address = socket.getaddrinfo(server, None, type=socket.SOCK_DGRAM)[0]
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"nameserver {server!r} is not an IP address or a host name that resolves: {e}") from None
+    return family, address[0]
+
+class UDPEngine:
+    """Send many DNS queries at once over a handful of non-blocking UDP sockets."""
+
+    def __init__(self, sockets=DEFAULT_SOCKETS, max_in_flight=DEFAULT_IN_FLIGHT, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, port=53, parse=True, tcp_pool=None):
+        self.socket_count = sockets
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.retries = retries
+        self.port = port
+        # Parsing dominates the per-query cost; bulk callers can take the raw wire and parse what they need
+        self.parse = parse
+        self.tcp_pool = tcp_pool
+        self.servers = {}  # Nameserver as given -> (address family, address), resolved once
+        self.sent = 0
+        self.received = 0
+        self.retransmits = 0
+        self.truncated = 0
+
+    def open_sockets(self, selector):
+        sockets = {}
+        for family in (socket.AF_INET, socket.AF_INET6):
+            sockets[family] = []
+            for _ in range(self.socket_count):
+                try:
+                    sock = socket.socket(family, socket.SOCK_DGRAM)
+                except OSError:
+                    break  # e.g. no IPv6 on this host
+                sock.setblocking(False)
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+                except OSError:
+                    pass
+                sock.bind(('::', 0) if family == socket.AF_INET6 else ('0.0.0.0', 0))
+                selector.register(sock, selectors.EVENT_READ)
+                sockets[family].append(sock)
+        return sockets
+
+    def run(self, queries):
+        """Yield ((server, qname, record type), response or exception) as the queries complete.
+
+        Responses are dns.message.Message objects, or wire-format bytes if the
+        engine was created with parse=False.
+
+        queries is an iterable of (server, qname, record type); it is consumed
+        lazily, so it may be a generator of any length. A server is an IP
+        address or a host name; one that is neither raises ValueError.
+        """
+        pending_queries = iter(queries)
+        exhausted = False
+        in_flight = {}  # (server, id, question) -> [query, wire, socket, attempts, deadline]
+        timers = []     # (deadline, sequence, in-flight key)
+        sequence = 0
+        tcp_pending = {}  # Future of a TCP retry -> query
+        selector = selectors.DefaultSelector()
+        sockets = self.open_sockets(selector)
+        # Finished TCP retries write a byte here so the selector wakes up for them
+        wake_reader, wake_writer = socket.socketpair()
+        wake_reader.setblocking(False)
+        selector.register(wake_reader, selectors.EVENT_READ)
+
+        def wake(future):
+            try:
+                wake_writer.send(b'\0')
+            except OSError:
+                pass
+
+        try:
+            while in_flight or tcp_pending or not exhausted:
+                # Top up the window
+                while not exhausted and len(in_flight) < self.max_in_flight:
+                    query = next(pending_queries, None)
+                    if query is None:
+                        exhausted = True
+                        break
+                    server, qname, record_type = query
+                    if server not in self.servers:
+                        self.servers[server] = server_address(server)
+                    family, address = self.servers[server]
+                    family_sockets = sockets[family]
+                    if not family_sockets:
+                        yield query, dns.exception.DNSException(f"no socket available for {server}")
+                        continue
+                    rdtype = dns.rdatatype.from_text(record_type) if isinstance(record_type, str) else record_type
+                    question = encode_question(qname, rdtype)
+                    while True:
+                        key = ((address, self.port), random.getrandbits(16), question)
+                        if key not in in_flight:
+                            break
+                    wire = HEADER.pack(key[1], RECURSION_DESIRED, 1, 0, 0, 0) + question
+                    sock = family_sockets[key[1] % len(family_sockets)]
+                    entry = [query, wire, sock, 0, 0.0]
+                    in_flight[key] = entry
+                    sequence += 1
+                    self.send(key, entry, timers, sequence)
+
+                if not in_flight and not tcp_pending:
+                    break
+
+                # Wait for answers, finished TCP retries or the next retransmit timer
+                wait = max(0.0, timers[0][0] - time.monotonic()) if timers else None
+                for selector_key, _ in selector.select(wait):
+                    if selector_key.fileobj is wake_reader:
+                        yield from self.collect_tcp(wake_reader, tcp_pending)
+                    else:
+                        yield from self.receive(selector_key.fileobj, in_flight, tcp_pending, wake)
+
+                # Retransmit or give up on expired queries; stale timers belong to answered or resent queries
+                now = time.monotonic()
+                while timers and timers[0][0] <= now:
+                    deadline, _, key = heapq.heappop(timers)
+                    entry = in_flight.get(key)
+                    if entry is None or entry[4] != deadline:
+                        continue
+                    if entry[3] > self.retries:
+                        del in_flight[key]
+                        yield entry[0], dns.exception.Timeout()
+                    else:
+                        self.retransmits += 1
+                        sequence += 1
+                        self.send(key, entry, timers, sequence)
+        finally:
+            selector.close()
+            wake_reader.close()
+            wake_writer.close()
+            for family_sockets in sockets.values():
+                for sock in family_sockets:
+                    sock.close()
+
+    def send(self, key, entry, timers, sequence):
+        query, wire, sock, attempts, _ = entry
+        try:
+            sock.sendto(wire, key[0])
+            self.sent += 1
+        except (BlockingIOError, InterruptedError):
+            pass  # The send buffer is full; the retransmit timer tries again
+        entry[3] = attempts + 1
+        entry[4] = time.monotonic() + self.timeout
+        heapq.heappush(timers, (entry[4], sequence, key))
+
+    def receive(self, sock, in_flight, tcp_pending, wake):
+        while True:
+            try:
+                wire, address = sock.recvfrom(RECEIVE_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                key = (address[:2], int.from_bytes(wire[:2], 'big'), question_of(wire))
+            except IndexError:
+                continue
+            entry = in_flight.pop(key, None)
+            if entry is None:
+                continue  # A duplicate, a late answer to a query that timed out, or spoofed
+            self.received += 1
+            if self.tcp_pool is not None and wire[2] & TRUNCATED:
+                # Ask again over a pooled TCP connection; the answer arrives through collect_tcp()
+                self.truncated += 1
+                future = self.tcp_pool.submit(entry[1], key[0][0], key[0][1], self.timeout * (self.retries + 1))
+                tcp_pending[future] = entry[0]
+                future.add_done_callback(wake)
+                continue
+            yield entry[0], self.outcome(wire)
+
+    def collect_tcp(self, wake_reader, tcp_pending):
+        try:
+            while wake_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        for future in [future for future in tcp_pending if future.done()]:
+            query = tcp_pending.pop(future)
+            try:
+                yield query, self.outcome(future.result())
+            except dns.exception.DNSException as e:
+                yield query, e
+
+    def outcome(self, wire):
+        if not self.parse:
+            return wire
+        try:
+            return dns.message.from_wire(wire)
+        except dns.exception.DNSException as e:
+            return e
+
+    def resolve_all(self, queries):
+        """Run every query and return {(server, qname, record type): response or exception}."""
+        return dict(self.run(queries))
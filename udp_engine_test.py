@@ -0,0 +1,155 @@
+import socket
+import threading
+import dns.exception
+import dns.message
+import dns.rdatatype
+import dns.rrset
+
+# Tests for the bulk UDP engine against small stub servers on loopback that
+# misbehave on purpose. Run with `python udp_engine_test.py` or pytest.
+from udp_engine import UDPEngine
+
+ADDRESS = '192.0.2.7'
+
+class StubServer:
+    """A UDP server on loopback that hands every query to respond(query, attempt) and sends back what it returns.
+
+    attempt counts the queries seen for the same name and type, from 1. respond
+    returns a list of response messages or wire bytes; [] drops the query.
+    """
+
+    def __init__(self, respond, host='127.0.0.1', port=0):
+        self.respond = respond
+        self.attempts = {}
+        self.sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.bind((host, port))
+        except OSError:
+            self.sock.close()
+            raise
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                wire, address = self.sock.recvfrom(65535)
+            except OSError:
+                return  # Closed
+            query = dns.message.from_wire(wire)
+            question = (query.question[0].name, query.question[0].rdtype)
+            self.attempts[question] = self.attempts.get(question, 0) + 1
+            for response in self.respond(query, self.attempts[question]):
+                self.sock.sendto(response if isinstance(response, bytes) else response.to_wire(), address)
+
+    def close(self):
+        self.sock.close()
+
+def answer(query, address=ADDRESS):
+    """A response to query with one record: an A record for A queries, an HTTPS record otherwise."""
+    response = dns.message.make_response(query)
+    question = query.question[0]
+    rdata = address if question.rdtype == dns.rdatatype.A else '1 . alpn="h2"'
+    response.answer.append(dns.rrset.from_text(question.name, 300, 'IN', question.rdtype, rdata))
+    return response
+
+def records(outcome):
+    assert isinstance(outcome, dns.message.Message), outcome
+    return [rdata.to_text() for rrset in outcome.answer for rdata in rrset]
+
+def ipv6_loopback():
+    try:
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sock:
+            sock.bind(('::1', 0))
+        return True
+    except OSError:
+        return False
+
+def test_answers_are_matched_by_id_and_question():
+    def respond(query, attempt):
+        wrong_id = answer(query, '192.0.2.66')
+        wrong_id.id = (query.id + 1) % 65536
+        wrong_question = answer(dns.message.make_query('other.example.test', 'A'), '192.0.2.67')
+        wrong_question.id = query.id
+        # The qname's case may differ in the reply (DNS 0x20); the answer still matches
+        reply = answer(query).to_wire()
+        reply = reply[:12] + reply[12:].replace(b'host', b'HoSt', 1)
+        return [wrong_id, wrong_question, reply]
+
+    server = StubServer(respond)
+    try:
+        engine = UDPEngine(port=server.port, timeout=1.0)
+        names = [f"host{index}.example.test" for index in range(50)]
+        outcomes = engine.resolve_all(('127.0.0.1', name, 'A') for name in names)
+        assert sorted(name for _, name, _ in outcomes) == sorted(names)
+        assert all(records(outcome) == [ADDRESS] for outcome in outcomes.values())
+        assert engine.received == len(names) and engine.retransmits == 0
+    finally:
+        server.close()
+
+def test_unanswered_queries_are_retransmitted_then_time_out():
+    # The first try of every query is dropped; "silent" is never answered
+    server = StubServer(lambda query, attempt: [] if attempt == 1 or query.question[0].name.labels[0] == b'silent'
+                        else [answer(query)])
+    try:
+        engine = UDPEngine(port=server.port, timeout=0.2, retries=2)
+        outcomes = engine.resolve_all([('127.0.0.1', 'host1.example.test', 'A'),
+                                       ('127.0.0.1', 'silent.example.test', 'A')])
+        assert records(outcomes[('127.0.0.1', 'host1.example.test', 'A')]) == [ADDRESS]
+        assert isinstance(outcomes[('127.0.0.1', 'silent.example.test', 'A')], dns.exception.Timeout)
+        # host1 was sent twice; silent once plus two retries
+        assert engine.sent == 5 and engine.retransmits == 3
+    finally:
+        server.close()
+
+def test_https_queries_are_matched():
+    # HTTPS is type 65, the byte of "A", which must not be lower-cased like the qname
+    server = StubServer(lambda query, attempt: [answer(query)])
+    try:
+        engine = UDPEngine(port=server.port, timeout=0.5, retries=0)
+        outcomes = engine.resolve_all([('127.0.0.1', 'Host1.Example.TEST', 'HTTPS'),
+                                       ('127.0.0.1', 'host1.example.test', dns.rdatatype.HTTPS)])
+        assert all(records(outcome) == ['1 . alpn="h2"'] for outcome in outcomes.values())
+    finally:
+        server.close()
+
+def test_mixed_ipv4_and_ipv6_servers():
+    if not ipv6_loopback():
+        return  # Nothing to mix with on a host without IPv6
+    # One engine talks to one port, so the IPv6 stub shares the IPv4 one's
+    ipv4 = StubServer(lambda query, attempt: [answer(query, '192.0.2.4')])
+    ipv6 = StubServer(lambda query, attempt: [answer(query, '192.0.2.6')], host='::1', port=ipv4.port)
+    try:
+        engine = UDPEngine(port=ipv4.port, timeout=0.5, retries=0)
+        # A non-canonical spelling of ::1 still matches the replies, which come from ::1
+        servers = {'127.0.0.1': '192.0.2.4', '::1': '192.0.2.6', '0:0:0:0:0:0:0:1': '192.0.2.6'}
+        queries = [(server, f"host{index}.example.test", 'A') for index in range(20) for server in servers]
+        outcomes = engine.resolve_all(queries)
+        assert len(outcomes) == len(queries)
+        assert all(records(outcome) == [servers[server]] for (server, _, _), outcome in outcomes.items())
+    finally:
+        ipv4.close()
+        ipv6.close()
+
+def test_host_name_servers_are_resolved_and_bad_ones_rejected():
+    server = StubServer(lambda query, attempt: [answer(query)])
+    try:
+        engine = UDPEngine(port=server.port, timeout=0.5, retries=0)
+        localhost = socket.getaddrinfo('localhost', None, type=socket.SOCK_DGRAM)[0][4][0]
+        if localhost == '127.0.0.1':
+            assert records(engine.resolve_all([('localhost', 'host1.example.test', 'A')])[
+                ('localhost', 'host1.example.test', 'A')]) == [ADDRESS]
+        try:
+            engine.resolve_all([('no-such-nameserver.invalid', 'host1.example.test', 'A')])
+        except ValueError as e:
+            assert 'no-such-nameserver.invalid' in str(e)
+        else:
+            raise AssertionError('an unresolvable nameserver was accepted')
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")